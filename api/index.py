@@ -1,50 +1,50 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
-import pandas as pd
+from flask import Flask, Request, Response, request, jsonify, send_file, stream_with_context
 import os
 import tempfile
-import gc
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.comments import Comment
+import time
 from werkzeug.utils import secure_filename
 import json
+import sys
+from pathlib import Path
+
+# Make the shared core package importable when deployed from the api/ folder
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from core.cache import file_digest
+from core.jobs import DEFAULT_QUEUE_DEPTH, DONE, FAILED, JobManager, QueueFullError
+from core.pipeline import CostSource, Pipeline, PipelineOptions, default_output_path
+from core.progress import ProgressChannel, read_progress
+from core.result_cache import ResultCache, place, result_key
+from core.spool import SpoolFile
+from core.writer import FILL_MODES, LAYOUT_MODES, remove_files
+
+
+class SpoolingRequest(Request):
+    """Request whose file uploads stream into spool_dir (when set) as hashing core.spool.SpoolFiles"""
+    spool_dir = None
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.spool_dir is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return SpoolFile(self.spool_dir)
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
-
-# Header mapping as per requirements
-HEADER_MAP = {
-    'Brand': 'Brand',
-    'Parent ASIN': 'Parent',
-    'ASIN': 'ASIN',
-    'Product Codes: UPC': 'UPC',
-    'Product Codes: EAN': 'EAN',
-    'Product Codes: GTIN': 'GTIN',
-    'Imported by Code': 'Imported by Code',
-    'Title': 'Title',
-    'Color': 'Color',
-    'Size': 'Size',
-    'Bought in past month': 'Sales Badge',
-    'Reviews: Rating Count': 'Rating Count',
-    'Reviews: Review Count - Format Specific': 'Rating - Child',
-    'Sales Rank: Current': 'Sales Rank',
-    'Sales Rank: 30 days avg.': 'Sales Rank 30',
-    'Sales Rank: 90 days avg.': 'Sales Rank 90',
-    'Sales Rank: 180 days avg.': 'Sales Rank 180',
-    'Buy Box 🚚: Current': 'Buy Box',
-    'Buy Box 🚚: 30 days avg.': 'Buy Box 30',
-    'Buy Box 🚚: 90 days avg.': 'Buy Box 90',
-    'Buy Box 🚚: 180 days avg.': 'Buy Box 180',
-    'Amazon: 90 days OOS': 'AMZ In Stock %',
-    'Buy Box: % Amazon 90 days': 'Buy Box: % Amazon 90 days',
-    'Amazon: Availability of the Amazon offer': 'Amazon Availability',
-    'Count of retrieved live offers: New, FBA': 'FBA',
-    'Count of retrieved live offers: New, FBM': 'FBM',
-    'FBA Pick&Pack Fee': 'Pick & Pack',
-    'Referral Fee %': 'Referral Fee &',
-}
+# Cost indexes are reused across requests; /tmp is the writable location on Vercel
+app.config['CACHE_FOLDER'] = os.environ.get('SCOUT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'scout_cache')
+# Background jobs: one scratch folder per job, a bounded worker pool and queue
+app.config['JOB_FOLDER'] = os.environ.get('SCOUT_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'scout_jobs')
+app.config['JOB_WORKERS'] = int(os.environ.get('SCOUT_JOB_WORKERS', 0)) or None
+app.config['JOB_QUEUE_DEPTH'] = int(os.environ.get('SCOUT_JOB_QUEUE_DEPTH', DEFAULT_QUEUE_DEPTH))
+job_manager = None
+result_cache = None
+# Progress streams check the job this often, and send a comment when idle so proxies keep them open
+EVENT_POLL_SECONDS = 0.25
+EVENT_KEEPALIVE_SECONDS = 15
 
 # HTML Template
 HTML_TEMPLATE = """
@@ -158,7 +158,8 @@ HTML_TEMPLATE = """
             margin-bottom: 8px;
         }
         
-        .setting-group input {
+        .setting-group input,
+        .setting-group select {
             padding: 12px;
             border: 2px solid #e2e8f0;
             border-radius: 8px;
@@ -166,7 +167,8 @@ HTML_TEMPLATE = """
             transition: border-color 0.2s;
         }
         
-        .setting-group input:focus {
+        .setting-group input:focus,
+        .setting-group select:focus {
             outline: none;
             border-color: #667eea;
         }
@@ -230,6 +232,22 @@ HTML_TEMPLATE = """
             margin-top: 10px;
         }
         
+        .cancel-btn {
+            display: block;
+            margin: 15px auto 0;
+            padding: 8px 24px;
+            background: white;
+            color: #c33;
+            border: 1px solid #c33;
+            border-radius: 8px;
+            cursor: pointer;
+        }
+        
+        .cancel-btn:disabled {
+            opacity: 0.6;
+            cursor: not-allowed;
+        }
+        
         .download-section {
             margin-top: 30px;
             text-align: center;
@@ -305,6 +323,27 @@ HTML_TEMPLATE = """
                     <label for="chunkSize">Chunk Size</label>
                     <input type="number" id="chunkSize" name="chunk_size" value="1000" placeholder="1000">
                 </div>
+                <div class="setting-group">
+                    <label for="fillMode">Color Formatting</label>
+                    <select id="fillMode" name="fill_mode">
+                        <option value="cells" selected>Per cell</option>
+                        <option value="rules">Conditional rules (faster for large files)</option>
+                    </select>
+                </div>
+                <div class="setting-group">
+                    <label for="layout">Row Heights &amp; Cell Styles</label>
+                    <select id="layout" name="layout">
+                        <option value="cells" selected>Per row and cell</option>
+                        <option value="sheet">Sheet and column defaults (smaller files)</option>
+                    </select>
+                </div>
+                <div class="setting-group">
+                    <label for="compact">Column Types</label>
+                    <select id="compact" name="compact">
+                        <option value="0" selected>As loaded</option>
+                        <option value="1">Compact (less memory for large files)</option>
+                    </select>
+                </div>
             </div>
             
             <button type="submit" class="process-btn" id="processBtn">Process Excel File</button>
@@ -315,6 +354,7 @@ HTML_TEMPLATE = """
                 <div class="progress-fill" id="progressFill">0%</div>
             </div>
             <div class="progress-text" id="progressText">Processing...</div>
+            <button type="button" class="cancel-btn" id="cancelBtn">Cancel</button>
         </div>
         
         <div class="download-section" id="downloadSection">
@@ -338,6 +378,8 @@ HTML_TEMPLATE = """
         const downloadSection = document.getElementById('downloadSection');
         const downloadBtn = document.getElementById('downloadBtn');
         const errorMessage = document.getElementById('errorMessage');
+        const cancelBtn = document.getElementById('cancelBtn');
+        let cancelUrl = null;
         
         // Drag and drop handlers
         uploadSection.addEventListener('dragover', (e) => {
@@ -371,6 +413,68 @@ HTML_TEMPLATE = """
             }
         }
         
+        function setProgress(fraction, text) {
+            const percent = Math.round(fraction * 100);
+            progressFill.style.width = `${percent}%`;
+            progressFill.textContent = `${percent}%`;
+            progressText.textContent = text;
+        }
+        
+        function describeProgress(progress) {
+            const parts = [progress.message];
+            if (progress.rows_per_second) {
+                parts.push(`${Math.round(progress.rows_per_second).toLocaleString()} rows/s`);
+            }
+            if (progress.eta_seconds !== null && progress.eta_seconds !== undefined) {
+                parts.push(`ETA ${Math.round(progress.eta_seconds)}s`);
+            }
+            return parts.join(' - ');
+        }
+        
+        // Follow the job over one Server-Sent Events stream until it finishes
+        function waitForJob(eventsUrl) {
+            return new Promise((resolve, reject) => {
+                const source = new EventSource(eventsUrl);
+                source.addEventListener('progress', (e) => {
+                    const progress = JSON.parse(e.data);
+                    setProgress(progress.fraction, describeProgress(progress));
+                });
+                source.addEventListener('status', (e) => {
+                    const job = JSON.parse(e.data);
+                    if (job.status === 'queued') {
+                        progressText.textContent = 'Queued...';
+                        return;
+                    }
+                    if (job.status === 'running') {
+                        return;
+                    }
+                    source.close();
+                    if (job.status === 'done') {
+                        resolve(job);
+                    } else if (job.status === 'cancelled') {
+                        reject(new Error('Processing was cancelled'));
+                    } else {
+                        reject(new Error(job.error || 'Processing failed'));
+                    }
+                });
+                source.onerror = () => {
+                    // The browser reconnects on its own unless the stream was refused
+                    if (source.readyState === EventSource.CLOSED) {
+                        reject(new Error('Lost the connection to the server'));
+                    }
+                };
+            });
+        }
+        
+        cancelBtn.addEventListener('click', async () => {
+            if (!cancelUrl) {
+                return;
+            }
+            cancelBtn.disabled = true;
+            progressText.textContent = 'Cancelling...';
+            await fetch(cancelUrl, { method: 'POST' });
+        });
+        
         uploadForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             
@@ -380,6 +484,7 @@ HTML_TEMPLATE = """
             processBtn.disabled = true;
             processBtn.textContent = 'Processing...';
             progressSection.classList.add('active');
+            setProgress(0, 'Uploading...');
             downloadSection.classList.remove('active');
             errorMessage.classList.remove('active');
             
@@ -396,21 +501,27 @@ HTML_TEMPLATE = """
                 
                 const result = await response.json();
                 
-                if (result.success) {
-                    progressFill.style.width = '100%';
-                    progressFill.textContent = '100%';
-                    progressText.textContent = 'Processing complete!';
-                    
-                    downloadBtn.href = result.download_url;
-                    downloadSection.classList.add('active');
-                } else {
+                if (!result.success) {
                     throw new Error(result.error || 'Processing failed');
                 }
+                
+                // The file is processed in the background; follow its progress until it finishes
+                cancelUrl = result.cancel_url;
+                cancelBtn.disabled = false;
+                progressText.textContent = 'Queued...';
+                const job = await waitForJob(result.events_url);
+                
+                setProgress(1, 'Processing complete!');
+                
+                downloadBtn.href = job.download_url;
+                downloadSection.classList.add('active');
             } catch (error) {
                 errorMessage.textContent = error.message;
                 errorMessage.classList.add('active');
                 progressSection.classList.remove('active');
             } finally {
+                cancelUrl = null;
+                cancelBtn.disabled = true;
                 processBtn.disabled = false;
                 processBtn.textContent = 'Process Excel File';
             }
@@ -424,639 +535,220 @@ HTML_TEMPLATE = """
 def index():
     return HTML_TEMPLATE
 
+def keep_upload(upload, path):
+    """Move an uploaded file to path; returns its SHA-256"""
+    if isinstance(upload.stream, SpoolFile):
+        return upload.stream.keep(path)
+    upload.save(path)
+    return file_digest(path)
+
+def get_result_cache():
+    """The app's ResultCache (its hit/miss counters cover this server process)"""
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache(app.config['CACHE_FOLDER'])
+    return result_cache
+
+def web_options(shipping_cost, misc_cost, chunk_size, fill_mode='cells', layout='cells', compact=False):
+    """PipelineOptions for a web request; also what its result is cached under"""
+    return PipelineOptions(
+        profile='web',
+        shipping_cost=shipping_cost,
+        misc_cost=misc_cost,
+        chunk_size=chunk_size,
+        fill_mode=fill_mode,
+        layout=layout,
+        compact=compact,
+        cache_dir=app.config['CACHE_FOLDER'],
+        parse_cache=True,
+    )
+
+def get_job_manager():
+    """The app's JobManager, created on first use so worker processes don't start at import"""
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager(
+            app.config['JOB_FOLDER'],
+            max_workers=app.config['JOB_WORKERS'],
+            max_queued=app.config['JOB_QUEUE_DEPTH'],
+        )
+    return job_manager
+
 @app.route('/api/process', methods=['POST'])
 def process_file():
     try:
-        # Get uploaded files
-        main_file = request.files.get('main_file')
-        cost_file = request.files.get('cost_file')
-        
-        if not main_file:
-            return jsonify({'success': False, 'error': 'No main file uploaded'}), 400
-        
-        # Get settings
-        shipping_cost = float(request.form.get('shipping_cost', 0) or 0)
-        misc_cost = float(request.form.get('misc_cost', 0) or 0)
-        chunk_size = int(request.form.get('chunk_size', 1000) or 1000)
-        
-        # Save uploaded files temporarily
-        main_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(main_file.filename))
-        main_file.save(main_path)
-        
-        cost_path = None
-        if cost_file and cost_file.filename:
-            cost_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(cost_file.filename))
-            cost_file.save(cost_path)
-        
-        # Process the Excel file
-        output_path = process_excel_file(main_path, cost_path, shipping_cost, misc_cost, chunk_size)
+        manager = get_job_manager()
+        try:
+            # Take a queue slot before the body is read, so a full queue costs no upload
+            job = manager.create_job()
+        except QueueFullError as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
         
-        # Generate download URL
-        filename = os.path.basename(output_path)
-        download_url = f'/api/download/{filename}'
+        try:
+            # Uploads are streamed straight into the job's scratch directory and hashed on the way
+            request.spool_dir = job.directory
+            main_file = request.files.get('main_file')
+            cost_file = request.files.get('cost_file')
+            
+            # Get settings
+            shipping_cost = float(request.form.get('shipping_cost', 0) or 0)
+            misc_cost = float(request.form.get('misc_cost', 0) or 0)
+            chunk_size = int(request.form.get('chunk_size', 1000) or 1000)
+            fill_mode = request.form.get('fill_mode', 'cells')
+            layout = request.form.get('layout', 'cells')
+            compact = request.form.get('compact', '0') in ('1', 'true', 'on')
+            
+            error = None
+            if not main_file:
+                error = 'No main file uploaded'
+            elif fill_mode not in FILL_MODES:
+                error = f'Unknown fill mode: {fill_mode}'
+            elif layout not in LAYOUT_MODES:
+                error = f'Unknown layout: {layout}'
+            if error:
+                manager.discard(job)
+                return jsonify({'success': False, 'error': error}), 400
+            
+            # Uploads and output live in the job's own scratch directory
+            main_path = os.path.join(job.directory, secure_filename(main_file.filename) or 'main.xlsx')
+            main_digest = keep_upload(main_file, main_path)
+            
+            cost_path = cost_digest = None
+            if cost_file and cost_file.filename:
+                cost_path = os.path.join(job.directory, 'cost_' + (secure_filename(cost_file.filename) or 'file.xlsx'))
+                cost_digest = keep_upload(cost_file, cost_path)
+            
+            # Same files and settings as an earlier run: hand out its output instead of running again
+            key = result_key(main_digest, cost_digest,
+                             web_options(shipping_cost, misc_cost, chunk_size, fill_mode, layout, compact))
+            cached = get_result_cache().lookup(key)
+            if cached is not None:
+                output_path = os.path.splitext(default_output_path(main_path, job.directory))[0]
+                manager.complete(job, place(cached, output_path + os.path.splitext(cached)[1]))
+                # Nothing reads the uploads of a cached run; keep only its output
+                remove_files(path for path in (main_path, cost_path) if path)
+            else:
+                # Process the Excel file in the background
+                manager.submit(job, process_excel_file, main_path, cost_path, shipping_cost, misc_cost, chunk_size,
+                               fill_mode, job.directory, layout, compact, job.cancel_token, job.progress_path,
+                               main_digest=main_digest, cost_digest=cost_digest, cache_key=key)
+        except Exception:
+            manager.discard(job)
+            raise
         
         return jsonify({
             'success': True,
-            'download_url': download_url,
-            'filename': filename
-        })
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}',
+            'result_url': f'/api/jobs/{job.id}/result',
+            'cancel_url': f'/api/jobs/{job.id}/cancel',
+            'events_url': f'/api/jobs/{job.id}/events'
+        }), 202
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/download/<filename>')
-def download_file(filename):
-    try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
-        
-        return send_file(file_path, as_attachment=True, download_name=filename)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-def process_excel_file(main_path, cost_path, shipping_cost, misc_cost, chunk_size):
-    """Process Excel file with the same logic as desktop app"""
-    # Read main file
-    df = pd.read_excel(main_path, engine='openpyxl')
-    
-    # Delete Locale and Image columns if they exist
-    columns_to_delete = ['Locale', 'Image']
-    for col in columns_to_delete:
-        if col in df.columns:
-            df.drop(columns=[col], inplace=True)
-    
-    # Rename columns
-    df.rename(columns=HEADER_MAP, inplace=True)
-    
-    # Handle Pack Fee
-    if 'Pick & Pack' in df.columns:
-        empty_mask = df['Pick & Pack'].isna() | (df['Pick & Pack'] == '') | (df['Pick & Pack'].astype(str) == '0')
-        df['Pick & Pack'] = pd.to_numeric(df['Pick & Pack'], errors='coerce')
-        df['Pick & Pack'] = df['Pick & Pack'].fillna(7.0).round(2)
-        df.loc[empty_mask, 'Pick & Pack'] = '7.00*ASSUMPTION*'
-    
-    # Clean UPC, EAN, GTIN columns
-    for col in ['UPC', 'EAN', 'GTIN', 'Imported by Code']:
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-            df[col] = df[col].replace(['nan', 'NaN', 'None'], '')
-            df[col] = df[col].str.replace(r'\.0$', '', regex=True)
-    
-    # Merge Cost/MSRP if second file is uploaded
-    if cost_path:
-        df2 = pd.read_excel(cost_path, engine='openpyxl')
-        df2.columns = [str(col).strip() for col in df2.columns]
-        
-        # Find matching columns
-        imported_code_col2 = None
-        cost_col2 = None
-        msrp_col2 = None
-        
-        for col in df2.columns:
-            col_upper = col.upper()
-            if 'IMPORTED BY CODE' in col_upper or ('IMPORTED' in col_upper and 'CODE' in col_upper):
-                imported_code_col2 = col
-            elif 'UPC' in col_upper and imported_code_col2 is None:
-                imported_code_col2 = col
-            if 'COST' in col_upper and cost_col2 is None:
-                cost_col2 = col
-            if 'MSRP' in col_upper and msrp_col2 is None:
-                msrp_col2 = col
-        
-        if imported_code_col2 and (cost_col2 or msrp_col2):
-            merge_cols = [imported_code_col2]
-            if cost_col2:
-                merge_cols.append(cost_col2)
-            if msrp_col2:
-                merge_cols.append(msrp_col2)
-            
-            df2 = df2[merge_cols]
-            df2.rename(columns={imported_code_col2: 'Imported by Code'}, inplace=True)
-            
-            # Normalize codes for matching
-            def normalize_code(code):
-                if pd.isna(code) or code == '':
-                    return None
-                code_str = str(code).strip()
-                if code_str.endswith('.0'):
-                    code_str = code_str[:-2]
-                if not code_str or code_str.lower() in ['nan', 'none', '']:
-                    return None
-                if code_str.replace('-', '').replace(' ', '').replace('_', '').isdigit():
-                    code_str = code_str.replace('-', '').replace(' ', '').replace('_', '')
-                    if len(code_str) < 12 and len(code_str) >= 8:
-                        code_str = code_str.zfill(12)
-                return code_str
-            
-            df2['merge_code'] = df2['Imported by Code'].apply(normalize_code)
-            
-            # Determine main file code column
-            main_code_col = None
-            if 'Imported by Code' in df.columns:
-                main_code_col = 'Imported by Code'
-            elif 'UPC' in df.columns:
-                main_code_col = 'UPC'
-            elif 'EAN' in df.columns:
-                main_code_col = 'EAN'
-            elif 'GTIN' in df.columns:
-                main_code_col = 'GTIN'
-            
-            if main_code_col:
-                df['merge_code'] = df[main_code_col].apply(normalize_code)
-                df2_merge = df2[df2['merge_code'].notna()].copy()
-                
-                df = pd.merge(df, df2_merge, left_on='merge_code', right_on='merge_code', how='left', suffixes=('', '_cost'))
-                
-                if cost_col2 and cost_col2 in df.columns:
-                    df.rename(columns={cost_col2: 'COST'}, inplace=True)
-                if msrp_col2 and msrp_col2 in df.columns:
-                    df.rename(columns={msrp_col2: 'MSRP'}, inplace=True)
-                
-                df.drop(columns=['merge_code'], errors='ignore', inplace=True)
-                cost_suffix_cols = [col for col in df.columns if col.endswith('_cost')]
-                if cost_suffix_cols:
-                    df.drop(columns=cost_suffix_cols, errors='ignore', inplace=True)
-            
-            # Ensure COST and MSRP are numeric
-            cost_col_name = 'COST' if 'COST' in df.columns else 'Cost'
-            if cost_col_name in df.columns:
-                df[cost_col_name] = pd.to_numeric(df[cost_col_name], errors='coerce')
-                df[cost_col_name] = df[cost_col_name].apply(lambda x: x if pd.notna(x) and x > 0 else 0)
-            
-            if 'MSRP' in df.columns:
-                df['MSRP'] = pd.to_numeric(df['MSRP'], errors='coerce')
-                df['MSRP'] = df['MSRP'].apply(lambda x: x if pd.notna(x) and x > 0 else None)
-    
-    # Remove unnamed columns
-    df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
-    
-    # Add shipping and misc costs
-    cost_col_name = 'COST' if 'COST' in df.columns else 'Cost'
-    if cost_col_name in df.columns:
-        df[cost_col_name] = pd.to_numeric(df[cost_col_name], errors='coerce').fillna(0) + shipping_cost + misc_cost
-    
-    # Calculate metrics
-    # Handle Referral Fee
-    if 'Referral Fee &' in df.columns:
-        empty_mask = df['Referral Fee &'].isna() | (df['Referral Fee &'] == '') | (df['Referral Fee &'].astype(str) == '0')
-        df['Referral Fee &'] = pd.to_numeric(df['Referral Fee &'], errors='coerce')
-        df['Referral Fee &'] = df['Referral Fee &'].fillna(0.15).round(2)
-        df.loc[empty_mask, 'Referral Fee &'] = '0.15*ASSUMPTION*'
-    
-    # Calculate Total Parent Ratings and Total Color Ratings
-    if 'Parent' in df.columns and 'Rating Count' in df.columns:
-        df['Parent'] = df['Parent'].astype(str)
-        df['Rating Count'] = pd.to_numeric(df['Rating Count'], errors='coerce').fillna(0).astype(int)
-        parent_ratings_sum = df.groupby('Parent', observed=True)['Rating Count'].transform('sum')
-        df['Total Parent Ratings'] = parent_ratings_sum
-        gc.collect()
-    
-    if 'Parent' in df.columns and 'Color' in df.columns and 'Rating Count' in df.columns:
-        df['Color'] = df['Color'].astype(str)
-        color_ratings_sum = df.groupby(['Parent', 'Color'], observed=True)['Rating Count'].transform('sum')
-        df['Total Color Ratings'] = color_ratings_sum
-        gc.collect()
-    
-    # Calculate Total Ratings Color
-    if 'Parent' in df.columns and 'Color' in df.columns and 'Rating - Child' in df.columns:
-        df['Rating - Child'] = pd.to_numeric(df['Rating - Child'], errors='coerce').fillna(0)
-        total_ratings_by_color = df.groupby(['Parent', 'Color'], observed=True)['Rating - Child'].sum().reset_index()
-        total_ratings_by_color.rename(columns={'Rating - Child': 'Total Ratings Color'}, inplace=True)
-        df = pd.merge(df, total_ratings_by_color, on=['Parent', 'Color'], how='left', suffixes=('', '_sum'))
-        df['Total Ratings Color'] = df['Total Ratings Color'].fillna(0)
-    
-    # Keep AMZ In Stock % and Buy Box: % Amazon 90 days in original format
-    if 'AMZ In Stock %' in df.columns:
-        df['AMZ In Stock %'] = df['AMZ In Stock %'].astype(str)
-        df['AMZ In Stock %'] = df['AMZ In Stock %'].replace(['nan', 'NaN', 'None'], '')
-    
-    if 'Buy Box: % Amazon 90 days' in df.columns:
-        df['Buy Box: % Amazon 90 days'] = df['Buy Box: % Amazon 90 days'].astype(str)
-        df['Buy Box: % Amazon 90 days'] = df['Buy Box: % Amazon 90 days'].replace(['nan', 'NaN', 'None'], '')
-    
-    # Add calculated columns
-    df['Profit'] = df.apply(calc_profit, axis=1)
-    df['ROI'] = df.apply(calc_roi, axis=1)
-    df['Profit Margin (Buybox)'] = df.apply(calc_profit_margin_buybox, axis=1)
-    df['Profit Margin (MSRP)'] = df.apply(calc_profit_margin_msrp, axis=1)
-    df['MSRP Difference'] = df.apply(msrp_diff, axis=1)
-    
-    # Sort data
-    sort_cols = [col for col in ['Parent', 'Color', 'Size'] if col in df.columns]
-    if sort_cols:
-        for col in sort_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str)
-        df.sort_values(by=sort_cols, inplace=True)
-    
-    # Save to Excel
-    base_name = os.path.splitext(os.path.basename(main_path))[0]
-    output_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{base_name}_formatted.xlsx')
-    df.to_excel(output_path, index=False, engine='openpyxl')
-    
-    # Apply formatting
-    apply_excel_formatting(output_path, chunk_size)
-    
-    return output_path
+def job_payload(job):
+    """Status dict of a job, with its download link once it is done"""
+    status = job.to_dict()
+    if job.status == DONE:
+        status['filename'] = os.path.basename(job.result)
+        status['download_url'] = f'/api/jobs/{job.id}/result'
+    return status
 
-def clean_price(val):
-    """Clean price values - handle strings, floats, and edge cases"""
-    if val is None or val == '' or val == 0:
-        return None
-    
-    if isinstance(val, str):
-        val = val.replace('$', '').replace(',', '').strip()
-        if val == '' or val == '0':
-            return None
-    
-    try:
-        cleaned_val = float(val)
-        return cleaned_val if cleaned_val > 0 else None
-    except (ValueError, TypeError):
-        return None
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-def msrp_diff(row):
-    """Calculate MSRP Difference as a number: Buy Box - MSRP"""
-    msrp = clean_price(row.get('MSRP', None))
-    buybox = clean_price(row.get('Buy Box', None))
-    buybox_30 = clean_price(row.get('Buy Box 30', None))
-    buybox_90 = clean_price(row.get('Buy Box 90', None))
-    buybox_180 = clean_price(row.get('Buy Box 180', None))
-    buybox_val = None
-    for val in [buybox, buybox_30, buybox_90, buybox_180]:
-        if val is not None and val > 0:
-            buybox_val = val
-            break
-    if msrp is not None and msrp > 0 and buybox_val is not None and buybox_val > 0:
-        return buybox_val - msrp
-    elif msrp is not None and msrp > 0 and buybox_val is None:
-        return 'No Buybox'
-    else:
-        return ''
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_payload(job))
 
-def calc_profit(row):
-    cost = 0
-    try:
-        cost = float(row.get('COST', 0))
-    except (ValueError, TypeError):
-        cost = 0
-    
-    pack_fee = 7.0
-    try:
-        pack_fee_val = row.get('Pick & Pack')
-        if pd.notna(pack_fee_val) and pack_fee_val != '':
-            if isinstance(pack_fee_val, str) and '*ASSUMPTION*' in pack_fee_val:
-                pack_fee = 7.0
-            else:
-                pack_fee = float(pack_fee_val)
-    except (ValueError, TypeError):
-        pass
-    
-    cost += pack_fee
-    
-    referral_fee_pct = 0.15
-    try:
-        ref_fee = row.get('Referral Fee &')
-        if pd.notna(ref_fee) and str(ref_fee).strip() != '':
-            if isinstance(ref_fee, str) and '*ASSUMPTION*' in ref_fee:
-                referral_fee_pct = 0.15
-            else:
-                ref_fee = str(ref_fee).replace('%', '').strip()
-                if float(ref_fee) > 1:
-                    referral_fee_pct = float(ref_fee) / 100
-                else:
-                    referral_fee_pct = float(ref_fee)
-    except (ValueError, TypeError, AttributeError):
-        pass
-    
-    for col in ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180', 'MSRP']:
-        val = clean_price(row.get(col, None))
-        if val is not None and val > 0:
-            revenue = val * (1 - referral_fee_pct)
-            return round(revenue - cost, 2)
-    return -cost if cost else ''
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent Events for one job: 'status' whenever its status changes and
+    'progress' (stage, fraction, message, rows done/total, rows/sec, ETA) as
+    the worker publishes it. The stream ends after the final status.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def stream():
+        status = seq = None
+        last_sent = time.monotonic()
+        while True:
+            finished = job.finished
+            progress = read_progress(job.progress_path)
+            if progress is not None and progress['seq'] != seq:
+                seq = progress['seq']
+                last_sent = time.monotonic()
+                yield sse_message('progress', progress)
+            if job.status != status:
+                status = job.status
+                last_sent = time.monotonic()
+                yield sse_message('status', job_payload(job))
+            if finished:
+                return
+            if time.monotonic() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+            time.sleep(EVENT_POLL_SECONDS)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers=headers)
 
-def calc_roi(row):
-    """Calculate Return on Investment (ROI) as a percentage"""
-    profit = row.get('Profit', 0)
-    if isinstance(profit, str):
-        return ''
-    cost = 0
-    try:
-        cost = float(row.get('COST', 0))
-    except (ValueError, TypeError):
-        cost = 0
-    if cost > 0 and isinstance(profit, (int, float)):
-        roi = (profit / cost) * 100
-        return roi if roi != float('inf') else ''
-    return ''
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not manager.cancel(job):
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    # A running job reports 'cancelled' once it reaches its next check
+    return jsonify(job.to_dict()), 202
 
-def calc_profit_margin_buybox(row):
-    """Calculate Profit Margin as a percentage based on Buy Box"""
-    buybox_val = None
-    for col in ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180']:
-        try:
-            val = clean_price(row.get(col, None))
-            if val is not None and val > 0:
-                buybox_val = val
-                break
-        except (ValueError, TypeError):
-            continue
-    
-    if buybox_val is None:
-        return 'No Buybox'
-    
-    referral_fee_pct = 0.15
-    try:
-        ref_fee = row.get('Referral Fee &')
-        if pd.notna(ref_fee) and str(ref_fee).strip() != '':
-            if isinstance(ref_fee, str) and '*ASSUMPTION*' in ref_fee:
-                referral_fee_pct = 0.15
-            else:
-                ref_fee = str(ref_fee).replace('%', '').strip()
-                if float(ref_fee) > 1:
-                    referral_fee_pct = float(ref_fee) / 100
-                else:
-                    referral_fee_pct = float(ref_fee)
-    except (ValueError, TypeError, AttributeError):
-        pass
-    
-    revenue = buybox_val * (1 - referral_fee_pct)
-    
-    cost = 0
-    try:
-        cost = float(row.get('COST', 0))
-    except (ValueError, TypeError):
-        cost = 0
-    
-    pack_fee = 7.0
-    try:
-        pack_fee_val = row.get('Pick & Pack')
-        if pd.notna(pack_fee_val) and pack_fee_val != '':
-            if isinstance(pack_fee_val, str) and '*ASSUMPTION*' in pack_fee_val:
-                pack_fee = 7.0
-            else:
-                pack_fee = float(pack_fee_val)
-    except (ValueError, TypeError):
-        pass
-    
-    total_cost = cost + pack_fee
-    
-    if buybox_val > 0:
-        profit = revenue - total_cost
-        margin = (profit / buybox_val) * 100
-        return round(margin, 2) if margin != float('inf') else ''
-    return ''
+@app.route('/api/result-cache')
+def result_cache_stats():
+    return jsonify(get_result_cache().stats())
 
-def calc_profit_margin_msrp(row):
-    """Calculate Profit Margin as a percentage based on MSRP"""
-    msrp = clean_price(row.get('MSRP', None))
-    if msrp is None or msrp <= 0:
-        return ''
-    
-    referral_fee_pct = 0.15
-    try:
-        ref_fee = row.get('Referral Fee &')
-        if pd.notna(ref_fee) and str(ref_fee).strip() != '':
-            if isinstance(ref_fee, str) and '*ASSUMPTION*' in ref_fee:
-                referral_fee_pct = 0.15
-            else:
-                ref_fee = str(ref_fee).replace('%', '').strip()
-                if float(ref_fee) > 1:
-                    referral_fee_pct = float(ref_fee) / 100
-                else:
-                    referral_fee_pct = float(ref_fee)
-    except (ValueError, TypeError, AttributeError):
-        pass
-    
-    revenue = msrp * (1 - referral_fee_pct)
-    
-    cost = 0
-    try:
-        cost = float(row.get('COST', 0))
-    except (ValueError, TypeError):
-        cost = 0
-    
-    pack_fee = 7.0
-    try:
-        pack_fee_val = row.get('Pick & Pack')
-        if pd.notna(pack_fee_val) and pack_fee_val != '':
-            if isinstance(pack_fee_val, str) and '*ASSUMPTION*' in pack_fee_val:
-                pack_fee = 7.0
-            else:
-                pack_fee = float(pack_fee_val)
-    except (ValueError, TypeError):
-        pass
-    
-    total_cost = cost + pack_fee
-    
-    if msrp > 0:
-        profit = revenue - total_cost
-        margin = (profit / msrp) * 100
-        return round(margin, 2) if margin != float('inf') else ''
-    return ''
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == FAILED:
+        return jsonify({'error': job.error}), 500
+    if job.status != DONE:
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    
+    output_path = job.result
+    if not os.path.exists(output_path):
+        return jsonify({'error': 'File not found'}), 404
+    return send_file(output_path, as_attachment=True, download_name=os.path.basename(output_path))
 
-def apply_excel_formatting(file_path, chunk_size):
-    """Apply Excel formatting with conditional formatting"""
-    wb = load_workbook(file_path)
-    ws = wb.active
-    ws.freeze_panes = 'A2'
-    ws.row_dimensions[1].height = 55
-    
-    total_rows = ws.max_row
-    format_chunk = max(500, min(5000, chunk_size))
-    
-    # Set row heights
-    for row_num in range(2, total_rows + 1):
-        ws.row_dimensions[row_num].height = 50
-    
-    # Get header map
-    header_map = {cell.value: idx+1 for idx, cell in enumerate(ws[1])}
-    
-    # Alignment
-    alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.alignment = alignment
-    
-    # Number formatting - Sales Rank columns
-    sales_rank_cols = [
-        header_map.get('Sales Rank'),
-        header_map.get('Sales Rank 30'),
-        header_map.get('Sales Rank 90'),
-        header_map.get('Sales Rank 180')
-    ]
-    for col in sales_rank_cols:
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    c.number_format = '#,##0'
-    
-    # UPC as text
-    upc_col = header_map.get('UPC')
-    if upc_col:
-        for cell in ws.iter_cols(min_col=upc_col, max_col=upc_col, min_row=2):
-            for c in cell:
-                c.number_format = '@'
-    
-    # Total Parent/Color Ratings as integers
-    for col_name in ['Total Parent Ratings', 'Total Color Ratings']:
-        col = header_map.get(col_name)
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    c.number_format = '#,##0'
-    
-    # Currency formatting
-    currency_cols = [
-        header_map.get('Buy Box'),
-        header_map.get('Buy Box 30'),
-        header_map.get('Buy Box 90'),
-        header_map.get('Buy Box 180'),
-        header_map.get('Pick & Pack'),
-        header_map.get('Profit'),
-        header_map.get('COST'),
-        header_map.get('MSRP')
-    ]
-    for col in currency_cols:
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    c.number_format = '$#,##0.00'
-    
-    # ROI and Profit Margin formatting
-    number_cols = [
-        header_map.get('ROI'),
-        header_map.get('Profit Margin (Buybox)'),
-        header_map.get('Profit Margin (MSRP)')
-    ]
-    for col in number_cols:
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    c.number_format = '#,##0.00'
-    
-    # Text formatting for percentage columns
-    text_cols = [
-        header_map.get('AMZ In Stock %'),
-        header_map.get('Buy Box: % Amazon 90 days')
-    ]
-    for col in text_cols:
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    c.number_format = '@'
-    
-    # Conditional formatting - Sales Rank colors
-    green_fill = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')
-    orange_fill = PatternFill(start_color='FFD580', end_color='FFD580', fill_type='solid')
-    red_fill = PatternFill(start_color='FFB6B6', end_color='FFB6B6', fill_type='solid')
-    
-    for col in sales_rank_cols:
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    try:
-                        if c.value is None or c.value == '' or c.value == 0:
-                            continue
-                        val = int(c.value)
-                        if 0 < val <= 150000:
-                            c.fill = green_fill
-                        elif 150001 <= val <= 500000:
-                            c.fill = orange_fill
-                        elif val >= 500001:
-                            c.fill = red_fill
-                    except:
-                        pass
-    
-    # Conditional formatting - Pack Fee (orange for $7)
-    pack_fee_col = header_map.get('Pick & Pack')
-    if pack_fee_col:
-        for cell in ws.iter_cols(min_col=pack_fee_col, max_col=pack_fee_col, min_row=2):
-            for c in cell:
-                try:
-                    cell_value = float(str(c.value).replace('$', '').replace(',', ''))
-                    if cell_value == 7.0:
-                        c.fill = orange_fill
-                except:
-                    pass
-    
-    # Conditional formatting - Amazon Availability
-    amazon_col = header_map.get('Amazon Availability')
-    if amazon_col:
-        amazon_red = PatternFill(start_color='FF6666', end_color='FF6666', fill_type='solid')
-        amazon_green = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')
-        amazon_orange = PatternFill(start_color='FFD580', end_color='FFD580', fill_type='solid')
-        for row in ws.iter_rows(min_row=2, min_col=amazon_col, max_col=amazon_col):
-            for cell in row:
-                cell_value_lower = str(cell.value).lower() if cell.value else ''
-                if 'no amazon offer exists' in cell_value_lower:
-                    cell.fill = amazon_green
-                elif 'amazon offer is in stock and shippable' in cell_value_lower:
-                    cell.fill = amazon_red
-                elif cell.value and str(cell.value).strip():
-                    cell.fill = amazon_orange
-    
-    # Conditional formatting - Sales Badge
-    sales_badge_col = header_map.get('Sales Badge')
-    if sales_badge_col:
-        badge_green = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')
-        for row in ws.iter_rows(min_row=2, min_col=sales_badge_col, max_col=sales_badge_col):
-            for cell in row:
-                if cell.value not in (None, '', 0):
-                    cell.fill = badge_green
-    
-    # Conditional formatting - MSRP Difference
-    msrp_diff_col = header_map.get('MSRP Difference')
-    if msrp_diff_col:
-        for cell in ws.iter_cols(min_col=msrp_diff_col, max_col=msrp_diff_col, min_row=2):
-            for c in cell:
-                try:
-                    if isinstance(c.value, (int, float)):
-                        if c.value < -0.05:
-                            c.fill = red_fill
-                        elif c.value >= -0.05:
-                            c.fill = green_fill
-                        c.number_format = '0.00'
-                    elif c.value == 'No Buybox':
-                        c.fill = red_fill
-                except:
-                    pass
-    
-    # Conditional formatting - Profit Margin
-    for col_name in ['Profit Margin (Buybox)', 'Profit Margin (MSRP)']:
-        col = header_map.get(col_name)
-        if col:
-            for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-                for c in cell:
-                    try:
-                        if c.value is not None and c.value != '' and c.value != 'No Buybox':
-                            val = float(c.value)
-                            if val < 12:
-                                c.fill = red_fill
-                            elif 12 <= val <= 20:
-                                c.fill = orange_fill
-                            elif val > 20:
-                                c.fill = green_fill
-                        elif c.value == 'No Buybox':
-                            c.fill = red_fill
-                    except:
-                        pass
-    
-    # Borders
-    thin = Side(border_style="thin", color="000000")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.border = border
-    
-    # Column widths
-    for col in ws.columns:
-        col_letter = get_column_letter(col[0].column)
-        ws.column_dimensions[col_letter].width = 15
-    
-    wb.save(file_path)
+def process_excel_file(main_path, cost_path, shipping_cost, misc_cost, chunk_size, fill_mode='cells', output_dir=None,
+                       layout='cells', compact=False, cancel=None, progress_path=None, main_digest=None,
+                       cost_digest=None, cache_key=None):
+    """Process Excel file with the same pipeline as the desktop app"""
+    options = web_options(shipping_cost, misc_cost, chunk_size, fill_mode, layout, compact)
+    # Digests taken while the uploads were spooled spare the caches a second read
+    cost = CostSource.from_path(cost_path, digest=cost_digest) if cost_path else None
+    save_path = default_output_path(main_path, output_dir or app.config['UPLOAD_FOLDER'])
+    events = ProgressChannel(path=progress_path) if progress_path else None
+    pipeline = Pipeline(options, cancel=cancel, events=events)
+    output_path = pipeline.run(main_path, save_path, cost, main_digest).output_path
+    if cache_key is not None:
+        try:
+            ResultCache(app.config['CACHE_FOLDER']).store(cache_key, output_path)
+        except OSError:
+            # The result is still served from the job folder
+            pass
+    return output_path
 
 if __name__ == '__main__':
     app.run(debug=True)
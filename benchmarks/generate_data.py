@@ -0,0 +1,230 @@
+"""
+Deterministic synthetic Scout exports and supplier cost files.
+
+The same rows and seed always give the same data. Exports use the Keepa
+column names the header maps expect, group ASINs into Parent/Color/Size
+variations, leave the blanks that trigger the Pick & Pack / Referral Fee
+assumptions, and mix the product code formats real files contain (floats,
+lost leading zeros, dashes, SKUs).
+
+Usage:
+    python benchmarks/generate_data.py 100000 --seed 7 --out-dir bench_data
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from core.writer import MAX_DATA_ROWS
+
+DEFAULT_SEED = 42
+
+# Column names as they come out of a Keepa/Scout export
+EXPORT_COLUMNS = [
+    'Locale', 'Image', 'Brand', 'Parent ASIN', 'ASIN',
+    'Product Codes: UPC', 'Product Codes: EAN', 'Product Codes: GTIN', 'Imported by Code',
+    'Title', 'Color', 'Size', 'Bought in past month',
+    'Reviews: Rating Count', 'Reviews: Review Count - Format Specific',
+    'Sales Rank: Current', 'Sales Rank: 30 days avg.', 'Sales Rank: 90 days avg.', 'Sales Rank: 180 days avg.',
+    'Buy Box 🚚: Current', 'Buy Box 🚚: 30 days avg.', 'Buy Box 🚚: 90 days avg.', 'Buy Box 🚚: 180 days avg.',
+    'Amazon: 90 days OOS', 'Buy Box: % Amazon 90 days', 'Amazon: Availability of the Amazon offer',
+    'Count of retrieved live offers: New, FBA', 'Count of retrieved live offers: New, FBM',
+    'FBA Pick&Pack Fee', 'Referral Fee %',
+]
+
+COLORS = ['Black', 'White', 'Navy', 'Red', 'Heather Grey', 'Olive', 'Pink', 'Royal Blue', 'Charcoal', 'Sand']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '3XL', '6', '8', '10', '12', 'One Size']
+WORDS = ['Classic', 'Cotton', 'Performance', 'Slim', 'Relaxed', 'Crew', 'Hoodie', 'Tee', 'Jogger', 'Polo',
+         'Fleece', 'Stretch', 'Vintage', 'Graphic', 'Zip', 'Pullover', 'Tank', 'Shorts', 'Jacket', 'Sock']
+AVAILABILITY = ['No Amazon offer exists', 'Amazon offer is in stock and shippable',
+                'Amazon offer is currently not in stock, but will be', 'Amazon offer is back-ordered']
+BADGES = ['50+ bought in past month', '100+ bought in past month', '1K+ bought in past month']
+
+
+def _blank(rng, values, rate):
+    """Copy values to an object array with about rate of the entries set to None"""
+    out = np.asarray(values, dtype=object).copy()
+    out[rng.random(len(out)) < rate] = None
+    return out
+
+
+def _upc_check_digit(body):
+    """UPC-A check digit for an int64 array of 11-digit bodies"""
+    digits = np.stack([(body // 10 ** (10 - k)) % 10 for k in range(11)], axis=1)
+    total = digits[:, 0::2].sum(axis=1) * 3 + digits[:, 1::2].sum(axis=1)
+    return (10 - total % 10) % 10
+
+
+def product_codes(rows, seed=DEFAULT_SEED):
+    """12-digit UPC values (int64) for rows, unique and reproducible"""
+    rng = np.random.default_rng([seed, 1])
+    body = rng.choice(np.arange(10 ** 9, 10 ** 9 + rows * 7), size=rows, replace=False).astype('int64')
+    # Vary the manufacturer prefix so some UPCs start with 0
+    body = body + rng.integers(0, 90, rows) * 10 ** 9
+    return body * 10 + _upc_check_digit(body)
+
+
+def format_codes(rng, upc, share_sku=0.08):
+    """Render UPCs the many ways exports carry them in 'Imported by Code'"""
+    n = len(upc)
+    text = pd.Series(upc).astype(str).str.zfill(12).to_numpy(dtype=object)
+    style = rng.random(n)
+    out = text.copy()
+    # Numbers that lost their leading zero in Excel
+    as_number = style < 0.35
+    out[as_number] = upc[as_number].astype(object)
+    # Dashed UPC-A layout 0-12345-67890-5
+    dashed = (style >= 0.35) & (style < 0.45)
+    out[dashed] = [f'{c[0]}-{c[1:6]}-{c[6:11]}-{c[11]}' for c in text[dashed]]
+    # GTIN-14 with two leading zeros
+    gtin = (style >= 0.45) & (style < 0.55)
+    out[gtin] = ['00' + c for c in text[gtin]]
+    # Float with trailing .0 (codes pasted through a numeric column)
+    floats = (style >= 0.55) & (style < 0.62)
+    out[floats] = [f'{float(c)}' for c in upc[floats]]
+    sku = style >= 1 - share_sku
+    out[sku] = [f'SKU-{v % 1000000:06d}' for v in upc[sku]]
+    return out
+
+
+def generate_export(rows, seed=DEFAULT_SEED):
+    """Return a DataFrame shaped like a Scout export with `rows` rows"""
+    rng = np.random.default_rng([seed, 0])
+
+    # Parent groups of 1-12 children, each child a Color x Size variation
+    group_sizes = rng.integers(1, 13, rows // 2 + 2)
+    parent_of_row = np.repeat(np.arange(len(group_sizes)), group_sizes)[:rows]
+    parents = np.array([f'B0P{p:07d}' for p in range(parent_of_row.max() + 1)], dtype=object)
+    colors_per_parent = rng.integers(1, 5, len(parents))
+    color_idx = (rng.integers(0, 1000, rows) % colors_per_parent[parent_of_row] + parent_of_row) % len(COLORS)
+    size_idx = rng.integers(0, len(SIZES), rows)
+
+    brands = np.array([f'Brand {b:03d}' for b in range(500)], dtype=object)
+    brand_of_parent = rng.integers(0, len(brands), len(parents))
+    brand = brands[brand_of_parent[parent_of_row]]
+
+    titles = np.array([' '.join(rng.choice(WORDS, 3)) for _ in range(256)], dtype=object)
+    title = brand + ' ' + titles[parent_of_row % len(titles)]
+
+    upc = product_codes(rows, seed)
+    rank = np.exp(rng.normal(12, 1.6, rows)).astype('int64') + 1
+    buybox = np.round(np.exp(rng.normal(3.1, 0.5, rows)), 2)
+
+    def drift(values, spread):
+        return np.round(values * rng.normal(1, spread, rows), 2)
+
+    data = {
+        'Locale': np.full(rows, 'com', dtype=object),
+        'Image': np.array([f'https://images.example.com/{a}.jpg' for a in range(rows)], dtype=object),
+        'Brand': _blank(rng, brand, 0.02),
+        'Parent ASIN': parents[parent_of_row],
+        'ASIN': np.array([f'B0{a:08X}' for a in range(rows)], dtype=object),
+        'Product Codes: UPC': np.where(rng.random(rows) < 0.7, upc.astype('float64'), np.nan),
+        'Product Codes: EAN': _blank(rng, pd.Series(upc).astype(str).str.zfill(13).to_numpy(dtype=object), 0.6),
+        'Product Codes: GTIN': _blank(rng, pd.Series(upc).astype(str).str.zfill(14).to_numpy(dtype=object), 0.8),
+        'Imported by Code': _blank(rng, format_codes(rng, upc), 0.05),
+        'Title': _blank(rng, title, 0.01),
+        'Color': np.array(COLORS, dtype=object)[color_idx],
+        'Size': np.array(SIZES, dtype=object)[size_idx],
+        'Bought in past month': _blank(rng, rng.choice(BADGES, rows), 0.7),
+        'Reviews: Rating Count': rng.poisson(120, rows) * (rng.random(rows) < 0.8),
+        'Reviews: Review Count - Format Specific': rng.poisson(30, rows),
+        'Sales Rank: Current': _blank(rng, rank, 0.05),
+        'Sales Rank: 30 days avg.': _blank(rng, drift(rank, 0.2).astype('int64'), 0.05),
+        'Sales Rank: 90 days avg.': _blank(rng, drift(rank, 0.3).astype('int64'), 0.08),
+        'Sales Rank: 180 days avg.': _blank(rng, drift(rank, 0.4).astype('int64'), 0.1),
+        'Buy Box 🚚: Current': _blank(rng, buybox, 0.15),
+        'Buy Box 🚚: 30 days avg.': _blank(rng, drift(buybox, 0.05), 0.2),
+        'Buy Box 🚚: 90 days avg.': _blank(rng, drift(buybox, 0.08), 0.25),
+        'Buy Box 🚚: 180 days avg.': _blank(rng, drift(buybox, 0.1), 0.3),
+        'Amazon: 90 days OOS': _blank(rng, [f'{v}%' for v in rng.integers(0, 101, rows)], 0.3),
+        'Buy Box: % Amazon 90 days': _blank(rng, [f'{v}%' for v in rng.integers(0, 101, rows)], 0.4),
+        'Amazon: Availability of the Amazon offer': _blank(rng, rng.choice(AVAILABILITY, rows, p=[0.55, 0.25, 0.1, 0.1]), 0.05),
+        'Count of retrieved live offers: New, FBA': rng.poisson(4, rows),
+        'Count of retrieved live offers: New, FBM': rng.poisson(2, rows),
+        # Blanks and zeros here trigger the 7.00 / 0.15 assumptions
+        'FBA Pick&Pack Fee': _blank(rng, np.where(rng.random(rows) < 0.05, 0.0, np.round(rng.uniform(3.2, 8.5, rows), 2)), 0.1),
+        'Referral Fee %': _blank(rng, np.where(rng.random(rows) < 0.5, '15.00%', rng.choice([0.08, 0.15, 0.17], rows)), 0.1),
+    }
+    df = pd.DataFrame(data, columns=EXPORT_COLUMNS)
+
+    # A few empty and nearly empty rows, as exports pick up from manual edits
+    junk = rng.random(rows) < 0.003
+    df.loc[junk, [c for c in EXPORT_COLUMNS if c not in ('Locale', 'Parent ASIN')]] = None
+    return df
+
+
+def generate_cost_file(export, seed=DEFAULT_SEED, match_rate=0.6, extra_rate=0.5):
+    """
+    Supplier cost/MSRP sheet for an export: about match_rate of its codes
+    (in their own mix of formats, with a few duplicates) plus unrelated rows.
+    """
+    rng = np.random.default_rng([seed, 2])
+    rows = len(export)
+    upc = product_codes(rows, seed)
+    matched = upc[rng.random(rows) < match_rate]
+    # Unrelated supplier rows, outside the range product_codes can produce
+    extra = np.arange(int(rows * extra_rate), dtype='int64') * 13 + 990000000000
+    codes = np.concatenate([matched, extra])
+    dupes = rng.choice(codes, max(1, len(codes) // 200)) if len(codes) else codes
+    codes = rng.permutation(np.concatenate([codes, dupes]))
+    n = len(codes)
+    return pd.DataFrame({
+        'UPC': format_codes(rng, codes, share_sku=0.0),
+        'COST': np.where(rng.random(n) < 0.02, np.nan, np.round(rng.uniform(1, 40, n), 2)),
+        'MSRP': np.where(rng.random(n) < 0.3, np.nan, np.round(rng.uniform(15, 90, n), 2)),
+    })
+
+
+def write_xlsx(df, path):
+    """Write a frame as a plain (unformatted) xlsx quickly with a write-only workbook"""
+    if len(df) > MAX_DATA_ROWS:
+        raise ValueError(f"{len(df):,} rows do not fit on one Excel sheet")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append(list(df.columns))
+    columns = [df[col].to_numpy(dtype=object) for col in df.columns]
+    for row in zip(*columns):
+        ws.append([None if (v is None or (isinstance(v, float) and v != v)) else
+                   (v.item() if hasattr(v, 'item') else v) for v in row])
+    wb.save(path)
+    return path
+
+
+def dataset_paths(out_dir, rows, seed=DEFAULT_SEED):
+    base = os.path.join(out_dir, f'scout_{rows}_s{seed}')
+    return f'{base}.xlsx', f'{base}_cost.xlsx'
+
+
+def generate_files(rows, out_dir, seed=DEFAULT_SEED):
+    """Write the export and cost workbooks (reused if already there) and return their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    main_path, cost_path = dataset_paths(out_dir, rows, seed)
+    if not (os.path.exists(main_path) and os.path.exists(cost_path)):
+        export = generate_export(rows, seed)
+        write_xlsx(export, main_path)
+        write_xlsx(generate_cost_file(export, seed), cost_path)
+    return main_path, cost_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Scout exports and cost files')
+    parser.add_argument('rows', type=int, nargs='+', help='row counts to generate')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out-dir', default='bench_data')
+    args = parser.parse_args()
+    for rows in args.rows:
+        main_path, cost_path = generate_files(rows, args.out_dir, args.seed)
+        print(f"{rows:,} rows -> {main_path}, {cost_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Stage-by-stage benchmarks for the desktop and web pipelines.
+
+Every (pipeline, size) pair runs in a fresh Python process so peak RSS is
+measured cleanly. Each stage of core.pipeline (ingest, clean, merge,
+aggregate, metrics, sort, write) is timed for wall and CPU seconds through a
+stage hook, with the rows it produced and the peak RSS reached by its end.
+"api" and "desktop" run the pipeline with each frontend's format profile. Results are printed as a scaling table and
+saved as JSON so two versions can be diffed with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --output before.json
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pandas as pd
+
+import generate_data
+from core.batch import peak_rss_mb
+from core.cost_index import CostIndex
+from core.instrumentation import StageHook
+from core.pipeline import CostSource, Pipeline, PipelineOptions
+
+DEFAULT_SIZES = [10000, 50000, 100000]
+PIPELINES = ['api', 'desktop']
+# Above this the generated files (export, or export + cost rows) no longer
+# fit on one sheet, so the data is handed to the pipeline in memory instead
+XLSX_MAX_ROWS = 900000
+
+
+class StageRecorder(StageHook):
+    """Records wall/CPU seconds, rows and peak RSS for each pipeline stage"""
+
+    def __init__(self):
+        self.stages = {}
+        self.cpu_started = None
+
+    def stage_started(self, name, state):
+        self.cpu_started = time.process_time()
+
+    def stage_finished(self, name, state, seconds):
+        self.stages[name] = {
+            'seconds': seconds,
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'rows': len(state.df) if state.df is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+def run_pipeline(pipeline, main, cost, work_dir, recorder):
+    """Run the shared pipeline the way the given frontend configures it"""
+    options = PipelineOptions(
+        profile='web' if pipeline == 'api' else 'desktop',
+        shipping_cost=1.0,
+        misc_cost=0.5,
+        chunk_size=1000,
+        cache_dir=os.path.join(work_dir, 'cache'),
+    )
+    save_path = os.path.join(work_dir, f'{pipeline}_formatted.xlsx')
+    return Pipeline(options, hooks=[recorder]).run(main, save_path, cost)
+
+
+def memory_cost_source(cost):
+    """CostSource for a generated cost frame, with its index already built from the frame"""
+    source = CostSource('<memory>', [str(col) for col in cost.columns])
+    mapping = source.mapping()
+    source.index = CostIndex.from_frame(cost, mapping['code'], mapping['cost'], mapping['msrp'])
+    return source
+
+
+def run_child(pipeline, rows, seed, data_dir, result_file):
+    """Run one pipeline on one dataset and write the measurements to result_file"""
+    recorder = StageRecorder()
+    result = {'pipeline': pipeline, 'rows': rows, 'seed': seed}
+    with tempfile.TemporaryDirectory(prefix='scout_bench_') as work_dir:
+        started = time.perf_counter()
+        if rows <= XLSX_MAX_ROWS:
+            main_path, cost_path = generate_data.generate_files(rows, data_dir, seed)
+            main, cost = main_path, CostSource.from_path(cost_path)
+            result['source'] = 'xlsx'
+        else:
+            main = generate_data.generate_export(rows, seed)
+            cost = memory_cost_source(generate_data.generate_cost_file(main, seed))
+            result['source'] = 'memory'
+        result['generate_seconds'] = time.perf_counter() - started
+        baseline_rss = peak_rss_mb()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        state = run_pipeline(pipeline, main, cost, work_dir, recorder)
+        result['total_seconds'] = time.perf_counter() - wall
+        result['total_cpu_seconds'] = time.process_time() - cpu
+        # Time outside the stages themselves (hooks, final cleanup)
+        result['other_seconds'] = result['total_seconds'] - sum(s['seconds'] for s in recorder.stages.values())
+        result['rows_in'] = state.rows_in
+        result['rows_dropped'] = state.rows_dropped
+        result['matched_rows'] = state.matched_rows
+        result['stages'] = recorder.stages
+        result['setup_peak_rss_mb'] = baseline_rss
+        result['peak_rss_mb'] = peak_rss_mb()
+
+    with open(result_file, 'w') as handle:
+        json.dump(result, handle)
+
+
+def run_suite(sizes, pipelines, seed, data_dir):
+    results = []
+    for rows in sizes:
+        for pipeline in pipelines:
+            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as handle:
+                result_file = handle.name
+            try:
+                command = [sys.executable, os.path.abspath(__file__), '--child', pipeline, str(rows),
+                           '--seed', str(seed), '--data-dir', data_dir, '--result-file', result_file]
+                # Pipeline logging goes to /dev/null; only the result file matters
+                completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                if completed.returncode != 0:
+                    results.append({'pipeline': pipeline, 'rows': rows, 'error': completed.stderr.strip()[-2000:]})
+                else:
+                    with open(result_file) as result_handle:
+                        results.append(json.load(result_handle))
+            finally:
+                os.remove(result_file)
+            print(format_result(results[-1]), flush=True)
+    return results
+
+
+def format_result(result):
+    label = f"{result['pipeline']:<8} {result['rows']:>10,} rows"
+    if 'error' in result:
+        return f"{label}  ERROR {result['error'].splitlines()[-1] if result['error'] else ''}"
+    stages = '  '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in result['stages'].items())
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+    return f"{label}  total {result['total_seconds']:.2f}s  peak RSS {rss}  |  {stages}  other {result['other_seconds']:.2f}s"
+
+
+def scaling_table(results):
+    """Markdown table of rows vs. seconds and peak RSS per pipeline"""
+    lines = ['| pipeline | rows | seconds | sec / 100k rows | peak RSS (MB) |', '|---|---:|---:|---:|---:|']
+    for result in results:
+        if 'total_seconds' not in result:
+            continue
+        per_100k = result['total_seconds'] / result['rows'] * 100000
+        rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else 'n/a'
+        lines.append(f"| {result['pipeline']} | {result['rows']:,} | {result['total_seconds']:.2f} | {per_100k:.2f} | {rss} |")
+    return '\n'.join(lines)
+
+
+def compare(old, new):
+    """Print new/old ratios for total time, each stage and peak RSS"""
+    previous = {(r['pipeline'], r['rows']): r for r in old['results'] if 'total_seconds' in r}
+    lines = [f"Comparing {new.get('label')} against {old.get('label')}"]
+    for result in new['results']:
+        key = (result['pipeline'], result['rows'])
+        if 'total_seconds' not in result or key not in previous:
+            continue
+        before = previous[key]
+        parts = [f"total {before['total_seconds']:.2f}s -> {result['total_seconds']:.2f}s "
+                 f"({result['total_seconds'] / max(before['total_seconds'], 1e-9):.2f}x)"]
+        for name, stage in result['stages'].items():
+            if name in before['stages']:
+                parts.append(f"{name} {stage['seconds'] / max(before['stages'][name]['seconds'], 1e-9):.2f}x")
+        if result['peak_rss_mb'] and before['peak_rss_mb']:
+            parts.append(f"RSS {before['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MB")
+        lines.append(f"{key[0]:<8} {key[1]:>10,}  " + '  '.join(parts))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Scout pipelines stage by stage')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='row counts (10k-5M)')
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=PIPELINES)
+    parser.add_argument('--seed', type=int, default=generate_data.DEFAULT_SEED)
+    parser.add_argument('--data-dir', default='bench_data', help='where generated workbooks are cached')
+    parser.add_argument('--label', default=None, help='name for this run in the report')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', metavar='OLD_JSON', help='earlier --output file to compare against')
+    parser.add_argument('--child', nargs=2, metavar=('PIPELINE', 'ROWS'), help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), args.seed, args.data_dir, args.result_file)
+        return
+
+    results = run_suite(args.sizes, args.pipelines, args.seed, os.path.abspath(args.data_dir))
+    report = {
+        'label': args.label or time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+
+    print()
+    print(scaling_table(results))
+    print(f"\nSaved {args.output}")
+    if args.compare:
+        with open(args.compare) as handle:
+            print()
+            print(compare(json.load(handle), report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Core processing logic shared by the desktop app and the web API.
+"""
@@ -0,0 +1,215 @@
+"""
+Command-line batch mode: format many Scout exports against one cost file.
+
+The cost file is indexed once up front; every worker then opens the same
+memory-mapped index from the cache. Exports are spread over a process pool
+and a JSON summary with per-file rows, matches, timings and peak memory is
+written at the end.
+
+Usage:
+    python -m core.batch exports/ --cost cost.xlsx --shipping 1.0 --misc 0.5
+    python -m core.batch "exports/*.xlsx" --output-dir formatted --workers 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+
+from core.cost_index import file_digest
+from core.dtypes import MB, report_totals
+from core.pipeline import CostSource, Pipeline, PipelineOptions, default_output_path
+from core.writer import FILL_MODES, FORMAT_PROFILES, LAYOUT_MODES
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+OUTPUT_SUFFIX = '_formatted'
+SUMMARY_NAME = 'batch_summary.json'
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def find_exports(patterns):
+    """Expand files, directories and glob patterns into a sorted list of workbooks"""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern) or [pattern]
+        for path in candidates:
+            name = os.path.basename(path)
+            stem, ext = os.path.splitext(name)
+            # Skip Excel lock files and our own earlier output
+            if ext.lower() not in EXCEL_EXTENSIONS or name.startswith('~$') or stem.endswith(OUTPUT_SUFFIX):
+                continue
+            found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def prepare_cost(cost_path, options):
+    """Index the cost file once; returns (CostSource for the workers, index rows, seconds)"""
+    started = time.perf_counter()
+    cost = CostSource.from_path(cost_path)
+    cost.digest = file_digest(cost_path)
+    mapping = cost.mapping()
+    if not mapping['code'] or not (mapping['cost'] or mapping['msrp']):
+        raise ValueError(f"{cost_path} has no UPC/Imported by Code column or no COST/MSRP column")
+    cost.code_column, cost.cost_column, cost.msrp_column = mapping['code'], mapping['cost'], mapping['msrp']
+    index = cost.load_index(options.cache_dir)
+    rows = len(index)
+    if isinstance(index.int_keys, np.memmap):
+        # Saved to the cache: workers open it by digest instead of receiving a copy
+        cost.index = None
+    return cost, rows, time.perf_counter() - started
+
+
+def process_export(main_path, save_path, cost, options):
+    """Run the pipeline on one export; returns its summary entry (never raises)"""
+    entry = {'file': main_path, 'output': None, 'error': None}
+    started = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        state = Pipeline(options).run(main_path, save_path, cost)
+        entry.update({
+            'output': state.output_path,
+            'rows_in': state.rows_in,
+            'rows_dropped': state.rows_dropped,
+            'rows_out': state.rows_out,
+            'main_code_column': state.main_code_column,
+            'matched_rows': state.matched_rows,
+            'buybox_sources': state.buybox_counts,
+            'stage_seconds': state.timings,
+            'metrics_path': state.metrics_path,
+        })
+        if state.memory_report:
+            before, after = report_totals(state.memory_report)
+            entry['frame_mb'] = {'before': before / MB, 'after': after / MB}
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+        entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - started
+    entry['cpu_seconds'] = time.process_time() - cpu
+    entry['peak_rss_mb'] = peak_rss_mb()
+    return entry
+
+
+def make_executor(workers):
+    """Process pool with one fresh process per file where supported, so peak RSS is per file"""
+    kwargs = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+    try:
+        return ProcessPoolExecutor(max_workers=workers, **kwargs)
+    except (OSError, NotImplementedError, ValueError):
+        # No process support - run on threads instead
+        return ThreadPoolExecutor(max_workers=workers)
+
+
+def run_batch(main_paths, cost_path=None, options=None, output_dir=None, workers=None, log=print):
+    """Process every export and return the summary dict"""
+    options = options or PipelineOptions()
+    started = time.time()
+    summary = {
+        'started': started,
+        'cost_file': cost_path,
+        'options': asdict(options),
+        'files': [],
+    }
+
+    cost = None
+    if cost_path:
+        cost, summary['cost_index_rows'], summary['cost_index_seconds'] = prepare_cost(cost_path, options)
+        log(f"Indexed {cost_path}: {summary['cost_index_rows']:,} code rows in {summary['cost_index_seconds']:.1f}s")
+
+    workers = workers or max(1, min(os.cpu_count() or 1, len(main_paths)))
+    summary['workers'] = workers
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with make_executor(workers) as executor:
+        futures = {
+            executor.submit(process_export, path, default_output_path(path, output_dir), cost, options): path
+            for path in main_paths
+        }
+        for number, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            summary['files'].append(entry)
+            status = f"failed: {entry['error']}" if entry['error'] else \
+                f"{entry['rows_out']:,} rows, {entry['matched_rows'] or 0:,} matched"
+            log(f"[{number}/{len(futures)}] {os.path.basename(entry['file'])}: {status} ({entry['seconds']:.1f}s)")
+
+    summary['files'].sort(key=lambda entry: entry['file'])
+    summary['finished'] = time.time()
+    summary['seconds'] = summary['finished'] - started
+    summary['failed'] = sum(1 for entry in summary['files'] if entry['error'])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Format many Scout exports in parallel')
+    parser.add_argument('inputs', nargs='+', help='export files, directories or glob patterns')
+    parser.add_argument('--cost', help='cost/MSRP file merged into every export')
+    parser.add_argument('--shipping', type=float, default=0.0, help='shipping cost added to COST')
+    parser.add_argument('--misc', type=float, default=0.0, help='misc cost added to COST')
+    parser.add_argument('--output-dir', help='where formatted files go (default: next to each export)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--fill-mode', choices=FILL_MODES, default='cells')
+    parser.add_argument('--layout', choices=LAYOUT_MODES, default='cells',
+                        help="'sheet' sets row height and cell styles once per sheet and column")
+    parser.add_argument('--profile', choices=sorted(FORMAT_PROFILES), default='desktop')
+    parser.add_argument('--compact', action='store_true',
+                        help='convert exports to categorical and small integer dtypes after loading')
+    parser.add_argument('--instrument', action='store_true',
+                        help='write a _metrics.json with per-stage and per-rule timings next to each output')
+    parser.add_argument('--parse-cache', action='store_true',
+                        help='keep parsed exports in the cache so re-runs of the same files skip reading the xlsx')
+    parser.add_argument('--cache-dir', help='cost index and parse cache (default: $SCOUT_CACHE_DIR or ~/.excel_formatter_pro/cache)')
+    parser.add_argument('--summary', help=f'summary JSON path (default: {SUMMARY_NAME} in the output directory)')
+    args = parser.parse_args(argv)
+
+    main_paths = find_exports(args.inputs)
+    if not main_paths:
+        parser.error('no .xlsx exports found')
+
+    options = PipelineOptions(
+        profile=args.profile,
+        shipping_cost=args.shipping,
+        misc_cost=args.misc,
+        chunk_size=args.chunk_size,
+        fill_mode=args.fill_mode,
+        layout=args.layout,
+        compact=args.compact,
+        cache_dir=args.cache_dir,
+        parse_cache=args.parse_cache,
+        instrument=args.instrument,
+    )
+    summary = run_batch(main_paths, args.cost, options, args.output_dir, args.workers)
+
+    summary_path = args.summary or os.path.join(args.output_dir or os.getcwd(), SUMMARY_NAME)
+    with open(summary_path, 'w') as handle:
+        json.dump(summary, handle, indent=2)
+    print(f"Processed {len(main_paths) - summary['failed']}/{len(main_paths)} files in {summary['seconds']:.1f}s; "
+          f"summary: {summary_path}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
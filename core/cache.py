@@ -0,0 +1,73 @@
+"""
+Locations, keys and eviction shared by the on-disk caches (cost indexes,
+parsed workbooks, formatted results).
+"""
+
+import hashlib
+import os
+
+CACHE_ENV_VAR = 'SCOUT_CACHE_DIR'
+MB = 1024 * 1024
+
+
+def default_cache_dir():
+    """Cache root: $SCOUT_CACHE_DIR, else ~/.excel_formatter_pro/cache"""
+    root = os.environ.get(CACHE_ENV_VAR)
+    if not root:
+        root = os.path.join(os.path.expanduser('~'), '.excel_formatter_pro', 'cache')
+    return root
+
+
+def file_digest(file_path, block_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def size_budget(env_var, default_mb):
+    """Size budget in bytes: $env_var in MB, else default_mb"""
+    value = os.environ.get(env_var)
+    return int(float(value) * MB) if value else int(default_mb * MB)
+
+
+def touch(path):
+    """Mark a cache file as just used; False if it is gone"""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def evict_lru(directory, max_bytes, keep=None):
+    """
+    Delete the least recently used (oldest mtime) files in directory until
+    the rest fit in max_bytes. keep and files still being written (.tmp) are
+    never deleted.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    entries = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep or path.endswith('.tmp'):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
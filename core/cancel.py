@@ -0,0 +1,76 @@
+"""
+Cooperative cancellation for pipeline runs.
+
+A CancelToken is handed to a run and checked between units of work: reader
+batches, pipeline stages, writer chunks, conditional-formatting rules and
+shard workbooks. cancel() only raises a flag; the run stops with Cancelled
+at its next check and removes what it had written so far.
+
+A token with a path also raises its flag by creating that file, so worker
+processes holding a pickled copy see it too.
+"""
+
+import os
+import threading
+
+
+class Cancelled(Exception):
+    """Raised inside a run whose CancelToken was cancelled"""
+
+    def __init__(self, message="Processing was cancelled"):
+        super().__init__(message)
+
+
+class CancelToken:
+    """Flag shared between a run and whoever may stop it"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._event = threading.Event()
+
+    def share(self, path):
+        """Make cancel() visible to other processes through path from now on"""
+        self.path = path
+        if self._event.is_set():
+            self._touch()
+
+    def _touch(self):
+        with open(self.path, 'a'):
+            pass
+
+    def cancel(self):
+        self._event.set()
+        if self.path is not None:
+            try:
+                self._touch()
+            except OSError:
+                pass
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.path is not None and os.path.exists(self.path):
+            self._event.set()
+            return True
+        return False
+
+    def check(self):
+        """Raise Cancelled if the token was cancelled"""
+        if self.cancelled:
+            raise Cancelled()
+
+    def __getstate__(self):
+        return {'path': self.path, 'cancelled': self._event.is_set()}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._event = threading.Event()
+        if state['cancelled']:
+            self._event.set()
+
+
+def check(token):
+    """token.check() for an optional token"""
+    if token is not None:
+        token.check()
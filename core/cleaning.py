@@ -0,0 +1,99 @@
+"""
+Row filters for Scout exports.
+
+The drop rules used to run as a row-wise df.apply that stringified every
+cell of every row. Here each column is turned into emptiness flags once and
+the rules are evaluated as boolean masks over the whole frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+KEY_FIELDS = ['Brand', 'Parent', 'ASIN', 'Title']
+
+# str(value).strip().lower() results that count as "no data"
+BLANK_TOKENS = ['nan', '', 'none']
+# ... and the looser set used when the code column is missing, zeros included
+VOID_TOKENS = ['nan', '', 'none', '0', '0.0', '0.0%']
+
+
+def cell_flags(series):
+    """
+    Return (is_na, is_empty_string, is_blank, is_void) arrays for one column.
+
+    The flags match what str(value).strip().lower() gives for each cell, so
+    numeric columns are checked directly and only other columns are
+    converted to text.
+    """
+    n = len(series)
+    is_na = series.isna().to_numpy()
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        none = np.zeros(n, dtype=bool)
+        return is_na, none, none, none
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        none = np.zeros(n, dtype=bool)
+        return is_na, none, none, series.to_numpy() == 0
+    if pd.api.types.is_integer_dtype(dtype):
+        # Nullable integers, e.g. a compacted float column: flagged like the floats they hold
+        zero = series.eq(0).fillna(False).to_numpy(dtype=bool)
+        return is_na, np.zeros(n, dtype=bool), is_na, is_na | zero
+    if pd.api.types.is_float_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        values = series.to_numpy()
+        # str(-0.0) is '-0.0', which is not in VOID_TOKENS
+        zero = (values == 0) & ~np.signbit(values)
+        return is_na, np.zeros(n, dtype=bool), is_na, is_na | zero
+    tokens = series.astype(str).str.strip().str.lower()
+    is_blank = tokens.isin(BLANK_TOKENS).to_numpy()
+    is_void = tokens.isin(VOID_TOKENS).to_numpy()
+    return is_na, (tokens == '').to_numpy(), is_blank, is_void
+
+
+def problematic_row_mask(df):
+    """
+    Flag rows that are empty, mostly empty, or have key fields as 'nan'.
+
+    A row is flagged when:
+    - every cell is missing, or every cell is an empty string
+    - 'Imported by Code' is 'nan'/'' and at most 3 other cells hold a
+      non-zero value (UPC is used instead, 'nan' only, when there is no
+      'Imported by Code' column)
+    - a key field (Brand, Parent, ASIN, Title) is blank and at most 2 cells
+      in the whole row are non-blank
+    """
+    n_rows, n_cols = df.shape
+    if n_rows == 0 or n_cols == 0:
+        return pd.Series(False, index=df.index)
+
+    columns = list(df.columns)
+    is_na = np.empty((n_rows, n_cols), dtype=bool)
+    is_empty = np.empty((n_rows, n_cols), dtype=bool)
+    is_blank = np.empty((n_rows, n_cols), dtype=bool)
+    is_void = np.empty((n_rows, n_cols), dtype=bool)
+    tokens_for = {}
+    for idx in range(n_cols):
+        series = df.iloc[:, idx]
+        is_na[:, idx], is_empty[:, idx], is_blank[:, idx], is_void[:, idx] = cell_flags(series)
+        if columns[idx] in ('Imported by Code', 'UPC') and columns[idx] not in tokens_for:
+            tokens_for[columns[idx]] = series.astype(str).str.strip().str.lower().to_numpy()
+
+    mask = is_na.all(axis=1) | is_empty.all(axis=1)
+
+    # Meaningful (non-zero, non-empty) values per row
+    meaningful = n_cols - is_void.sum(axis=1)
+    for code_col, missing_tokens in (('Imported by Code', ['nan', '']), ('UPC', ['nan'])):
+        if code_col in tokens_for:
+            code_idx = columns.index(code_col)
+            code_missing = np.isin(tokens_for[code_col], missing_tokens)
+            # Exclude the code column itself from the count
+            others = meaningful - (~is_void[:, code_idx]).astype(int)
+            mask |= code_missing & (others <= 3)
+            break
+
+    key_idx = [idx for idx, col in enumerate(columns) if col in KEY_FIELDS]
+    if key_idx:
+        key_blank = is_blank[:, key_idx].any(axis=1)
+        non_blank = n_cols - is_blank.sum(axis=1)
+        mask |= key_blank & (non_blank <= 2)
+
+    return pd.Series(mask, index=df.index)
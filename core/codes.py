@@ -0,0 +1,70 @@
+"""
+Product code cleanup and match keys.
+
+UPC / EAN / GTIN / Imported by Code values are handled as whole string
+arrays. Numeric codes of GTIN length (8-14 digits) become GTIN-14 integers,
+so '12345678', '000012345678' and '00000012345678' share one int64 key.
+Anything else (SKUs, short or over-long numbers) keeps a string key.
+"""
+
+import numpy as np
+import pandas as pd
+
+CODE_COLUMNS = ['UPC', 'EAN', 'GTIN', 'Imported by Code']
+
+MISSING_KEY = -1
+GTIN_MIN_DIGITS = 8
+GTIN_MAX_DIGITS = 14
+
+
+def clean_code_text(series):
+    """Codes as display text: 'nan'/'None' blanked and a trailing .0 removed"""
+    text = series.astype(str).replace(['nan', 'NaN', 'None'], '')
+    return text.str.replace(r'\.0$', '', regex=True)
+
+
+def clean_code_columns(df, columns=CODE_COLUMNS):
+    """Apply clean_code_text to every code column present in df"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = clean_code_text(df[col])
+    return df
+
+
+def code_keys(series):
+    """
+    Return (int_keys, str_keys) match keys for a column of codes.
+
+    int_keys is an int64 array holding the GTIN-14 value of numeric codes and
+    MISSING_KEY elsewhere. str_keys is an object array holding the cleaned
+    code for non-numeric ones and None elsewhere. Empty, 'nan' and 'none'
+    cells get neither key.
+    """
+    n = len(series)
+    int_keys = np.full(n, MISSING_KEY, dtype='int64')
+    str_keys = np.full(n, None, dtype=object)
+    if n == 0:
+        return int_keys, str_keys
+
+    # Work on the distinct values only; exports repeat codes a lot
+    codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    text = text.str.replace(r'\.0$', '', regex=True)
+    missing = text.str.lower().isin(['nan', 'none', '']).to_numpy()
+
+    digits = text.str.replace(r'[- _]', '', regex=True)
+    numeric = digits.str.fullmatch(r'[0-9]+').to_numpy(dtype=bool) & ~missing
+    lengths = digits.str.len().to_numpy()
+    gtin = numeric & (lengths >= GTIN_MIN_DIGITS) & (lengths <= GTIN_MAX_DIGITS)
+
+    unique_int = np.full(len(uniques) + 1, MISSING_KEY, dtype='int64')
+    unique_int[:-1][gtin] = pd.to_numeric(digits[gtin]).to_numpy(dtype='int64')
+
+    unique_str = np.full(len(uniques) + 1, None, dtype=object)
+    # Other numeric codes lose their separators, SKUs are kept as written
+    as_text = np.where(numeric, digits.to_numpy(dtype=object), text.to_numpy(dtype=object))
+    keep_text = ~missing & ~gtin
+    unique_str[:-1][keep_text] = as_text[keep_text]
+
+    # code -1 marks values pandas considers missing
+    return unique_int[codes], unique_str[codes]
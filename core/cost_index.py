@@ -0,0 +1,269 @@
+"""
+On-disk index of a supplier cost/MSRP file.
+
+The index holds GTIN-14 int64 keys for numeric codes and UTF-8 byte string
+keys for other SKUs, each sorted, with COST and MSRP in matching float64
+arrays. Everything is saved as .npy files that are opened memory-mapped.
+Each index lives in a directory named after the cost file's SHA-256 and the
+selected columns, so any run or process that sees the same file reuses it
+without parsing the xlsx again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from core.cache import default_cache_dir, file_digest
+from core.codes import MISSING_KEY, clean_code_text, code_keys
+from core.parse_cache import read_cached
+from core.reader import header_names, read_excel_streaming
+
+INDEX_VERSION = 2
+MERGED_CODE_COLUMN = 'Imported by Code'
+
+
+def read_sheet_info(file_path):
+    """Return (column names, approximate data row count) without loading the sheet"""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        while header and (header[-1] is None or header[-1] == ''):
+            header = header[:-1]
+        columns = [str(col).strip() for col in header_names(header)]
+        rows = max((ws.max_row or 1) - 1, 0)
+    finally:
+        wb.close()
+    return columns, rows
+
+
+def detect_cost_columns(columns, code=None, cost=None, msrp=None):
+    """
+    Fill in code/COST/MSRP columns that were not picked by the user.
+
+    The code column prefers 'Imported by Code' and falls back to the first
+    UPC column.
+    """
+    for col in columns:
+        col_upper = col.upper()
+        if code is None and ('IMPORTED BY CODE' in col_upper or ('IMPORTED' in col_upper and 'CODE' in col_upper)):
+            code = col
+        elif 'UPC' in col_upper and code is None:
+            code = col
+        if cost is None and 'COST' in col_upper:
+            cost = col
+        if msrp is None and 'MSRP' in col_upper:
+            msrp = col
+    return {'code': code, 'cost': cost, 'msrp': msrp}
+
+
+def _encode(values):
+    """Encode an object array of str to a UTF-8 bytes array that sorts like the text"""
+    return np.array([value.encode('utf-8') for value in values], dtype=bytes)
+
+
+class CostIndex:
+    """Sorted cost/MSRP lookup table, usually memory-mapped from disk"""
+
+    FILES = ('int_keys', 'str_keys', 'codes', 'cost', 'msrp')
+
+    def __init__(self, int_keys, str_keys, codes, cost, msrp, meta):
+        # Rows are laid out numeric codes first (in int_keys order), then SKUs
+        self.int_keys = int_keys
+        self.str_keys = str_keys
+        self.codes = codes
+        self.cost = cost
+        self.msrp = msrp
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.int_keys) + len(self.str_keys)
+
+    @property
+    def has_cost(self):
+        return bool(self.meta.get('cost_column'))
+
+    @property
+    def has_msrp(self):
+        return bool(self.meta.get('msrp_column'))
+
+    @classmethod
+    def from_frame(cls, df2, code_column, cost_column=None, msrp_column=None, source_digest=None):
+        """Build an index from an already loaded cost frame"""
+        int_keys, str_keys = code_keys(df2[code_column])
+        is_int = int_keys != MISSING_KEY
+        is_str = np.not_equal(str_keys, None)
+
+        # Stable sorts keep duplicate codes in file order, like a left merge does
+        int_rows = np.flatnonzero(is_int)
+        int_rows = int_rows[np.argsort(int_keys[int_rows], kind='stable')]
+        str_rows = np.flatnonzero(is_str)
+        encoded = _encode(str_keys[str_rows])
+        order = np.argsort(encoded, kind='stable')
+        str_rows = str_rows[order]
+        rows = np.concatenate([int_rows, str_rows])
+
+        def numeric(column):
+            if not column:
+                return np.full(len(rows), np.nan)
+            return pd.to_numeric(df2[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)[rows]
+
+        meta = {
+            'version': INDEX_VERSION,
+            'source_digest': source_digest,
+            'code_column': code_column,
+            'cost_column': cost_column,
+            'msrp_column': msrp_column,
+            'rows': int(len(rows)),
+        }
+        codes = _encode(clean_code_text(df2[code_column]).to_numpy(dtype=object)[rows])
+        return cls(int_keys[int_rows], encoded[order], codes, numeric(cost_column), numeric(msrp_column), meta)
+
+    def save(self, directory):
+        """Write the arrays and meta.json to directory, replacing it atomically"""
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.building-', dir=parent)
+        try:
+            for name in self.FILES:
+                np.save(os.path.join(staging, f'{name}.npy'), getattr(self, name))
+            with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+                json.dump(self.meta, handle)
+            try:
+                os.replace(staging, directory)
+            except OSError:
+                # Another process finished the same index first
+                if not os.path.isdir(directory):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a saved index; arrays are memory-mapped by default"""
+        with open(os.path.join(directory, 'meta.json')) as handle:
+            meta = json.load(handle)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Cost index version {meta.get('version')} is not supported")
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.FILES]
+        return cls(*arrays, meta)
+
+    def positions(self, int_keys, str_keys):
+        """
+        Match code keys (as returned by code_keys) against the index.
+
+        Returns (left, right): for every match, the position in the input
+        and the index row. Codes with several index rows appear once per row;
+        codes without a match get right == -1, as in a left merge.
+        """
+        n = len(int_keys)
+        lo = np.zeros(n, dtype='int64')
+        hi = np.zeros(n, dtype='int64')
+
+        # Numeric codes: binary search over the int64 keys
+        is_int = int_keys != MISSING_KEY
+        if is_int.any() and len(self.int_keys):
+            lo[is_int] = np.searchsorted(self.int_keys, int_keys[is_int], side='left')
+            hi[is_int] = np.searchsorted(self.int_keys, int_keys[is_int], side='right')
+
+        # SKUs: binary search over the byte string keys, after the numeric rows
+        is_str = np.not_equal(str_keys, None)
+        if is_str.any() and len(self.str_keys):
+            needles = _encode(str_keys[is_str])
+            offset = len(self.int_keys)
+            lo[is_str] = np.searchsorted(self.str_keys, needles, side='left') + offset
+            hi[is_str] = np.searchsorted(self.str_keys, needles, side='right') + offset
+
+        counts = hi - lo
+        repeats = np.maximum(counts, 1)
+        left = np.repeat(np.arange(n), repeats)
+        # Offset of each output row within its left row's run of matches
+        starts = np.cumsum(repeats) - repeats
+        offset = np.arange(len(left)) - np.repeat(starts, repeats)
+        right = np.where(np.repeat(counts, repeats) > 0, np.repeat(lo, repeats) + offset, -1)
+        return left, right
+
+    def merge(self, df, code_column):
+        """
+        Left-join COST and MSRP onto df by code_column.
+
+        Matches pd.merge(how='left') on the code keys: row order is kept and
+        a code listed several times in the cost file repeats the row. When df
+        has no 'Imported by Code' column the matched cost file code is added
+        under that name. Returns (merged, left) where left holds the position
+        in df of every merged row, for carrying per-row arrays along.
+        """
+        left, right = self.positions(*code_keys(df[code_column]))
+        merged = df.iloc[left].reset_index(drop=True)
+        matched = right >= 0
+        take = np.where(matched, right, 0)
+
+        def gather(values, fill):
+            if not len(values):
+                return np.full(len(right), fill)
+            out = np.asarray(values[take])
+            if out.dtype.kind == 'f':
+                out = np.where(matched, out, fill)
+            return out
+
+        if MERGED_CODE_COLUMN not in merged.columns:
+            codes = gather(self.codes, b'').astype(object)
+            codes = np.array([code.decode('utf-8') for code in codes], dtype=object)
+            codes[~matched] = np.nan
+            merged[MERGED_CODE_COLUMN] = codes
+        if self.has_cost:
+            merged['COST'] = gather(self.cost, np.nan)
+        if self.has_msrp:
+            merged['MSRP'] = gather(self.msrp, np.nan)
+        return merged, left
+
+
+def index_directory(cache_dir, digest, code_column, cost_column, msrp_column):
+    """Directory for one cost file + column selection"""
+    selection = json.dumps([code_column, cost_column, msrp_column])
+    selection_hash = hashlib.sha256(selection.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'cost_index', f'{digest}-{selection_hash}')
+
+
+def load_cost_index(cost_path, code_column, cost_column=None, msrp_column=None, cache_dir=None, digest=None,
+                    parse_cache=False):
+    """
+    Return the CostIndex for a cost file, building and saving it on first use.
+
+    digest may be passed when the caller already hashed the file. With
+    parse_cache the rows are read through core.parse_cache, so building an
+    index for another column selection of the same file skips the parse.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    digest = digest or file_digest(cost_path)
+    directory = index_directory(cache_dir, digest, code_column, cost_column, msrp_column)
+    if os.path.isdir(directory):
+        try:
+            return CostIndex.load(directory)
+        except (OSError, ValueError):
+            # Unreadable or stale index - rebuild it below
+            shutil.rmtree(directory, ignore_errors=True)
+
+    wanted = [col for col in (code_column, cost_column, msrp_column) if col]
+
+    def keep_columns(batch):
+        batch.columns = [str(col).strip() for col in batch.columns]
+        return batch[wanted]
+
+    if parse_cache:
+        df2 = keep_columns(read_cached(cost_path, cache_dir, digest)[0])
+    else:
+        df2 = read_excel_streaming(cost_path, transform=keep_columns)
+    index = CostIndex.from_frame(df2, code_column, cost_column, msrp_column, source_digest=digest)
+    try:
+        index.save(directory)
+        return CostIndex.load(directory)
+    except OSError:
+        # Read-only cache location: use the in-memory index for this run
+        return index
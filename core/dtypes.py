@@ -0,0 +1,97 @@
+"""
+Compact column dtypes for loaded exports.
+
+Text columns that repeat a few values (Brand, Parent, Color, Size, ...)
+become categoricals. Float columns that only hold whole numbers become
+nullable integers, and integer columns get the smallest integer type that
+holds them. The values themselves do not change, so every stage computes
+the same results on a compacted frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+MB = 1024 * 1024
+
+INTEGER_TYPES = [('Int8', np.int8), ('Int16', np.int16), ('Int32', np.int32), ('Int64', np.int64)]
+
+
+def _nullable_integer(values):
+    """Smallest nullable integer dtype for a float column of whole numbers, None if it has fractions"""
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0 or not np.array_equal(finite, np.floor(finite)):
+        return None
+    low, high = finite.min(), finite.max()
+    for name, kind in INTEGER_TYPES:
+        info = np.iinfo(kind)
+        if info.min <= low and high <= info.max:
+            return name
+    return None
+
+
+def compact_dtype(series):
+    """The compact dtype for a column, or None to leave it as it is"""
+    dtype = series.dtype
+    if len(series) == 0:
+        return None
+    if dtype == object:
+        distinct = series.nunique(dropna=True)
+        return 'category' if distinct <= CATEGORY_MAX_RATIO * len(series) else None
+    if pd.api.types.is_float_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return _nullable_integer(series.to_numpy())
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        smallest = pd.to_numeric(series, downcast='integer').dtype
+        return smallest if smallest != dtype else None
+    return None
+
+
+def compact_frame(df, keep=()):
+    """
+    Convert df's columns to compact dtypes in place, except the columns in keep.
+
+    Returns (df, report) where report has one entry per column with its
+    dtype and deep memory size before and after.
+    """
+    report = []
+    for col in df.columns.unique():
+        series = df[col]
+        if isinstance(series, pd.DataFrame) or col in keep:
+            continue
+        before = series.memory_usage(index=False, deep=True)
+        target = compact_dtype(series)
+        if target is not None:
+            df[col] = series.astype(target)
+        entry = {
+            'column': str(col),
+            'dtype_before': str(series.dtype),
+            'dtype_after': str(df[col].dtype),
+            'bytes_before': int(before),
+            'bytes_after': int(df[col].memory_usage(index=False, deep=True)) if target is not None else int(before),
+        }
+        report.append(entry)
+    return df, report
+
+
+def format_size(size):
+    return f"{size / MB:.1f} MB" if size >= MB else f"{size / 1024:.0f} KB"
+
+
+def report_totals(report):
+    """(bytes before, bytes after) over every column of a compact_frame report"""
+    return sum(entry['bytes_before'] for entry in report), sum(entry['bytes_after'] for entry in report)
+
+
+def report_lines(report, limit=None):
+    """Human-readable lines: the total, then each converted column by bytes saved"""
+    before, after = report_totals(report)
+    lines = [f"Memory: {format_size(before)} -> {format_size(after)}"]
+    changed = sorted((entry for entry in report if entry['dtype_before'] != entry['dtype_after']),
+                     key=lambda entry: entry['bytes_after'] - entry['bytes_before'])
+    for entry in changed[:limit]:
+        lines.append(f"{entry['column']}: {entry['dtype_before']} -> {entry['dtype_after']}, "
+                     f"{format_size(entry['bytes_before'])} -> {format_size(entry['bytes_after'])}")
+    if limit is not None and len(changed) > limit:
+        lines.append(f"... {len(changed) - limit} more columns")
+    return lines
@@ -0,0 +1,217 @@
+"""
+Opt-in timing and memory instrumentation for pipeline runs.
+
+An Instrumentation is a pipeline StageHook that records wall time, CPU
+time, rows in and out, and peak traced memory (tracemalloc) for every stage.
+The writer reports each formatting rule to it per chunk. Nothing is measured
+unless one is attached: stages run bare and the writer's rule timer is a
+shared no-op context.
+"""
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = 'excel_formatter.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+REPORT_SUFFIX = '_metrics.json'
+MB = 1024 * 1024
+
+_NO_TIMER = nullcontext()
+
+
+def no_timer(name, rows=None):
+    """Rule timer used when instrumentation is off"""
+    return _NO_TIMER
+
+
+def configure_file_log(path=LOG_FILE, level=logging.INFO):
+    """Send log records to path and stdout, as main.py does, unless logging is already set up"""
+    logging.basicConfig(
+        level=level,
+        format=LOG_FORMAT,
+        handlers=[logging.FileHandler(path), logging.StreamHandler()],
+    )
+
+
+def report_path(output_path):
+    """<output without extension>_metrics.json"""
+    return os.path.splitext(output_path)[0] + REPORT_SUFFIX
+
+
+class StageHook:
+    """Base class for observers of a pipeline run; override either method"""
+
+    def stage_started(self, name, state):
+        pass
+
+    def stage_finished(self, name, state, seconds):
+        pass
+
+
+class Measurement:
+    """Accumulated cost of one stage or formatting rule"""
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_bytes = 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_mb': self.peak_bytes / MB,
+        }
+
+    def merge(self, data):
+        """Add a to_dict() result from another process (e.g. a shard writer)"""
+        self.calls += data['calls']
+        self.seconds += data['seconds']
+        self.cpu_seconds += data['cpu_seconds']
+        if data['rows_in'] is not None:
+            self.rows_in = (self.rows_in or 0) + data['rows_in']
+        if data['rows_out'] is not None:
+            self.rows_out = (self.rows_out or 0) + data['rows_out']
+        self.peak_bytes = max(self.peak_bytes, int(data['peak_mb'] * MB))
+
+
+class Instrumentation(StageHook):
+    """
+    Collects Measurements for a run.
+
+    Peak memory is the tracemalloc peak while the stage or rule ran, so it
+    counts Python-level allocations (pandas and NumPy buffers included) but
+    not memory-mapped files. trace_memory=False records time and rows only.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.measurements = {}
+        self._started_tracing = False
+        # Peaks of the enclosing measurements while a nested one runs
+        self._peaks = []
+        self._stage = None
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        self.finished = time.time()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _get(self, name, kind):
+        key = (kind, name)
+        if key not in self.measurements:
+            self.measurements[key] = Measurement(name, kind)
+        return self.measurements[key]
+
+    def _enter(self):
+        if tracemalloc.is_tracing():
+            # Fold the enclosing peak so far into its record, then measure this one alone
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._peaks.append(0)
+        return time.perf_counter(), time.process_time()
+
+    def _exit(self, measurement, started):
+        wall, cpu = started
+        measurement.calls += 1
+        measurement.seconds += time.perf_counter() - wall
+        measurement.cpu_seconds += time.process_time() - cpu
+        peak = self._peaks.pop()
+        if tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            measurement.peak_bytes = max(measurement.peak_bytes, peak)
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+
+    @contextmanager
+    def measure(self, name, kind='rule', rows=None):
+        measurement = self._get(name, kind)
+        if rows is not None:
+            measurement.rows_in = (measurement.rows_in or 0) + rows
+        started = self._enter()
+        try:
+            yield measurement
+        finally:
+            self._exit(measurement, started)
+
+    def rule(self, name, rows=None):
+        """Context manager timing one formatting rule over one chunk"""
+        return self.measure(name, 'rule', rows)
+
+    def stage_started(self, name, state):
+        measurement = self._get(name, 'stage')
+        measurement.rows_in = len(state.df) if state.df is not None else None
+        self._stage = (measurement, self._enter())
+
+    def stage_finished(self, name, state, seconds):
+        measurement, started = self._stage
+        self._exit(measurement, started)
+        measurement.rows_out = len(state.df) if state.df is not None else None
+
+    def merge(self, records):
+        """Fold in measurements recorded in another process"""
+        for data in records:
+            self._get(data['name'], data['kind']).merge(data)
+
+    def records(self, kind=None):
+        return [m.to_dict() for m in self.measurements.values() if kind is None or m.kind == kind]
+
+    def to_dict(self):
+        stages = self.records('stage')
+        return {
+            'started': self.started,
+            'finished': self.finished,
+            'total_seconds': sum(stage['seconds'] for stage in stages),
+            'peak_mb': max([stage['peak_mb'] for stage in stages], default=0.0),
+            'trace_memory': self.trace_memory,
+            'stages': stages,
+            'rules': sorted(self.records('rule'), key=lambda rule: -rule['seconds']),
+        }
+
+    def summary_lines(self, top_rules=5):
+        """Short human-readable lines: one per stage, then the slowest rules"""
+        lines = []
+        for stage in self.records('stage'):
+            rows = f", {stage['rows_out']:,} rows" if stage['rows_out'] is not None else ''
+            memory = f", peak {stage['peak_mb']:.0f} MB" if self.trace_memory else ''
+            lines.append(f"{stage['name']}: {stage['seconds']:.2f}s (CPU {stage['cpu_seconds']:.2f}s{rows}{memory})")
+        for rule in self.to_dict()['rules'][:top_rules]:
+            lines.append(f"rule {rule['name']}: {rule['seconds']:.2f}s ({rule['calls']} calls)")
+        return lines
+
+    def save(self, path):
+        with open(path, 'w') as handle:
+            json.dump(self.to_dict(), handle, indent=2)
+        return path
+
+    def log(self, output_path=None):
+        header = f"Timings for {os.path.basename(output_path)}" if output_path else "Timings"
+        logger.info(header)
+        for line in self.summary_lines(top_rules=len(self.measurements)):
+            logger.info("  %s", line)
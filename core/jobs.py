@@ -0,0 +1,188 @@
+"""
+Background jobs for the web API.
+
+Each job gets its own scratch directory and runs in a bounded pool of worker
+processes, so a large upload never ties up a request and two uploads with
+the same file name never share files. Callers poll the job for its status
+and result, and may cancel it: a queued job never starts, a running one
+stops at its next cancellation check (see core.cancel). A cancelled job's
+directory is removed as soon as it stops.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core.cancel import CancelToken, Cancelled
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+DEFAULT_QUEUE_DEPTH = 8
+DEFAULT_JOB_TTL = 3600  # seconds a finished job and its files are kept
+CANCEL_MARKER = '.cancel'
+PROGRESS_FILE = '.progress.json'
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the waiting queue is full"""
+
+
+class Job:
+    """One submitted unit of work and its scratch directory"""
+
+    def __init__(self, job_id, directory):
+        self.id = job_id
+        self.directory = directory
+        # Passed to the job function; cancelling creates a marker file the worker process sees
+        self.cancel_token = CancelToken(os.path.join(directory, CANCEL_MARKER))
+        # Where the job function publishes its progress (core.progress.ProgressChannel)
+        self.progress_path = os.path.join(directory, PROGRESS_FILE)
+        self.future = None
+        self.created = time.time()
+        self.finished_at = None
+
+    @property
+    def status(self):
+        if self.future is None or not (self.future.running() or self.future.done()):
+            return QUEUED
+        if not self.future.done():
+            return RUNNING
+        if self.future.cancelled() or isinstance(self.future.exception(), Cancelled):
+            return CANCELLED
+        return FAILED if self.future.exception() is not None else DONE
+
+    @property
+    def finished(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def result(self):
+        """Return value of the job function once it is DONE, else None"""
+        return self.future.result() if self.status == DONE else None
+
+    @property
+    def error(self):
+        return str(self.future.exception()) if self.status == FAILED else None
+
+    def _on_done(self, future):
+        self.finished_at = time.time()
+        if self.status == CANCELLED:
+            # Drop the uploads and any partial output right away
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Run jobs in a pool of max_workers processes with up to max_queued more
+    waiting. Finished jobs are removed, with their directory, after ttl
+    seconds.
+    """
+
+    def __init__(self, root_dir, max_workers=None, max_queued=DEFAULT_QUEUE_DEPTH, ttl=DEFAULT_JOB_TTL):
+        self.root_dir = root_dir
+        self.max_workers = max_workers or max(1, min(4, os.cpu_count() or 1))
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            try:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError):
+                # No process support (e.g. some serverless hosts) - use threads instead
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    def pending(self):
+        """Number of jobs that are queued or running"""
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def create_job(self):
+        """Reserve a queue slot and a fresh scratch directory for a new job"""
+        with self.lock:
+            self._prune()
+            if self.pending() >= self.max_workers + self.max_queued:
+                raise QueueFullError(
+                    f"Too many jobs in progress ({self.max_workers} running, {self.max_queued} waiting). "
+                    "Try again shortly."
+                )
+            job_id = uuid.uuid4().hex
+            directory = os.path.join(self.root_dir, job_id)
+            os.makedirs(directory)
+            job = Job(job_id, directory)
+            self.jobs[job_id] = job
+            return job
+
+    def submit(self, job, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) for a job from create_job"""
+        try:
+            job.future = self._get_executor().submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. ran out of memory); start a fresh pool
+            self.executor = None
+            job.future = self._get_executor().submit(fn, *args, **kwargs)
+        except (OSError, NotImplementedError):
+            # Worker processes could not be started - run jobs on threads instead
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            job.future = self.executor.submit(fn, *args, **kwargs)
+        job.future.add_done_callback(job._on_done)
+        return job
+
+    def complete(self, job, result):
+        """Finish a job from create_job with result without running anything (e.g. a cache hit)"""
+        job.future = Future()
+        job.future.add_done_callback(job._on_done)
+        job.future.set_running_or_notify_cancel()
+        job.future.set_result(result)
+        return job
+
+    def cancel(self, job):
+        """Ask a job to stop; returns False if it had already finished"""
+        if job.finished:
+            return False
+        job.cancel_token.cancel()
+        if job.future is not None:
+            # Succeeds only while the job is still queued
+            job.future.cancel()
+        return True
+
+    def discard(self, job):
+        """Drop a job that was never submitted"""
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self.jobs[job_id]
+                shutil.rmtree(job.directory, ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
@@ -0,0 +1,234 @@
+"""
+Column-oriented Profit / ROI / margin calculations.
+
+Every metric is computed from NumPy arrays in a single pass over the frame.
+The scalar helpers below define the parsing rules; object columns are parsed
+once per unique value with those same helpers so results match the old
+row-wise functions exactly, including the 'No Buybox' and '' sentinels.
+"""
+
+import numpy as np
+import pandas as pd
+
+BUYBOX_COLUMNS = ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180']
+METRIC_COLUMNS = ['Profit', 'ROI', 'Profit Margin (Buybox)', 'Profit Margin (MSRP)', 'MSRP Difference']
+BUYBOX_SOURCE_COLUMN = 'Buy Box Source'
+
+DEFAULT_PACK_FEE = 7.0
+DEFAULT_REFERRAL_FEE = 0.15
+NO_BUYBOX = 'No Buybox'
+
+
+def clean_price(val):
+    """Clean price values - handle strings, floats, and edge cases"""
+    if val is None or val == '' or val == 0:
+        return None
+
+    if isinstance(val, str):
+        # Remove currency symbols and whitespace
+        val = val.replace('$', '').replace(',', '').strip()
+        if val == '' or val == '0':
+            return None
+
+    try:
+        cleaned_val = float(val)
+        return cleaned_val if cleaned_val > 0 else None
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_pack_fee(val):
+    """Return the Pick & Pack fee for a cell, defaulting to 7.00"""
+    try:
+        if pd.notna(val) and val != '':
+            return float(val)
+    except (ValueError, TypeError):
+        pass
+    return DEFAULT_PACK_FEE
+
+
+def parse_referral_fee(val):
+    """Return the referral fee as a fraction, accepting 0.17, 17 or '17.00%'"""
+    try:
+        if pd.notna(val) and str(val).strip() != '':
+            val = str(val).replace('%', '').strip()
+            if float(val) > 1:  # If number is like 17.00
+                return float(val) / 100
+            return float(val)  # If number is like 0.17
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return DEFAULT_REFERRAL_FEE
+
+
+def parse_cost(val):
+    """Return the COST value as a float, 0 when it cannot be parsed"""
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _price_or_nan(val):
+    """clean_price with None mapped to NaN"""
+    price = clean_price(val)
+    return np.nan if price is None else price
+
+
+def _numeric_values(series):
+    """Return a float64 array for numeric columns, None for anything else"""
+    if pd.api.types.is_numeric_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.to_numpy(dtype='float64', na_value=np.nan)
+    return None
+
+
+def _map_unique(series, parser, na_value):
+    """Parse each unique value once with a scalar parser and broadcast back"""
+    codes, uniques = pd.factorize(series)
+    parsed = np.empty(len(uniques) + 1, dtype='float64')
+    parsed[:-1] = [parser(value) for value in uniques]
+    parsed[-1] = na_value  # code -1 marks missing values
+    return parsed[codes]
+
+
+def price_values(df, column):
+    """Vectorized clean_price: positive prices, NaN where clean_price returns None"""
+    n = len(df)
+    if column not in df.columns:
+        return np.full(n, np.nan)
+    series = df[column]
+    values = _numeric_values(series)
+    if values is None:
+        values = _map_unique(series, _price_or_nan, np.nan)
+    return np.where(values > 0, values, np.nan)
+
+
+def pack_fee_values(df, column='Pick & Pack'):
+    """Vectorized parse_pack_fee"""
+    n = len(df)
+    if column not in df.columns:
+        return np.full(n, DEFAULT_PACK_FEE)
+    series = df[column]
+    values = _numeric_values(series)
+    if values is None:
+        return _map_unique(series, parse_pack_fee, DEFAULT_PACK_FEE)
+    return np.where(np.isnan(values), DEFAULT_PACK_FEE, values)
+
+
+def referral_fee_values(df, column='Referral Fee &'):
+    """Vectorized parse_referral_fee"""
+    n = len(df)
+    if column not in df.columns:
+        return np.full(n, DEFAULT_REFERRAL_FEE)
+    series = df[column]
+    values = _numeric_values(series)
+    if values is None:
+        return _map_unique(series, parse_referral_fee, DEFAULT_REFERRAL_FEE)
+    values = np.where(np.isnan(values), DEFAULT_REFERRAL_FEE, values)
+    return np.where(values > 1, values / 100, values)
+
+
+def cost_values(df, column='COST'):
+    """Vectorized parse_cost - missing column means a cost of 0"""
+    n = len(df)
+    if column not in df.columns:
+        return np.zeros(n)
+    series = df[column]
+    values = _numeric_values(series)
+    if values is not None:
+        return values
+    values = _map_unique(series, parse_cost, np.nan)
+    # factorize folds every missing value together, but float(None), float(pd.NA)
+    # and float(pd.NaT) fail and become 0 while float(nan) stays nan
+    raw = series.to_numpy(dtype=object)
+    missing = pd.isna(raw)
+    if missing.any():
+        values[missing] = [parse_cost(value) for value in raw[missing]]
+    return values
+
+
+def _round2(values):
+    """np.round(values, 2) with Python's round() used for near-halfway values"""
+    rounded = np.round(values, 2)
+    with np.errstate(invalid='ignore'):
+        scaled = values * 100
+        halfway = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if halfway.any():
+        rounded[halfway] = [round(float(v), 2) for v in values[halfway]]
+    return rounded
+
+
+def _with_sentinel(values, keep, sentinel):
+    """Build an object column holding floats where keep is True, sentinel elsewhere"""
+    out = np.full(len(values), sentinel, dtype=object)
+    out[keep] = values[keep].tolist()
+    return out
+
+
+def buybox_source_counts(source):
+    """Count rows per Buy Box column in a BUYBOX_SOURCE_COLUMN categorical; rows with no price go under NO_BUYBOX"""
+    counts = {column: 0 for column in BUYBOX_COLUMNS}
+    counts.update({str(column): int(count) for column, count in source.value_counts().items()})
+    counts[NO_BUYBOX] = int(source.isna().sum())
+    return counts
+
+
+def compute_metrics(df):
+    """
+    Compute Profit, ROI, both Profit Margins and MSRP Difference for every row.
+
+    Returns a DataFrame aligned to df.index with METRIC_COLUMNS plus
+    BUYBOX_SOURCE_COLUMN, a categorical naming the Buy Box column that each
+    row's price came from (NaN when no Buy Box price was usable).
+    """
+    n = len(df)
+    cost = cost_values(df)
+    pack_fee = pack_fee_values(df)
+    referral_fee = referral_fee_values(df)
+    msrp = price_values(df, 'MSRP')
+
+    # Walk Buy Box -> 30 -> 90 -> 180 backwards so the first valid column wins
+    buybox = np.full(n, np.nan)
+    source = np.full(n, -1, dtype='int8')
+    for idx in range(len(BUYBOX_COLUMNS) - 1, -1, -1):
+        prices = price_values(df, BUYBOX_COLUMNS[idx])
+        valid = ~np.isnan(prices)
+        buybox = np.where(valid, prices, buybox)
+        source[valid] = idx
+
+    has_buybox = ~np.isnan(buybox)
+    has_msrp = ~np.isnan(msrp)
+    total_cost = cost + pack_fee
+    keep_rate = 1 - referral_fee
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Profit falls back to MSRP, then to -cost when no price exists
+        revenue_base = np.where(has_buybox, buybox, msrp)
+        has_price = has_buybox | has_msrp
+        profit = np.where(has_price, _round2(revenue_base * keep_rate - total_cost), -total_cost)
+        profit_is_number = has_price | (total_cost != 0) | np.isnan(total_cost)
+
+        roi = (profit / cost) * 100
+        roi_keep = profit_is_number & (cost > 0) & (roi != np.inf)
+
+        margin_buybox = ((buybox * keep_rate - total_cost) / buybox) * 100
+        margin_buybox_keep = has_buybox & (margin_buybox != np.inf)
+
+        margin_msrp = ((msrp * keep_rate - total_cost) / msrp) * 100
+        margin_msrp_keep = has_msrp & (margin_msrp != np.inf)
+
+        msrp_difference = buybox - msrp
+
+    margin_buybox_out = _with_sentinel(_round2(margin_buybox), margin_buybox_keep, '')
+    margin_buybox_out[~has_buybox] = NO_BUYBOX
+
+    msrp_difference_out = _with_sentinel(msrp_difference, has_msrp & has_buybox, '')
+    msrp_difference_out[has_msrp & ~has_buybox] = NO_BUYBOX
+
+    return pd.DataFrame({
+        'Profit': _with_sentinel(profit, profit_is_number, ''),
+        'ROI': _with_sentinel(roi, roi_keep, ''),
+        'Profit Margin (Buybox)': margin_buybox_out,
+        'Profit Margin (MSRP)': _with_sentinel(_round2(margin_msrp), margin_msrp_keep, ''),
+        'MSRP Difference': msrp_difference_out,
+        BUYBOX_SOURCE_COLUMN: pd.Categorical.from_codes(source, BUYBOX_COLUMNS),
+    }, index=df.index)
@@ -0,0 +1,222 @@
+"""
+Columnar cache of parsed workbooks.
+
+Parsing xlsx is the slowest fixed cost of a run, and the same export is
+often re-run with other costs or a corrected cost file. The first sheet of a
+parsed workbook is saved as Parquet under <cache>/parsed, named after the
+file's SHA-256 and the reader's PARSER_VERSION, and later reads of the same
+file load it from there. Files are evicted least recently used first once
+the directory grows past its size budget.
+
+Object columns may mix text, numbers, booleans and dates, which Parquet
+cannot hold in one column, so each is stored as a type tag per row plus one
+typed column per kind of value. On load every value comes back as the
+Python str, int, float, bool or datetime it was; missing values come back
+as NaN, which is how the reader leaves them.
+
+Needs pyarrow; without it every read parses the workbook.
+"""
+
+import datetime
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from core.cache import default_cache_dir, evict_lru, file_digest, size_budget, touch
+from core.reader import PARSER_VERSION, read_excel_streaming
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAX_BYTES_ENV_VAR = 'SCOUT_PARSE_CACHE_MB'
+DEFAULT_MAX_MB = 2048
+METADATA_KEY = b'scout_parse_cache'
+
+# Row tags for object columns; missing values come back as NaN
+MISSING, TEXT, INTEGER, FLOAT, BOOLEAN, DATETIME = range(6)
+VALUE_TAGS = {str: TEXT, int: INTEGER, float: FLOAT, bool: BOOLEAN, datetime.datetime: DATETIME}
+TAG_TYPES = {TEXT: pa.string(), INTEGER: pa.int64(), FLOAT: pa.float64(), BOOLEAN: pa.bool_(),
+             DATETIME: pa.timestamp('us')} if pa is not None else {}
+PLAIN_KINDS = 'fiubM'  # float, int, unsigned, bool and datetime64 columns are stored as they are
+
+
+class UnsupportedFrame(ValueError):
+    """The frame holds a value or column name the cache cannot round-trip"""
+
+
+def available():
+    return pa is not None
+
+
+def cache_directory(cache_dir=None):
+    return os.path.join(cache_dir or default_cache_dir(), 'parsed')
+
+
+def entry_path(cache_dir, digest):
+    return os.path.join(cache_directory(cache_dir), f'{digest}-p{PARSER_VERSION}-f{FORMAT_VERSION}.parquet')
+
+
+def max_cache_bytes():
+    """Size budget: $SCOUT_PARSE_CACHE_MB, else 2 GB"""
+    return size_budget(MAX_BYTES_ENV_VAR, DEFAULT_MAX_MB)
+
+
+def _encode_object(values):
+    """Split an object column into (row tags, {tag: typed arrow array})"""
+    n = len(values)
+    tags = np.zeros(n, dtype='int8')
+    for row, value in enumerate(values):
+        tag = VALUE_TAGS.get(type(value))
+        if tag is None:
+            if value is None or value is pd.NaT:
+                continue
+            raise UnsupportedFrame(f"Cannot cache a {type(value).__name__} value")
+        if tag == FLOAT and value != value:
+            continue  # NaN
+        tags[row] = tag
+    arrays = {}
+    for tag in np.unique(tags):
+        if tag == MISSING:
+            continue
+        mask = tags == tag
+        column = np.where(mask, values, None)
+        try:
+            arrays[int(tag)] = pa.array(column, type=TAG_TYPES[tag], from_pandas=False)
+        except (pa.ArrowInvalid, OverflowError) as e:
+            raise UnsupportedFrame(str(e))
+    return tags, arrays
+
+
+def _decode_object(tags, arrays):
+    """Rebuild an object column as Python str, int, float, bool and datetime values"""
+    values = np.full(len(tags), np.nan, dtype=object)
+    for tag, array in arrays.items():
+        mask = tags == tag
+        if tag == DATETIME:
+            typed = np.array(array.to_pylist(), dtype=object)
+        else:
+            # Rows of other kinds are null here; fill them so ints and bools keep their type,
+            # then box every value as the Python scalar openpyxl returns, not a NumPy one
+            typed = array.fill_null(False if tag == BOOLEAN else '' if tag == TEXT else 0).to_numpy()
+            typed = typed.astype(object)
+        values[mask] = typed[mask]
+    return values
+
+
+def frame_to_table(df):
+    """Arrow table for a parsed frame, with its column names and layout in the schema metadata"""
+    names = list(df.columns)
+    if not all(isinstance(name, str) for name in names):
+        raise UnsupportedFrame("Column names must be text")
+    fields = {}
+    layout = []  # per column: None if stored as is, else the value tags it holds
+    for idx in range(len(names)):
+        series = df.iloc[:, idx]
+        dtype = series.dtype
+        if dtype == object:
+            tags, arrays = _encode_object(series.to_numpy())
+            fields[f'c{idx}'] = pa.array(tags)
+            for tag, array in arrays.items():
+                fields[f'c{idx}.{tag}'] = array
+            layout.append(sorted(arrays))
+        elif dtype.kind in PLAIN_KINDS and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            fields[f'c{idx}'] = pa.array(series.to_numpy(), from_pandas=False)
+            layout.append(None)
+        else:
+            raise UnsupportedFrame(f"Cannot cache a {dtype} column")
+    meta = {'columns': names, 'dtypes': [str(dtype) for dtype in df.dtypes], 'layout': layout, 'rows': len(df)}
+    table = pa.table(fields)
+    return table.replace_schema_metadata({METADATA_KEY: json.dumps(meta).encode('utf-8')})
+
+
+def table_to_frame(table):
+    meta = json.loads(table.schema.metadata[METADATA_KEY])
+    data = {}
+    for idx, (tags, dtype) in enumerate(zip(meta['layout'], meta['dtypes'])):
+        column = table.column(f'c{idx}')
+        if tags is None:
+            data[idx] = column.to_numpy().astype(dtype, copy=False)
+        else:
+            data[idx] = _decode_object(column.to_numpy(), {tag: table.column(f'c{idx}.{tag}') for tag in tags})
+    df = pd.DataFrame(data, index=pd.RangeIndex(meta['rows']))
+    df.columns = meta['columns']
+    return df
+
+
+def _metadata(path):
+    return json.loads(pq.read_schema(path).metadata[METADATA_KEY])
+
+
+def evict(cache_dir=None, max_bytes=None, keep=None):
+    """Delete least recently used entries until the cache fits max_bytes; never deletes keep"""
+    evict_lru(cache_directory(cache_dir), max_cache_bytes() if max_bytes is None else max_bytes, keep)
+
+
+def store(df, path, cache_dir=None):
+    """Save df at path (atomically) and evict old entries; returns False if df cannot be cached"""
+    try:
+        table = frame_to_table(df)
+    except UnsupportedFrame as e:
+        logger.info("Not caching parsed workbook: %s", e)
+        return False
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    evict(cache_dir, keep=path)
+    return True
+
+
+def read_cached(file_path, cache_dir=None, digest=None, cancel=None):
+    """
+    The first sheet of file_path as read_excel_streaming returns it, from the cache when possible.
+
+    Returns (df, hit). A miss parses the workbook (checking the optional
+    CancelToken between batches) and saves the frame for next time.
+    """
+    if pa is None:
+        return read_excel_streaming(file_path, cancel=cancel), False
+    path = entry_path(cache_dir, digest or file_digest(file_path))
+    if touch(path):
+        try:
+            return table_to_frame(pq.read_table(path)), True
+        except Exception as e:
+            # Truncated or foreign file; parse again and overwrite it
+            logger.warning("Ignoring unreadable parse cache entry %s: %s", path, e)
+    df = read_excel_streaming(file_path, cancel=cancel)
+    try:
+        store(df, path, cache_dir)
+    except OSError as e:
+        logger.warning("Could not save parse cache entry %s: %s", path, e)
+    return df, False
+
+
+def cached_sheet_info(file_path, cache_dir=None, digest=None):
+    """(column names, data row count) from a cached parse of file_path, None when it is not cached"""
+    if pa is None:
+        return None
+    path = entry_path(cache_dir, digest or file_digest(file_path))
+    if not touch(path):
+        return None
+    try:
+        meta = _metadata(path)
+    except Exception:
+        return None
+    return meta['columns'], meta['rows']
@@ -0,0 +1,624 @@
+"""
+Headless processing pipeline shared by the desktop app and the web API.
+
+A run is a fixed sequence of stages - ingest, clean, merge, aggregate,
+metrics, sort and write (clean comes after merge for the desktop profile) -
+that pass a PipelineState along. Each stage is a plain function of
+(state, options), so a caller can swap one out (e.g. to cache it or run it
+elsewhere) and hooks can observe when each stage starts and finishes.
+Nothing here touches Tk or Flask.
+"""
+
+import gc
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from core.cleaning import problematic_row_mask
+from core.cancel import CancelToken, Cancelled, check
+from core.codes import clean_code_columns
+from core.cost_index import CostIndex, detect_cost_columns, load_cost_index, read_sheet_info
+from core.dtypes import compact_frame, report_lines
+from core.instrumentation import Instrumentation, report_path
+from core.metrics import (BUYBOX_SOURCE_COLUMN, DEFAULT_PACK_FEE, DEFAULT_REFERRAL_FEE, METRIC_COLUMNS,
+                          buybox_source_counts, compute_metrics)
+from core.parse_cache import read_cached
+from core.progress import ProgressChannel
+from core.reader import read_excel_streaming
+from core.writer import FORMAT_PROFILES, write_formatted_excel
+
+logger = logging.getLogger(__name__)
+
+# Scout export header -> output column name. Exports have used both the
+# 'Buy Box 🚚:' and the plain 'Buy Box :' spelling, so both are mapped.
+HEADER_MAP = {
+    'Brand': 'Brand',
+    'Parent ASIN': 'Parent',
+    'ASIN': 'ASIN',
+    'Product Codes: UPC': 'UPC',
+    'Product Codes: EAN': 'EAN',
+    'Product Codes: GTIN': 'GTIN',
+    'Imported by Code': 'Imported by Code',
+    'Title': 'Title',
+    'Color': 'Color',
+    'Size': 'Size',
+    'Bought in past month': 'Sales Badge',
+    'Reviews: Rating Count': 'Rating Count',
+    'Reviews: Review Count - Format Specific': 'Rating - Child',
+    'Sales Rank: Current': 'Sales Rank',
+    'Sales Rank: 30 days avg.': 'Sales Rank 30',
+    'Sales Rank: 90 days avg.': 'Sales Rank 90',
+    'Sales Rank: 180 days avg.': 'Sales Rank 180',
+    'Buy Box 🚚: Current': 'Buy Box',
+    'Buy Box 🚚: 30 days avg.': 'Buy Box 30',
+    'Buy Box 🚚: 90 days avg.': 'Buy Box 90',
+    'Buy Box 🚚: 180 days avg.': 'Buy Box 180',
+    'Buy Box : Current': 'Buy Box',
+    'Buy Box : 30 days avg.': 'Buy Box 30',
+    'Buy Box : 90 days avg.': 'Buy Box 90',
+    'Buy Box : 180 days avg.': 'Buy Box 180',
+    'Amazon: 90 days OOS': 'AMZ In Stock %',
+    'Buy Box: % Amazon 90 days': 'Buy Box: % Amazon 90 days',
+    'Amazon: Availability of the Amazon offer': 'Amazon Availability',
+    'Count of retrieved live offers: New, FBA': 'FBA',
+    'Count of retrieved live offers: New, FBM': 'FBM',
+    'FBA Pick&Pack Fee': 'Pick & Pack',
+    'Referral Fee %': 'Referral Fee &',
+}
+
+DROPPED_COLUMNS = ['Locale', 'Image']
+# Main file columns tried, in order, for matching against the cost file
+MAIN_CODE_COLUMNS = ['Imported by Code', 'UPC', 'EAN', 'GTIN']
+SORT_COLUMNS = ['Parent', 'Color', 'Size']
+TEXT_PERCENT_COLUMNS = ['AMZ In Stock %', 'Buy Box: % Amazon 90 days']
+# Left alone by compact mode: codes are matched as text, the fee columns are
+# rewritten as float64 and the percent columns are written as their text
+COMPACT_KEPT_COLUMNS = MAIN_CODE_COLUMNS + ['ASIN', 'Pick & Pack', 'Referral Fee &'] + TEXT_PERCENT_COLUMNS
+
+STAGES = ('ingest', 'clean', 'merge', 'aggregate', 'metrics', 'sort', 'write')
+# Stage order per format profile. The desktop app drops problematic rows after
+# the cost merge, so merged COST/MSRP and 'Imported by Code' count towards a row
+PROFILE_STAGES = {
+    'desktop': ('ingest', 'merge', 'clean', 'aggregate', 'metrics', 'sort', 'write'),
+    'web': STAGES,
+}
+# Overall progress at the start of the first, second, ... stage
+STAGE_FRACTIONS = (0.2, 0.3, 0.4, 0.5, 0.6, 0.75, 0.8)
+STAGE_TEXT = {
+    'ingest': "Preparing data...",
+    'clean': "Cleaning data...",
+    'merge': "Merging cost data...",
+    'aggregate': "Calculating totals...",
+    'metrics': "Calculating profits...",
+    'sort': "Sorting rows...",
+    'write': "Saving to Excel...",
+}
+WRITE_PROGRESS_SPAN = 0.15
+# Bump whenever the formatted output for the same inputs and options changes; it keys the result cache
+ENGINE_VERSION = 1
+
+
+@dataclass
+class PipelineOptions:
+    """Settings for one run; profile picks the output formatting (see core.writer)"""
+    profile: str = 'desktop'
+    shipping_cost: float = 0.0
+    misc_cost: float = 0.0
+    chunk_size: int = 1000
+    fill_mode: str = 'cells'
+    layout: str = 'cells'
+    # Convert the export to categorical / small integer dtypes after loading (see core.dtypes)
+    compact: bool = False
+    # Main file column to match on (export or output name); None auto-detects
+    main_code_column: Optional[str] = None
+    # Cost index and parse cache root; None uses core.cache.default_cache_dir()
+    cache_dir: Optional[str] = None
+    # Read workbooks through the parsed-workbook cache (see core.parse_cache)
+    parse_cache: bool = False
+    # Record per-stage and per-rule timings (see core.instrumentation)
+    instrument: bool = False
+    trace_memory: bool = True
+
+
+@dataclass
+class CostSource:
+    """A cost/MSRP file and the columns to use from it; unset columns are auto-detected"""
+    path: str
+    columns: List[str]
+    code_column: Optional[str] = None
+    cost_column: Optional[str] = None
+    msrp_column: Optional[str] = None
+    digest: Optional[str] = None
+    # Already built index, e.g. shared by every file of a batch
+    index: Optional[CostIndex] = None
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        """Read only the header of path to describe it"""
+        columns, _ = read_sheet_info(path)
+        return cls(path, columns, **kwargs)
+
+    def mapping(self):
+        return detect_cost_columns(self.columns, self.code_column, self.cost_column, self.msrp_column)
+
+    def load_index(self, cache_dir=None, parse_cache=False):
+        if self.index is None:
+            mapping = self.mapping()
+            self.index = load_cost_index(self.path, mapping['code'], mapping['cost'], mapping['msrp'],
+                                         cache_dir=cache_dir, digest=self.digest, parse_cache=parse_cache)
+        return self.index
+
+
+@dataclass
+class GroupCodes:
+    """Integer codes per row for Parent and (Parent, Color); None when the columns are missing"""
+    parent: Optional[np.ndarray] = None
+    parent_color: Optional[np.ndarray] = None
+    parents: int = 0
+    parent_colors: int = 0
+
+    def take(self, order):
+        """The codes for rows reordered by order"""
+        return GroupCodes(
+            self.parent[order] if self.parent is not None else None,
+            self.parent_color[order] if self.parent_color is not None else None,
+            self.parents,
+            self.parent_colors,
+        )
+
+
+@dataclass
+class PipelineState:
+    """Everything the stages read and produce during one run"""
+    main: Union[str, pd.DataFrame]
+    save_path: str
+    # SHA-256 of the main file when the caller already has it (e.g. hashed while uploading)
+    main_digest: Optional[str] = None
+    cost: Optional[CostSource] = None
+    progress: Optional[Callable[[float, str], None]] = None
+    events: Optional[ProgressChannel] = None
+    cancel: Optional[CancelToken] = None
+    stage: Optional[str] = None
+    df: Optional[pd.DataFrame] = None
+    rows_in: int = 0
+    rows_dropped: int = 0
+    # Rows written; a code listed twice in the cost file writes its row twice
+    rows_out: int = 0
+    main_code_column: Optional[str] = None
+    matched_rows: Optional[int] = None
+    groups: Optional[GroupCodes] = None
+    best_colors: Optional[np.ndarray] = None
+    # Column name -> rows whose blank value was filled with the default
+    assumptions: Dict[str, np.ndarray] = field(default_factory=dict)
+    # Per-column dtypes and memory before/after compact mode
+    memory_report: Optional[List[Dict]] = None
+    buybox_source: Optional[pd.Series] = None
+    # Rows priced from each Buy Box column (see core.metrics.buybox_source_counts); kept after the run
+    buybox_counts: Optional[Dict[str, int]] = None
+    output_path: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    instrumentation: Optional[Instrumentation] = None
+    metrics_path: Optional[str] = None
+
+    def report(self, fraction, text, rows_done=None, rows_total=None):
+        if self.progress is not None:
+            self.progress(fraction, text)
+        if self.events is not None:
+            self.events.push(self.stage, fraction, text, rows_done, rows_total)
+
+
+def output_name(column):
+    """Output name of a main file column given by its export or output name"""
+    return HEADER_MAP.get(column, column)
+
+
+def cost_column(df):
+    """'COST' from a merged cost file, else a main file 'Cost' column"""
+    return 'COST' if 'COST' in df.columns else 'Cost'
+
+
+def mark_assumptions(df, column, default):
+    """
+    Fill blank or zero values of column with default, keeping it float64.
+
+    Returns the boolean mask of filled rows, None when df has no such column.
+    """
+    if column not in df.columns:
+        return None
+    values = df[column]
+    empty_mask = (values.isna() | (values == '') | (values.astype(str) == '0')).to_numpy()
+    values = pd.to_numeric(values, errors='coerce').fillna(default).round(2).astype('float64')
+    values[empty_mask] = default
+    df[column] = values
+    return empty_mask
+
+
+def prepare_main_batch(df):
+    """Row-local cleanup of one batch of the main file"""
+    df.drop(columns=[col for col in DROPPED_COLUMNS if col in df.columns], inplace=True)
+    df.rename(columns=HEADER_MAP, inplace=True)
+    clean_code_columns(df)
+    return df
+
+
+def compact(df):
+    """Compact df's dtypes (export or output column names); returns (df, memory report)"""
+    keep = set(COMPACT_KEPT_COLUMNS)
+    keep.update(export for export, name in HEADER_MAP.items() if name in COMPACT_KEPT_COLUMNS)
+    return compact_frame(df, keep)
+
+
+def ingest(main, parse_cache=False, cache_dir=None, cancel=None, digest=None):
+    """
+    Load the main export (a path, or an already loaded frame) with headers mapped.
+
+    With parse_cache a path is read through core.parse_cache (digest, if
+    given, is its known SHA-256); cancel is checked between the batches read. Returns (df, pack_fee_assumed) where
+    pack_fee_assumed flags the blank Pick & Pack fees that were set to $7.
+    """
+    if isinstance(main, pd.DataFrame):
+        df = prepare_main_batch(main.copy())
+    elif parse_cache:
+        df = prepare_main_batch(read_cached(main, cache_dir, digest, cancel)[0])
+    else:
+        # Stream the file in batches, cleaning each batch as it is read
+        df = read_excel_streaming(main, transform=prepare_main_batch, cancel=cancel)
+    return df, mark_assumptions(df, 'Pick & Pack', DEFAULT_PACK_FEE)
+
+
+def clean(df):
+    """Drop unnamed columns and empty, mostly empty or code-less rows; returns (df, kept rows mask)"""
+    df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
+    keep = ~problematic_row_mask(df).to_numpy()
+    return df[keep], keep
+
+
+def find_main_code_column(df, preferred=None):
+    """The user's choice if present, else the first of MAIN_CODE_COLUMNS in df"""
+    if preferred and output_name(preferred) in df.columns:
+        return output_name(preferred)
+    return next((col for col in MAIN_CODE_COLUMNS if col in df.columns), None)
+
+
+def merge(df, cost_index, main_code_column):
+    """
+    Left-join COST and MSRP and keep only positive values.
+
+    Returns (df, rows) where rows maps each merged row to its row before the
+    merge, None when nothing was joined.
+    """
+    rows = None
+    if main_code_column is not None:
+        df, rows = cost_index.merge(df, main_code_column)
+    cost_col = cost_column(df)
+    if cost_col in df.columns:
+        cost = pd.to_numeric(df[cost_col], errors='coerce')
+        df[cost_col] = cost.where(cost > 0, 0)
+    if 'MSRP' in df.columns:
+        msrp = pd.to_numeric(df['MSRP'], errors='coerce')
+        df['MSRP'] = msrp.where(msrp > 0)
+    return df, rows
+
+
+def group_codes(df):
+    """
+    Factorize Parent and (Parent, Color) once, casting both columns to text.
+
+    Codes are numbered in sorted text order, so ordering rows by them orders
+    them by Parent, then Color.
+    """
+    groups = GroupCodes()
+    if 'Parent' not in df.columns:
+        return groups
+    df['Parent'] = df['Parent'].astype(str)
+    groups.parent, parents = pd.factorize(df['Parent'], sort=True)
+    groups.parents = len(parents)
+    if 'Color' in df.columns:
+        df['Color'] = df['Color'].astype(str)
+        color, colors = pd.factorize(df['Color'], sort=True)
+        pairs, uniques = pd.factorize(groups.parent.astype('int64') * len(colors) + color, sort=True)
+        groups.parent_color, groups.parent_colors = pairs, len(uniques)
+    return groups
+
+
+def group_sum(codes, values, groups):
+    """Per-group totals of values broadcast back to every row"""
+    return np.bincount(codes, weights=values, minlength=groups)[codes]
+
+
+def aggregate(df, groups, best_colors=True):
+    """
+    Add the Parent / Color rating totals from the group codes.
+
+    Returns (df, best_colors) where best_colors flags, row by row, the
+    Colors holding the most child ratings in their Parent (None when the
+    columns are missing or best_colors is False).
+    """
+    if groups.parent is not None and 'Rating Count' in df.columns:
+        count = pd.to_numeric(df['Rating Count'], errors='coerce').fillna(0).astype(int)
+        df['Rating Count'] = count
+        count = count.to_numpy(dtype='float64')
+        df['Total Parent Ratings'] = group_sum(groups.parent, count, groups.parents).astype('int64')
+        if groups.parent_color is not None:
+            df['Total Color Ratings'] = group_sum(groups.parent_color, count, groups.parent_colors).astype('int64')
+
+    flags = None
+    if groups.parent_color is not None and 'Rating - Child' in df.columns:
+        rating = pd.to_numeric(df['Rating - Child'], errors='coerce').fillna(0)
+        df['Rating - Child'] = rating
+        rating = rating.to_numpy(dtype='float64')
+        if best_colors:
+            # A Color is best when any of its rows has its Parent's top rating
+            top = np.full(groups.parents, -np.inf)
+            np.maximum.at(top, groups.parent, rating)
+            is_top = (rating == top[groups.parent]).astype('float64')
+            flags = group_sum(groups.parent_color, is_top, groups.parent_colors) > 0
+
+        # Sum of Rating - Child for each color of each Parent ASIN
+        df['Total Ratings Color'] = group_sum(groups.parent_color, rating, groups.parent_colors)
+
+    return df, flags
+
+
+def metrics(df, shipping_cost=0.0, misc_cost=0.0):
+    """
+    Add the landed cost, referral fee and the Profit / ROI / margin columns.
+
+    Returns (df, buybox_source, referral_fee_assumed) where buybox_source
+    names the Buy Box column each row's price came from and
+    referral_fee_assumed flags the blank referral fees that were set to 15%.
+    """
+    cost_col = cost_column(df)
+    if cost_col in df.columns:
+        df[cost_col] = pd.to_numeric(df[cost_col], errors='coerce').fillna(0) + shipping_cost + misc_cost
+
+    referral_fee_assumed = mark_assumptions(df, 'Referral Fee &', DEFAULT_REFERRAL_FEE)
+
+    # Keep the percent columns as the original text, blanks stay blank
+    for col in TEXT_PERCENT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).replace(['nan', 'NaN', 'None'], '')
+
+    df = df.reset_index(drop=True)
+    values = compute_metrics(df)
+    for col in METRIC_COLUMNS:
+        df[col] = values[col].to_numpy()
+    return df, values[BUYBOX_SOURCE_COLUMN].reset_index(drop=True), referral_fee_assumed
+
+
+def buybox_summary(counts):
+    """One line such as 'Buy Box 812, Buy Box 30 40, No Buybox 3' for a buybox_counts dict"""
+    return ", ".join(f"{column} {count:,}" for column, count in counts.items() if count)
+
+
+def sort(df, groups=None):
+    """
+    Order rows by Parent, Color, Size as text; returns (df, new position -> old position).
+
+    The Parent and (Parent, Color) codes from group_codes stand in for those
+    columns when given.
+    """
+    sort_cols = [col for col in SORT_COLUMNS if col in df.columns]
+    if not sort_cols:
+        return df, np.arange(len(df))
+    keys = {}
+    if groups is not None and groups.parent is not None:
+        keys['Parent'] = groups.parent
+        if groups.parent_color is not None:
+            keys['Color'] = groups.parent_color
+    for col in sort_cols:
+        if col not in keys:
+            df[col] = df[col].astype(str)
+            keys[col] = pd.factorize(df[col], sort=True)[0]
+    # lexsort is stable and takes the primary key last
+    order = np.lexsort([keys[col] for col in reversed(sort_cols)])
+    return df.take(order).reset_index(drop=True), order
+
+
+def write(df, save_path, options, best_colors=None, progress=None, instrumentation=None, parents=None,
+          assumptions=None, cancel=None):
+    """Write the formatted workbook; returns the path actually written"""
+    # Exports past Excel's row limit come back as a zip of workbooks
+    return write_formatted_excel(
+        df,
+        save_path,
+        profile=options.profile,
+        best_colors=best_colors,
+        chunk_size=options.chunk_size,
+        fill_mode=options.fill_mode,
+        layout=options.layout,
+        progress=progress,
+        instrumentation=instrumentation,
+        parents=parents,
+        assumptions=assumptions,
+        cancel=cancel,
+    )
+
+
+def run_ingest(state, options):
+    state.df, pack_fee_assumed = ingest(state.main, options.parse_cache, options.cache_dir, state.cancel,
+                                        state.main_digest)
+    state.rows_in = len(state.df)
+    if options.compact:
+        state.df, state.memory_report = compact(state.df)
+        for line in report_lines(state.memory_report):
+            logger.info("%s", line)
+    if pack_fee_assumed is not None:
+        state.assumptions['Pick & Pack'] = pack_fee_assumed
+
+
+def run_clean(state, options):
+    rows = len(state.df)
+    state.df, keep = clean(state.df)
+    state.rows_dropped = rows - len(state.df)
+    state.assumptions = {name: mask[keep] for name, mask in state.assumptions.items()}
+
+
+def run_merge(state, options):
+    if state.cost is None:
+        return
+    mapping = state.cost.mapping()
+    logger.debug("Cost file columns: code=%s, COST=%s, MSRP=%s", mapping['code'], mapping['cost'], mapping['msrp'])
+    if not mapping['code'] or not (mapping['cost'] or mapping['msrp']):
+        raise ValueError("Cost/MSRP file is missing a UPC/Imported by Code column or a COST/MSRP column.")
+
+    # Built once per cost file and column selection, then memory-mapped from disk
+    cost_index = state.cost.load_index(options.cache_dir, options.parse_cache)
+
+    state.main_code_column = find_main_code_column(state.df, options.main_code_column)
+    if state.main_code_column is None:
+        logger.warning("No matching code column found in main file; matching skipped. The main file needs an "
+                       "'Imported by Code' column (or UPC/EAN/GTIN as fallback).")
+    state.df, rows = merge(state.df, cost_index, state.main_code_column)
+    if rows is not None:
+        # Codes listed more than once in the cost file repeat their row
+        state.assumptions = {name: mask[rows] for name, mask in state.assumptions.items()}
+
+    if 'COST' in state.df.columns:
+        state.matched_rows = int(state.df['COST'].gt(0).sum())
+    elif 'MSRP' in state.df.columns:
+        state.matched_rows = int(state.df['MSRP'].notna().sum())
+    if state.main_code_column is not None:
+        logger.info("Matched %s of %d rows on '%s' against %d cost index rows",
+                    state.matched_rows, len(state.df), state.main_code_column, len(cost_index))
+
+
+def run_aggregate(state, options):
+    best_colors = FORMAT_PROFILES[options.profile]['best_colors']
+    state.groups = group_codes(state.df)
+    state.df, state.best_colors = aggregate(state.df, state.groups, best_colors=best_colors)
+
+
+def run_metrics(state, options):
+    state.df, state.buybox_source, referral_fee_assumed = metrics(state.df, options.shipping_cost, options.misc_cost)
+    state.buybox_counts = buybox_source_counts(state.buybox_source)
+    logger.info("Buy Box price sources: %s", buybox_summary(state.buybox_counts))
+    if referral_fee_assumed is not None:
+        state.assumptions['Referral Fee &'] = referral_fee_assumed
+
+
+def run_sort(state, options):
+    state.df, order = sort(state.df, state.groups)
+    if state.groups is not None:
+        state.groups = state.groups.take(order)
+    if state.buybox_source is not None:
+        state.buybox_source = state.buybox_source.iloc[order].reset_index(drop=True)
+    if state.best_colors is not None:
+        state.best_colors = state.best_colors[order]
+    state.assumptions = {name: mask[order] for name, mask in state.assumptions.items()}
+
+
+def run_write(state, options):
+    # write is the last stage in every order
+    start = STAGE_FRACTIONS[-1]
+    rows = state.rows_out = len(state.df)
+
+    def report(fraction, text):
+        state.report(start + fraction * WRITE_PROGRESS_SPAN, text, round(fraction * rows), rows)
+
+    parents = state.groups.parent if state.groups is not None else None
+    state.output_path = write(state.df, state.save_path, options, state.best_colors, report,
+                              state.instrumentation, parents, state.assumptions, state.cancel)
+
+
+def release_rows(state):
+    """Let the frame and every per-row array go now rather than when the caller drops the state"""
+    state.df = None
+    state.groups = state.best_colors = state.buybox_source = None
+    state.assumptions = {}
+    gc.collect()
+
+
+STAGE_FUNCTIONS = {
+    'ingest': run_ingest,
+    'clean': run_clean,
+    'merge': run_merge,
+    'aggregate': run_aggregate,
+    'metrics': run_metrics,
+    'sort': run_sort,
+    'write': run_write,
+}
+
+
+class Pipeline:
+    """
+    Run the processing stages in the format profile's order (PROFILE_STAGES).
+
+    stages may replace any entry of STAGE_FUNCTIONS with another callable
+    taking (state, options). hooks are core.instrumentation.StageHook
+    instances told about each stage; the wall time of every stage is also
+    kept in state.timings.
+    With options.instrument an Instrumentation is attached as well; its
+    report is saved as JSON next to the output and logged. Progress goes to
+    the progress callable as (fraction, text) and, with rows and timing, to
+    events, a core.progress.ProgressChannel. cancel, a
+    core.cancel.CancelToken, is checked before every stage and inside the
+    long ones; a cancelled run raises Cancelled and writes nothing.
+    """
+
+    def __init__(self, options=None, hooks=None, stages=None, progress=None, cancel=None, events=None):
+        self.options = options or PipelineOptions()
+        if self.options.profile not in FORMAT_PROFILES:
+            raise ValueError(f"Unknown format profile: {self.options.profile}")
+        self.hooks = list(hooks or [])
+        self.stages = dict(STAGE_FUNCTIONS)
+        self.order = PROFILE_STAGES[self.options.profile]
+        for name, fn in (stages or {}).items():
+            if name not in self.stages:
+                raise ValueError(f"Unknown pipeline stage: {name}")
+            self.stages[name] = fn
+        self.progress = progress
+        self.cancel = cancel
+        self.events = events
+
+    def run(self, main, save_path, cost=None, digest=None):
+        """
+        Process main (a path or frame) with an optional CostSource and write save_path.
+
+        digest is the SHA-256 of a main file the caller has already hashed.
+        """
+        state = PipelineState(main=main, save_path=save_path, main_digest=digest, cost=cost,
+                              progress=self.progress, events=self.events, cancel=self.cancel)
+        hooks = self.hooks
+        if self.options.instrument:
+            state.instrumentation = Instrumentation(trace_memory=self.options.trace_memory)
+            hooks = hooks + [state.instrumentation]
+            state.instrumentation.start()
+        try:
+            for fraction, name in zip(STAGE_FRACTIONS, self.order):
+                self.run_stage(name, state, hooks, fraction)
+        except Cancelled:
+            release_rows(state)
+            raise
+        finally:
+            if state.instrumentation is not None:
+                state.instrumentation.stop()
+        release_rows(state)
+
+        if state.instrumentation is not None:
+            state.metrics_path = state.instrumentation.save(report_path(state.output_path))
+            state.instrumentation.log(state.output_path)
+        return state
+
+    def run_stage(self, name, state, hooks, fraction):
+        check(state.cancel)
+        state.stage = name
+        state.report(fraction, STAGE_TEXT[name])
+        for hook in hooks:
+            hook.stage_started(name, state)
+        started = time.perf_counter()
+        self.stages[name](state, self.options)
+        state.timings[name] = time.perf_counter() - started
+        for hook in hooks:
+            hook.stage_finished(name, state, state.timings[name])
+
+
+def default_output_path(main_path, output_dir=None):
+    """<output_dir or main file's folder>/<main name>_formatted.xlsx"""
+    base_name = os.path.splitext(os.path.basename(main_path))[0]
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(main_path)), f'{base_name}_formatted.xlsx')
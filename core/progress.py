@@ -0,0 +1,130 @@
+"""
+Thread-safe progress channel between a pipeline run and its UI.
+
+The run pushes (stage, fraction, message, rows) events as often as it likes;
+push never blocks and only the latest event per stage is kept, so a slow or
+busy consumer never builds a backlog. The consumer drains the channel on its
+own schedule (a Tk timer, a streaming HTTP response) and gets at most one
+event per stage, each with the stage's rows/sec and ETA worked out from the
+rows done since the stage started.
+
+A channel given a path also publishes its newest event there as JSON (at
+most every PUBLISH_INTERVAL seconds, and whenever the stage changes), so
+another process - the web server streaming a job's progress - can follow a
+run happening in a worker process with read_progress().
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+PUBLISH_INTERVAL = 0.25
+
+
+@dataclass
+class ProgressEvent:
+    """Latest progress of one stage; fraction is of the whole run (0..1)"""
+    stage: str
+    fraction: float
+    message: str
+    seq: int
+    time: float
+    rows_done: Optional[int] = None
+    rows_total: Optional[int] = None
+    rows_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    def describe(self):
+        """The message with the throughput and ETA, when known"""
+        parts = [self.message]
+        if self.rows_per_second:
+            parts.append(f"{self.rows_per_second:,.0f} rows/s")
+        if self.eta_seconds is not None:
+            parts.append(f"ETA {format_duration(self.eta_seconds)}")
+        return " - ".join(parts)
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+class ProgressChannel:
+    """Latest ProgressEvent per stage, written by a worker and drained by a UI"""
+
+    def __init__(self, clock=time.monotonic, path=None):
+        self.clock = clock
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = {}  # stage -> newest event not drained yet
+        self.started = {}  # stage -> clock time of its first event
+        self.last = None
+        self.seq = 0
+        self.published = (None, None)  # (stage, clock time) of the last event written to path
+
+    def push(self, stage, fraction, message, rows_done=None, rows_total=None):
+        """Record progress; replaces any undrained event of the same stage"""
+        now = self.clock()
+        with self.lock:
+            started = self.started.setdefault(stage, now)
+            rate = eta = None
+            elapsed = now - started
+            if rows_done and elapsed > 0:
+                rate = rows_done / elapsed
+                if rows_total is not None:
+                    eta = max(rows_total - rows_done, 0) / rate
+            self.seq += 1
+            event = ProgressEvent(stage, fraction, message, self.seq, time.time(), rows_done, rows_total, rate, eta)
+            # Re-insert so drain() returns stages in the order they last moved
+            self.pending.pop(stage, None)
+            self.pending[stage] = event
+            self.last = event
+            if self.path is not None:
+                self._publish(event, now)
+        return event
+
+    def _publish(self, event, now):
+        stage, published = self.published
+        if stage == event.stage and now - published < PUBLISH_INTERVAL:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as handle:
+                json.dump(event.to_dict(), handle)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # e.g. the job folder was removed after a cancel
+            return
+        self.published = (event.stage, now)
+
+    def drain(self):
+        """The newest event of every stage that moved since the last drain, oldest first"""
+        with self.lock:
+            events = list(self.pending.values())
+            self.pending = {}
+        return events
+
+    def latest(self):
+        """The newest event overall, without draining"""
+        return self.last
+
+
+def read_progress(path):
+    """The last event a channel published to path, as a dict; None if there is none yet"""
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
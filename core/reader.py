@@ -0,0 +1,155 @@
+"""
+Streaming reader for Scout exports.
+
+Rows are pulled from a read-only openpyxl worksheet and handed out as typed
+DataFrame batches, so the whole workbook never has to sit in memory at once.
+"""
+
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from core.cancel import check
+
+DEFAULT_BATCH_SIZE = 20000
+# Bump whenever the frames read here change; it keys the parse cache (core.parse_cache)
+PARSER_VERSION = 2
+
+# Cell text pd.read_excel treats as missing by default
+NA_STRINGS = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+
+def header_names(values):
+    """Build column names the way pd.read_excel does: Unnamed: n and .1 suffixes"""
+    names = []
+    seen = {}
+    for idx, value in enumerate(values):
+        name = f"Unnamed: {idx}" if value is None or value == '' else value
+        if name in seen:
+            seen[name] += 1
+            candidate = f"{name}.{seen[name]}"
+            while candidate in seen:
+                seen[name] += 1
+                candidate = f"{name}.{seen[name]}"
+            seen[candidate] = 0
+            name = candidate
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def records_to_frame(records, columns):
+    """
+    Turn a list of row tuples into a typed DataFrame.
+
+    Empty cells and the NA strings pd.read_excel recognises become NaN.
+    Numeric text is left as text (pd.read_excel would convert it only when the
+    whole column is numeric), so a code column keeps the same values whatever
+    the batch size.
+    """
+    width = len(columns)
+    padded = [tuple(row) + (None,) * (width - len(row)) if len(row) < width else tuple(row[:width]) for row in records]
+    df = pd.DataFrame.from_records(padded, columns=columns)
+    for col in df.columns[df.dtypes == object]:
+        series = df[col]
+        missing = series.isna() | series.isin(NA_STRINGS)
+        if missing.all():
+            df[col] = np.nan
+            continue
+        if missing.any():
+            df[col] = series.where(~missing, np.nan)
+    return df.infer_objects()
+
+
+def _trim_row(row):
+    """Drop empty cells after the last value in a row"""
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ''):
+        end -= 1
+    return row[:end]
+
+
+def iter_excel_batches(file_path, batch_size=DEFAULT_BATCH_SIZE, sheet_name=None):
+    """
+    Yield DataFrame batches of at most batch_size rows from an xlsx sheet.
+
+    The first row is used as the header. Trailing empty rows are dropped, the
+    same as pd.read_excel, and a sheet without data yields one empty batch so
+    callers still see the columns.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        # Some exporters write a wrong dimension record; let openpyxl work it out
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+
+        header = _trim_row(next(rows, ()))
+        columns = header_names(header)
+
+        batch = []
+        pending_blank = []  # blank rows are only kept if data follows them
+        yielded = False
+        for row in rows:
+            row = _trim_row(row)
+            if not row:
+                pending_blank.append(row)
+                continue
+            if len(row) > len(columns):
+                # Data past the last header becomes Unnamed: n columns
+                columns = header_names(header + (None,) * (len(row) - len(header)))
+            if pending_blank:
+                batch.extend(pending_blank)
+                pending_blank = []
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield records_to_frame(batch, columns)
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield records_to_frame(batch, columns)
+    finally:
+        wb.close()
+
+
+def concat_batches(batches):
+    """
+    Concatenate reader batches, typing each column as one batch of every row would.
+
+    Each batch infers its dtypes from its own rows, so a column can be bool in
+    one batch and all-blank float in the next. Columns whose batches disagree
+    are joined as objects and inferred again.
+    """
+    columns = dict.fromkeys(col for batch in batches for col in batch.columns)
+    data = {}
+    for col in columns:
+        parts = [batch[col] if col in batch.columns else pd.Series(np.nan, index=batch.index) for batch in batches]
+        if len({part.dtype for part in parts}) == 1:
+            data[col] = pd.concat(parts, ignore_index=True)
+        else:
+            data[col] = pd.concat([part.astype(object) for part in parts], ignore_index=True).infer_objects()
+    return pd.DataFrame(data)
+
+
+def read_excel_streaming(file_path, batch_size=DEFAULT_BATCH_SIZE, transform=None, sheet_name=None, cancel=None):
+    """
+    Read an xlsx sheet batch by batch and concatenate the result.
+
+    transform, if given, is applied to each batch before it is kept, so
+    row-local cleaning runs while only one raw batch is in memory. cancel, a
+    core.cancel.CancelToken, is checked after every batch.
+    """
+    batches = []
+    with closing(iter_excel_batches(file_path, batch_size=batch_size, sheet_name=sheet_name)) as reader:
+        for batch in reader:
+            check(cancel)
+            batches.append(transform(batch) if transform is not None else batch)
+    if len(batches) == 1:
+        return batches[0]
+    return concat_batches(batches)
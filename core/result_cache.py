@@ -0,0 +1,119 @@
+"""
+Cache of formatted results keyed by inputs and settings.
+
+The same main and cost files are often submitted again with the same
+settings. A finished output is kept under <cache>/results, named after a
+hash of the main file's SHA-256, the cost file's SHA-256, every option that
+shapes the output, and the pipeline's ENGINE_VERSION and reader's
+PARSER_VERSION. A later identical request gets a hard link (or copy) of it
+instead of a run. Files are evicted least recently used first once the
+folder passes its size budget. Hits and misses are counted per ResultCache.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from dataclasses import asdict
+
+from core.cache import default_cache_dir, evict_lru, size_budget, touch
+from core.pipeline import ENGINE_VERSION
+from core.reader import PARSER_VERSION
+
+MAX_BYTES_ENV_VAR = 'SCOUT_RESULT_CACHE_MB'
+DEFAULT_MAX_MB = 1024
+# Outputs are a workbook, or a zip of workbooks past Excel's row limit
+RESULT_EXTENSIONS = ('.xlsx', '.zip')
+# Options that change how a run goes, not what it writes
+NEUTRAL_OPTIONS = ('cache_dir', 'parse_cache', 'instrument', 'trace_memory')
+
+
+def result_key(main_digest, cost_digest, options):
+    """Cache key for a run of PipelineOptions on a main file and an optional cost file (by SHA-256)"""
+    settings = {name: value for name, value in asdict(options).items() if name not in NEUTRAL_OPTIONS}
+    payload = {
+        'main': main_digest,
+        'cost': cost_digest,
+        'options': settings,
+        'engine': ENGINE_VERSION,
+        'parser': PARSER_VERSION,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def place(source, destination):
+    """Hard-link source to destination, copying where links are not possible"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+    return destination
+
+
+class ResultCache:
+    """Formatted outputs in <cache_dir>/results with an LRU size budget and hit/miss counters"""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.directory = os.path.join(cache_dir or default_cache_dir(), 'results')
+        self.max_bytes = size_budget(MAX_BYTES_ENV_VAR, DEFAULT_MAX_MB) if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def lookup(self, key):
+        """Path of the cached output for key, None on a miss; counts either way"""
+        for extension in RESULT_EXTENSIONS:
+            path = self.entry_path(key, extension)
+            if touch(path):
+                with self.lock:
+                    self.hits += 1
+                return path
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, output_path):
+        """Keep a finished output for key (atomically) and evict old entries; returns the cached path"""
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension not in RESULT_EXTENSIONS:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entry_path(key, extension)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # A link outlives the job folder output_path is in
+            place(output_path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        evict_lru(self.directory, self.max_bytes, keep=path)
+        return path
+
+    def stats(self):
+        """Counters and current size, e.g. for a status endpoint"""
+        entries = size = 0
+        try:
+            with os.scandir(self.directory) as listing:
+                for entry in listing:
+                    if entry.name.endswith(RESULT_EXTENSIONS):
+                        entries += 1
+                        size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else None,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+        }
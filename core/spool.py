@@ -0,0 +1,49 @@
+"""
+Upload spooling that hashes while it writes.
+
+Multipart uploads are streamed in bounded chunks straight into a spool file
+in the job's own folder, and the SHA-256 the caches key on (core.cache) is
+updated from the same chunks. Keeping an upload is then a rename, not a
+copy, and nothing has to read the file again to hash it.
+"""
+
+import hashlib
+import os
+import tempfile
+
+SPOOL_PREFIX = 'upload-'
+SPOOL_SUFFIX = '.part'
+
+
+class SpoolFile:
+    """Readable, writable spool file in directory; hashes everything written to it"""
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix=SPOOL_PREFIX, suffix=SPOOL_SUFFIX)
+        self.handle = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        # Uploads are written once, front to back, so the running hash is the file's hash
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.handle.write(data)
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, flush, close, ... come from the file itself
+        return getattr(self.handle, name)
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    @property
+    def digest(self):
+        return self.sha256.hexdigest()
+
+    def keep(self, path):
+        """Close the spool and move it to path; returns the SHA-256 of its contents"""
+        self.handle.close()
+        os.replace(self.path, path)
+        self.path = path
+        return self.digest
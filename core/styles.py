@@ -0,0 +1,87 @@
+"""
+Interned cell styles for the formatted workbooks.
+
+Every (fill color, number format) combination the writer emits is
+registered once per workbook. That gives one cell style (a cellXfs entry)
+and its id, and each cell then just carries that id. Setting .fill, .border,
+.alignment and .number_format on every cell would make openpyxl hash and
+look up each style object again per cell. styles.xml only ever holds the
+predefined combinations, so its size no longer depends on the data.
+"""
+
+import weakref
+
+from openpyxl.cell.cell import Cell
+from openpyxl.styles import PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+
+
+class StyledCell(Cell):
+    """Write-only cell whose style id was resolved by a StyleRegistry"""
+
+    __slots__ = ('_style_id',)
+
+    @property
+    def style_id(self):
+        return self._style_id
+
+
+class StyleRegistry:
+    """
+    Cell styles for one workbook, keyed by (fill color, number format, bold).
+
+    All cells share the registry's alignment and border. Combinations that
+    were not predefined are added on first use.
+    """
+
+    def __init__(self, wb, alignment, border, header_font, fills=(), number_formats=()):
+        self.wb = wb
+        self.alignment_id = wb._alignments.add(alignment)
+        self.border_id = wb._borders.add(border)
+        self.header_font_id = wb._fonts.add(header_font)
+        self.styles = {}
+        for number_format in (None,) + tuple(number_formats):
+            for fill in (None,) + tuple(fills):
+                self.style(fill, number_format)
+
+    def _number_format_id(self, number_format):
+        if number_format is None:
+            return 0
+        if number_format in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[number_format]
+        return self.wb._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+
+    def style(self, fill=None, number_format=None, bold=False):
+        """(StyleArray, style id) for a combination, registering it if new"""
+        key = (fill, number_format, bold)
+        if key not in self.styles:
+            style = StyleArray()
+            style.alignmentId = self.alignment_id
+            style.borderId = self.border_id
+            if bold:
+                style.fontId = self.header_font_id
+            if fill is not None:
+                style.fillId = self.wb._fills.add(PatternFill(start_color=fill, end_color=fill, fill_type='solid'))
+            style.numFmtId = self._number_format_id(number_format)
+            self.styles[key] = (style, self.wb._cell_styles.add(style))
+        return self.styles[key]
+
+    def cell(self, ws, value, fill=None, number_format=None, bold=False):
+        """A write-only cell holding value with the interned style"""
+        style, style_id = self.styles.get((fill, number_format, bold)) or self.style(fill, number_format, bold)
+        cell = StyledCell(ws, column=1, row=1, value=value)
+        # Shared, never mutated: cells only read their style when serialized
+        cell._style = style
+        cell._style_id = style_id
+        return cell
+
+
+_registries = weakref.WeakKeyDictionary()
+
+
+def style_registry(wb, alignment, border, header_font, fills=(), number_formats=()):
+    """The workbook's StyleRegistry, created on first use"""
+    if wb not in _registries:
+        _registries[wb] = StyleRegistry(wb, alignment, border, header_font, fills, number_formats)
+    return _registries[wb]
@@ -0,0 +1,752 @@
+"""
+Single-pass, constant-memory Excel writer.
+
+Rows are streamed into a write-only openpyxl workbook with their final number
+formats, fills, comments, alignment and borders already attached, so the
+output is serialized exactly once and never reloaded for formatting. Cell
+styles are interned per workbook (core.styles), so styles.xml holds one
+entry per (fill, number format) combination whatever the row count.
+
+With fill_mode='rules' the value-driven color bands (Sales Rank, margins,
+MSRP Difference, Amazon Availability, ...) are written as a few worksheet
+conditional formatting rules per column instead of a fill on every cell.
+
+With layout='sheet' the data row height is the sheet's default row height and
+each column carries its alignment, border and number format as a column
+style, so rows are written without a height and blank cells that would only
+repeat the column style are left out.
+
+A core.cancel.CancelToken passed to the writer is checked before every chunk
+of rows, every conditional formatting rule and every shard. A cancelled
+write leaves nothing behind: unsaved workbooks drop their temp files and
+shard workbooks already written are deleted.
+"""
+
+import math
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.comments import Comment
+from openpyxl.formatting.rule import FormulaRule, Rule
+from openpyxl.styles.differential import DifferentialStyle
+from openpyxl.styles import PatternFill, Alignment, Border, Side, Font
+from openpyxl.utils import get_column_letter
+
+from core.cancel import check
+from core.instrumentation import Instrumentation, no_timer
+from core.styles import style_registry
+
+SHEET_TITLE = 'Sheet1'
+MAX_EXCEL_ROWS = 1048576
+MAX_DATA_ROWS = MAX_EXCEL_ROWS - 1  # one row is taken by the header
+HEADER_ROW_HEIGHT = 55
+DATA_ROW_HEIGHT = 50
+COLUMN_WIDTH = 15
+
+COMMA_FORMAT = '#,##0'
+CURRENCY_FORMAT = '$#,##0.00'
+NUMBER_FORMAT = '#,##0.00'
+TEXT_FORMAT = '@'
+MSRP_DIFF_FORMAT = '0.00'
+DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+
+SALES_RANK_COLUMNS = ['Sales Rank', 'Sales Rank 30', 'Sales Rank 90', 'Sales Rank 180']
+PROFIT_MARGIN_COLUMNS = ['Profit Margin (Buybox)', 'Profit Margin (MSRP)']
+
+GREEN = '90EE90'
+ORANGE = 'FFD580'
+RED = 'FFB6B6'
+AMAZON_RED = 'FF6666'
+PACK_FEE_ORANGE = 'FFA500'
+PARENT_BAND_COLORS = ['FFF7CE', 'DCE6F1']  # light orange, light blue
+
+NO_MATCH_COMMENT = 'No matching UPC found in cost file'
+BEST_COLOR_COMMENT = 'This color has the most ratings for this Parent ASIN'
+PACK_FEE_ASSUMPTION_COMMENT = 'Assumption: Default value of 7.00 used'
+REFERRAL_FEE_ASSUMPTION_COMMENT = 'Assumption: Default value of 0.15 (15%) used'
+ASSUMPTION_COMMENTS = [('Pick & Pack', PACK_FEE_ASSUMPTION_COMMENT),
+                       ('Referral Fee &', REFERRAL_FEE_ASSUMPTION_COMMENT)]
+# Profiles without the assumption fill show assumed values as e.g. '7.00*ASSUMPTION*'
+ASSUMPTION_MARKER = '*ASSUMPTION*'
+
+FILL_COLORS = [GREEN, ORANGE, RED, AMAZON_RED, PACK_FEE_ORANGE] + PARENT_BAND_COLORS
+CELL_NUMBER_FORMATS = [COMMA_FORMAT, CURRENCY_FORMAT, NUMBER_FORMAT, TEXT_FORMAT, MSRP_DIFF_FORMAT, DATETIME_FORMAT]
+
+# 'cells' attaches a fill to every colored cell, 'rules' writes conditional formatting
+FILL_MODES = ('cells', 'rules')
+# 'cells' sets row heights and styles on every row and cell, 'sheet' uses sheet and column defaults
+LAYOUT_MODES = ('cells', 'sheet')
+
+# The desktop app and web API have always formatted slightly differently;
+# each profile keeps its frontend's output unchanged.
+FORMAT_PROFILES = {
+    'desktop': {
+        'currency_columns': ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180', 'Pack Fee', 'Profit', 'COST', 'MSRP'],
+        'pack_fee_column': 'Pack Fee',
+        'pack_fee_color': PACK_FEE_ORANGE,
+        'parent_bands': True,
+        'best_colors': True,
+        'missing_cost': True,
+        'assumptions': True,
+    },
+    'web': {
+        'currency_columns': ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180', 'Pick & Pack', 'Profit', 'COST', 'MSRP'],
+        'pack_fee_column': 'Pick & Pack',
+        'pack_fee_color': ORANGE,
+        'parent_bands': False,
+        'best_colors': False,
+        'missing_cost': False,
+        'assumptions': False,
+    },
+}
+
+
+def solid_fill(color):
+    """Solid PatternFill for a hex color"""
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+def column_number_formats(columns, profile):
+    """Map column name -> number format for every column with a fixed format"""
+    formats = {}
+    for name in SALES_RANK_COLUMNS + ['Total Parent Ratings', 'Total Color Ratings']:
+        formats[name] = COMMA_FORMAT
+    for name in profile['currency_columns']:
+        formats[name] = CURRENCY_FORMAT
+    for name in ['ROI'] + PROFIT_MARGIN_COLUMNS:
+        formats[name] = NUMBER_FORMAT
+    for name in ['UPC', 'AMZ In Stock %', 'Buy Box: % Amazon 90 days']:
+        formats[name] = TEXT_FORMAT
+    return {name: fmt for name, fmt in formats.items() if name in columns}
+
+
+def to_cell_value(value):
+    """Convert a DataFrame value to what pandas' to_excel would leave in the cell"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if math.isinf(value):
+            return 'inf' if value > 0 else '-inf'
+        return value
+    if isinstance(value, str):
+        return value if value != '' else None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):  # numpy scalar
+        return to_cell_value(value.item())
+    return value
+
+
+# Per-cell rules. Each returns a fill color (or None) for one cell value and
+# mirrors the checks the old load/format/save pass ran on the reloaded sheet.
+
+def sales_rank_color(value):
+    if value is None or value == '' or value == 0:
+        return None
+    try:
+        rank = int(value)
+    except (ValueError, TypeError):
+        return None
+    if 0 < rank <= 150000:
+        return GREEN
+    if 150001 <= rank <= 500000:
+        return ORANGE
+    if rank >= 500001:
+        return RED
+    return None
+
+
+def amazon_availability_color(value):
+    text = str(value).lower() if value else ''
+    if 'no amazon offer exists' in text:
+        return GREEN
+    if 'amazon offer is in stock and shippable' in text:
+        return AMAZON_RED
+    if value and str(value).strip():
+        return ORANGE
+    return None
+
+
+def sales_badge_color(value):
+    return GREEN if value not in (None, '', 0) else None
+
+
+def msrp_difference_color(value):
+    if isinstance(value, (int, float)):
+        return RED if value < -0.05 else GREEN
+    if value == 'No Buybox':
+        return RED
+    return None
+
+
+def profit_margin_color(value):
+    if value == 'No Buybox':
+        return RED
+    if value is None or value == '':
+        return None
+    try:
+        margin = float(value)
+    except (ValueError, TypeError):
+        return None
+    if margin < 12:
+        return RED
+    if 12 <= margin <= 20:
+        return ORANGE
+    if margin > 20:
+        return GREEN
+    return None
+
+
+def is_seven_dollars(value):
+    try:
+        return float(str(value).replace('$', '').replace(',', '')) == 7.0
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+# Conditional formatting equivalents of the rules above. Each takes the
+# top-left cell of the range (e.g. 'D2') and returns rules in priority order.
+# Formulas guard with ISNUMBER/ISBLANK because cell-value rules treat blank
+# cells as 0 and text as larger than any number.
+
+def _formula(color, formula):
+    return FormulaRule(formula=[formula], fill=solid_fill(color), stopIfTrue=True)
+
+
+def _contains_text(color, cell, text):
+    rule = Rule(type='containsText', operator='containsText', text=text,
+                dxf=DifferentialStyle(fill=solid_fill(color)), stopIfTrue=True)
+    rule.formula = [f'NOT(ISERROR(SEARCH("{text}",{cell})))']
+    return rule
+
+
+def sales_rank_rules(cell):
+    return [
+        _formula(GREEN, f'AND(ISNUMBER({cell}),TRUNC({cell})>=1,TRUNC({cell})<=150000)'),
+        _formula(ORANGE, f'AND(ISNUMBER({cell}),TRUNC({cell})>=150001,TRUNC({cell})<=500000)'),
+        _formula(RED, f'AND(ISNUMBER({cell}),TRUNC({cell})>=500001)'),
+    ]
+
+
+def amazon_availability_rules(cell):
+    return [
+        _contains_text(GREEN, cell, 'no amazon offer exists'),
+        _contains_text(AMAZON_RED, cell, 'amazon offer is in stock and shippable'),
+        _formula(ORANGE, f'AND(LEN(TRIM({cell}))>0,{cell}<>0)'),
+    ]
+
+
+def sales_badge_rules(cell):
+    return [_formula(GREEN, f'AND(NOT(ISBLANK({cell})),{cell}<>0)')]
+
+
+def msrp_difference_rules(cell):
+    return [
+        _formula(RED, f'OR(AND(ISNUMBER({cell}),{cell}<-0.05),EXACT({cell},"No Buybox"))'),
+        _formula(GREEN, f'ISNUMBER({cell})'),
+    ]
+
+
+def profit_margin_rules(cell):
+    return [
+        _formula(RED, f'OR(EXACT({cell},"No Buybox"),AND(ISNUMBER({cell}),{cell}<12))'),
+        _formula(ORANGE, f'AND(ISNUMBER({cell}),{cell}>=12,{cell}<=20)'),
+        _formula(GREEN, f'AND(ISNUMBER({cell}),{cell}>20)'),
+    ]
+
+
+def seven_dollar_rules(color):
+    return lambda cell: [_formula(color, f'AND(ISNUMBER({cell}),{cell}=7)')]
+
+
+def missing_cost_rules(cell):
+    return [_formula(RED, f'OR(ISBLANK({cell}),AND(ISNUMBER({cell}),{cell}=0))')]
+
+
+def missing_msrp_rules(cell):
+    return [_formula(RED, f'ISBLANK({cell})')]
+
+
+class FormattedSheetWriter:
+    """Stream a DataFrame into a formatted worksheet one chunk of rows at a time"""
+
+    def __init__(self, df, profile='desktop', best_colors=None, parent_bands=None, fill_mode='cells',
+                 instrumentation=None, layout='cells', assumptions=None, cancel=None):
+        if fill_mode not in FILL_MODES:
+            raise ValueError(f"Unknown fill mode: {fill_mode}")
+        if layout not in LAYOUT_MODES:
+            raise ValueError(f"Unknown layout: {layout}")
+        self.df = df
+        self.profile = FORMAT_PROFILES[profile]
+        self.use_rules = fill_mode == 'rules'
+        self.sheet_defaults = layout == 'sheet'
+        # One flag per row: the row's Color has the most ratings in its Parent
+        self.best_colors = best_colors
+        # Column name -> one flag per row for values filled in with a default
+        self.assumptions = assumptions or {}
+        self.columns = [str(col) for col in df.columns]
+        self.column_index = {}
+        for idx, name in enumerate(self.columns):
+            self.column_index.setdefault(name, idx)
+        self.number_formats = column_number_formats(self.column_index, self.profile)
+
+        thin = Side(border_style="thin", color="000000")
+        self.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        self.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        self.header_font = Font(bold=True)
+        self.parent_bands = parent_bands
+        # Times every rule per chunk when instrumented, a no-op otherwise
+        self.timer = instrumentation.rule if instrumentation is not None else no_timer
+        self.cancel = cancel
+
+    def styles(self, wb):
+        """The workbook's style registry, with every fill/format combination predefined"""
+        return style_registry(wb, self.alignment, self.border, self.header_font,
+                              FILL_COLORS, CELL_NUMBER_FORMATS)
+
+    def prepare_parent_bands(self):
+        """Alternate the Parent fill by order of first appearance across the whole sheet"""
+        if self.parent_bands is None and self.profile['parent_bands'] and 'Parent' in self.column_index:
+            self.parent_bands = parent_codes(self.df) % 2
+
+    def header_cells(self, ws):
+        styles = self.styles(ws.parent)
+        return [styles.cell(ws, name, bold=True) for name in self.columns]
+
+    def chunk_styles(self, start, values):
+        """Work out per-cell fills, comments, formats and value overrides for one chunk"""
+        n = len(values[0]) if values else 0
+        fills = [None] * len(values)
+        comments = [None] * len(values)
+        formats = [None] * len(values)
+        index = self.column_index
+        timer = self.timer
+
+        def set_fills(name, rule):
+            if name in index and not self.use_rules:
+                with timer(name, n):
+                    col = values[index[name]]
+                    fills[index[name]] = [rule(v) for v in col]
+
+        profile = self.profile
+        assumed = []
+        for name, text in ASSUMPTION_COMMENTS:
+            if name in index and self.assumptions.get(name) is not None:
+                assumed.append((index[name], self.assumptions[name][start:start + n], text))
+        if not profile['assumptions']:
+            for j, flagged, _ in assumed:
+                with timer(f'{self.columns[j]} assumptions', n):
+                    values[j] = [f'{v:.2f}{ASSUMPTION_MARKER}' if f else v for f, v in zip(flagged, values[j])]
+
+        pack_col = profile['pack_fee_column']
+        if pack_col in index and not self.use_rules:
+            with timer(pack_col, n):
+                color = profile['pack_fee_color']
+                fills[index[pack_col]] = [color if is_seven_dollars(v) else None for v in values[index[pack_col]]]
+
+        for name in SALES_RANK_COLUMNS:
+            set_fills(name, sales_rank_color)
+        set_fills('Amazon Availability', amazon_availability_color)
+        set_fills('Sales Badge', sales_badge_color)
+
+        if 'MSRP Difference' in index:
+            with timer('MSRP Difference', n):
+                j = index['MSRP Difference']
+                if not self.use_rules:
+                    fills[j] = [msrp_difference_color(v) for v in values[j]]
+                formats[j] = [MSRP_DIFF_FORMAT if isinstance(v, (int, float)) else None for v in values[j]]
+
+        if self.parent_bands is not None:
+            with timer('Parent bands', n):
+                j = index['Parent']
+                bands = self.parent_bands[start:start + n]
+                fills[j] = [PARENT_BAND_COLORS[b] for b in bands]
+
+        if profile['best_colors'] and self.best_colors is not None and 'Color' in index:
+            with timer('Best colors', n):
+                j = index['Color']
+                best = self.best_colors[start:start + n]
+                fills[j] = [GREEN if b else None for b in best]
+                comments[j] = [BEST_COLOR_COMMENT if b else None for b in best]
+
+        if profile['missing_cost']:
+            with timer('Missing cost', n):
+                if 'COST' in index:
+                    j = index['COST']
+                    missing = [v is None or v == '' or v == 0 for v in values[j]]
+                    if not self.use_rules:
+                        fills[j] = [RED if m else None for m in missing]
+                    comments[j] = [NO_MATCH_COMMENT if m else None for m in missing]
+                if 'MSRP' in index:
+                    j = index['MSRP']
+                    missing = [v is None or v == '' for v in values[j]]
+                    if not self.use_rules:
+                        fills[j] = [RED if m else None for m in missing]
+                    comments[j] = [NO_MATCH_COMMENT if m else None for m in missing]
+
+        if profile['assumptions']:
+            for j, flagged, text in assumed:
+                with timer(f'{self.columns[j]} assumptions', n):
+                    fills[j] = [RED if f else old for f, old in zip(flagged, fills[j] or [None] * n)]
+                    comments[j] = [text if f else None for f in flagged]
+
+        for name in PROFIT_MARGIN_COLUMNS:
+            set_fills(name, profit_margin_color)
+
+        return fills, comments, formats
+
+    def conditional_rules(self):
+        """(column name, rule builder) pairs used when fill_mode is 'rules'"""
+        profile = self.profile
+        rules = [(profile['pack_fee_column'], seven_dollar_rules(profile['pack_fee_color']))]
+        rules += [(name, sales_rank_rules) for name in SALES_RANK_COLUMNS]
+        rules += [('Amazon Availability', amazon_availability_rules),
+                  ('Sales Badge', sales_badge_rules),
+                  ('MSRP Difference', msrp_difference_rules)]
+        if profile['missing_cost']:
+            rules += [('COST', missing_cost_rules), ('MSRP', missing_msrp_rules)]
+        rules += [(name, profit_margin_rules) for name in PROFIT_MARGIN_COLUMNS]
+        return [(name, build) for name, build in rules if name in self.column_index]
+
+    def add_conditional_formatting(self, ws, last_row):
+        """Attach the color rules to each column's data range (rows 2..last_row)"""
+        if last_row < 2:
+            return
+        for name, build in self.conditional_rules():
+            check(self.cancel)
+            letter = get_column_letter(self.column_index[name] + 1)
+            for rule in build(f'{letter}2'):
+                ws.conditional_formatting.add(f'{letter}2:{letter}{last_row}', rule)
+
+    def data_cells(self, ws, row_values, i, fills, comments, formats, styles):
+        cells = []
+        for j, value in enumerate(row_values):
+            fmt = formats[j][i] if formats[j] is not None else None
+            if fmt is None:
+                fmt = self.number_formats.get(self.columns[j])
+                if fmt is None and hasattr(value, 'year'):
+                    fmt = DATETIME_FORMAT
+            fill = fills[j][i] if fills[j] is not None else None
+            comment = comments[j][i] if comments[j] is not None else None
+            if (value is None and fill is None and comment is None and self.sheet_defaults
+                    and fmt == self.number_formats.get(self.columns[j])):
+                # Left to the column style
+                cells.append(None)
+                continue
+            cell = styles.cell(ws, value, fill, fmt)
+            if comment is not None:
+                cell.comment = Comment(comment, 'System')
+            cells.append(cell)
+        return cells
+
+    def write_sheet(self, wb, title=SHEET_TITLE, chunk_size=1000, progress=None):
+        """Stream every row of the frame into a new sheet of a write-only workbook"""
+        ws = wb.create_sheet(title)
+        ws.freeze_panes = 'A2'
+        for idx, name in enumerate(self.columns, 1):
+            dimension = ws.column_dimensions[get_column_letter(idx)]
+            dimension.width = COLUMN_WIDTH
+            if self.sheet_defaults:
+                dimension.alignment = self.alignment
+                dimension.border = self.border
+                if name in self.number_formats:
+                    dimension.number_format = self.number_formats[name]
+        if self.sheet_defaults:
+            ws.sheet_format.defaultRowHeight = DATA_ROW_HEIGHT
+            ws.sheet_format.customHeight = True
+
+        self.prepare_parent_bands()
+
+        ws.row_dimensions[1].height = HEADER_ROW_HEIGHT
+        ws.append(self.header_cells(ws))
+        del ws.row_dimensions[1]
+
+        total_rows = len(self.df)
+        row_num = 2
+        timer = self.timer
+        styles = self.styles(wb)
+        row_heights = not self.sheet_defaults
+        for start in range(0, total_rows, chunk_size):
+            check(self.cancel)
+            block = self.df.iloc[start:start + chunk_size]
+            with timer('Cell values', len(block)):
+                values = [[to_cell_value(v) for v in block.iloc[:, j].to_numpy(dtype=object)]
+                          for j in range(len(self.columns))]
+            fills, comments, formats = self.chunk_styles(start, values)
+            with timer('Rows and styles', len(block)):
+                for i, row_values in enumerate(zip(*values)):
+                    if row_heights:
+                        # Row heights are written with the row, then dropped to keep memory flat
+                        ws.row_dimensions[row_num].height = DATA_ROW_HEIGHT
+                    ws.append(self.data_cells(ws, row_values, i, fills, comments, formats, styles))
+                    if row_heights:
+                        del ws.row_dimensions[row_num]
+                    row_num += 1
+
+            if progress is not None:
+                end_row = min(start + chunk_size, total_rows)
+                progress(end_row / total_rows, f"Writing rows: {end_row:,}/{total_rows:,}")
+
+        if self.use_rules:
+            with timer('Conditional formatting rules'):
+                self.add_conditional_formatting(ws, row_num - 1)
+
+    def write(self, save_path, chunk_size=1000, progress=None):
+        wb = Workbook(write_only=True)
+        try:
+            self.write_sheet(wb, SHEET_TITLE, chunk_size=chunk_size, progress=progress)
+        except Exception:
+            discard_workbook(wb)
+            raise
+        with self.timer('Save workbook'):
+            wb.save(save_path)
+
+
+def discard_workbook(wb):
+    """Delete the temp files of a write-only workbook that will not be saved"""
+    for ws in wb.worksheets:
+        writer = getattr(ws, '_writer', None)
+        if writer is not None:
+            writer.close()
+            writer.cleanup()
+            ws._writer = None
+
+
+def parent_codes(df, codes=None):
+    """
+    Integer code per row for the Parent value, numbered by first appearance.
+
+    codes, if given, is any integer labelling of the Parents (such as the
+    pipeline's group codes) and is renumbered without reading the column.
+    """
+    if codes is not None:
+        return pd.factorize(codes)[0]
+    if 'Parent' not in df.columns:
+        return np.zeros(len(df), dtype='int64')
+    parent = df.loc[:, 'Parent']
+    if isinstance(parent, pd.DataFrame):
+        parent = parent.iloc[:, 0]
+    values = [to_cell_value(v) for v in parent.to_numpy(dtype=object)]
+    codes, _ = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    return codes
+
+
+def plan_shards(df, max_rows=MAX_DATA_ROWS, parents=None):
+    """
+    Split row positions into (start, stop) ranges of at most max_rows rows.
+
+    Cuts are only made where the Parent value changes, so a Parent group is
+    never spread over two shards. parents optionally gives the Parent codes.
+    """
+    total_rows = len(df)
+    if total_rows <= max_rows:
+        return [(0, total_rows)]
+
+    codes = parents if parents is not None else parent_codes(df)
+    # Positions where a new Parent run begins
+    run_starts = np.flatnonzero(np.diff(codes, prepend=-1) != 0)
+
+    shards = []
+    start = 0
+    while total_rows - start > max_rows:
+        limit = start + max_rows
+        # Last run boundary that still fits in this shard
+        cut = run_starts[np.searchsorted(run_starts, limit, side='right') - 1]
+        if cut <= start:
+            raise ValueError(
+                f"Parent group starting at row {start + 2:,} has more than {max_rows:,} rows "
+                "and cannot fit in a single sheet."
+            )
+        shards.append((start, int(cut)))
+        start = int(cut)
+    shards.append((start, total_rows))
+    return shards
+
+
+def shard_assumptions(assumptions, start, stop):
+    """The assumption masks for rows start..stop of a shard"""
+    return {name: mask[start:stop] for name, mask in (assumptions or {}).items()}
+
+
+def shard_path(save_path, number):
+    base, ext = os.path.splitext(save_path)
+    return f"{base}_part{number:02d}{ext}"
+
+
+def remove_files(paths):
+    """Delete whichever of paths exist"""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _write_shard(df, save_path, profile, best_colors, parent_bands, chunk_size, fill_mode='cells',
+                 instrument=False, layout='cells', assumptions=None, cancel=None):
+    """
+    Process pool entry point: write one shard as its own workbook.
+
+    Returns (save_path, rule measurements or None); the measurements are
+    passed back so the parent process can merge them into its report.
+    """
+    instrumentation = Instrumentation(trace_memory=False) if instrument else None
+    writer = FormattedSheetWriter(df, profile=profile, best_colors=best_colors, parent_bands=parent_bands,
+                                  fill_mode=fill_mode, instrumentation=instrumentation, layout=layout,
+                                  assumptions=assumptions, cancel=cancel)
+    writer.write(save_path, chunk_size=chunk_size)
+    return save_path, instrumentation.records() if instrumentation is not None else None
+
+
+def _pool_results(jobs, workers, progress=None):
+    """
+    Write the shards in worker processes and return their _write_shard results.
+
+    Returns None when this host cannot run the pool (no process support,
+    e.g. some serverless hosts, or workers that died), so the caller can
+    write the shards itself; errors raised while writing a shard propagate.
+    """
+    try:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    except (OSError, NotImplementedError):
+        return None
+    results = []
+    with pool:
+        try:
+            futures = [pool.submit(_write_shard, *job) for job in jobs]
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            return None
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                results.append(future.result())
+                if progress is not None:
+                    progress(done / len(jobs), f"Wrote workbook {done}/{len(jobs)}")
+        except BrokenProcessPool:
+            return None
+        except BaseException:
+            # Drop the shards not started yet; leaving the block waits for the running ones
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def write_formatted_excel(df, save_path, profile='desktop', best_colors=None, chunk_size=1000, progress=None,
+                          max_rows=MAX_DATA_ROWS, shard_mode='workbooks', max_workers=None, fill_mode='cells',
+                          instrumentation=None, layout='cells', parents=None, assumptions=None, cancel=None):
+    """
+    Write df to save_path with all formatting applied in one streaming pass.
+
+    When df has more rows than fit on one sheet the output is sharded on
+    Parent boundaries: shard_mode='workbooks' writes each shard as its own
+    workbook in parallel and zips them next to save_path, shard_mode='sheets'
+    writes numbered sheets into a single workbook. fill_mode='rules' writes
+    the color bands as conditional formatting and layout='sheet' uses sheet
+    and column defaults for row height and cell styles. best_colors is a
+    boolean array with one flag per row of df (see core.pipeline.aggregate)
+    and parents an integer Parent code per row; without it the Parent column
+    is read to tell Parents apart. assumptions maps a column to the boolean
+    mask of rows whose value is an assumed default.
+    An Instrumentation, if given, receives the time spent in each formatting
+    rule and cancel, a CancelToken, can stop the write (raising Cancelled).
+    Returns the path written.
+    """
+    chunk_size = max(500, min(5000, chunk_size if isinstance(chunk_size, int) and chunk_size > 0 else 1000))
+    shards = plan_shards(df, max_rows, parents)
+
+    # Parent fill colors keep alternating across shard boundaries
+    bands = None
+    if FORMAT_PROFILES[profile]['parent_bands'] and 'Parent' in df.columns:
+        bands = parent_codes(df, parents) % 2
+
+    if len(shards) == 1:
+        writer = FormattedSheetWriter(df, profile=profile, best_colors=best_colors, parent_bands=bands,
+                                      fill_mode=fill_mode, instrumentation=instrumentation, layout=layout,
+                                      assumptions=assumptions, cancel=cancel)
+        writer.write(save_path, chunk_size=chunk_size, progress=progress)
+        return save_path
+
+    total_rows = len(df)
+
+    if shard_mode == 'sheets':
+        wb = Workbook(write_only=True)
+        try:
+            for number, (start, stop) in enumerate(shards, 1):
+                writer = FormattedSheetWriter(df.iloc[start:stop], profile=profile,
+                                              best_colors=best_colors[start:stop] if best_colors is not None else None,
+                                              parent_bands=bands[start:stop] if bands is not None else None,
+                                              fill_mode=fill_mode, instrumentation=instrumentation, layout=layout,
+                                              assumptions=shard_assumptions(assumptions, start, stop), cancel=cancel)
+
+                def report(fraction, text, start=start, stop=stop, number=number):
+                    if progress is not None:
+                        done = start + fraction * (stop - start)
+                        progress(done / total_rows, f"Sheet {number}/{len(shards)} - {text}")
+
+                writer.write_sheet(wb, f"Sheet{number}", chunk_size=chunk_size, progress=report)
+        except Exception:
+            discard_workbook(wb)
+            raise
+        with writer.timer('Save workbook'):
+            wb.save(save_path)
+        return save_path
+
+    if shard_mode != 'workbooks':
+        raise ValueError(f"Unknown shard mode: {shard_mode}")
+
+    marker = None
+    if cancel is not None and cancel.path is None:
+        # Let the shard processes see a cancel through a file next to the output
+        marker = os.path.splitext(save_path)[0] + '.cancel'
+        cancel.share(marker)
+
+    jobs = []
+    for number, (start, stop) in enumerate(shards, 1):
+        jobs.append((df.iloc[start:stop], shard_path(save_path, number), profile,
+                     best_colors[start:stop] if best_colors is not None else None,
+                     bands[start:stop] if bands is not None else None, chunk_size, fill_mode,
+                     instrumentation is not None, layout, shard_assumptions(assumptions, start, stop), cancel))
+
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    try:
+        results = _pool_results(jobs, workers, progress)
+        if results is None:
+            # No worker processes here - write the shards one by one
+            results = []
+            for done, job in enumerate(jobs, 1):
+                check(cancel)
+                results.append(_write_shard(*job))
+                if progress is not None:
+                    progress(done / len(jobs), f"Wrote workbook {done}/{len(jobs)}")
+    except BaseException:
+        # Cancelled, or a shard failed (openpyxl error, disk full, ...) - leave no parts behind
+        remove_files(shard_path(save_path, number) for number in range(1, len(jobs) + 1))
+        raise
+    finally:
+        if marker is not None:
+            cancel.path = None
+            if os.path.exists(marker):
+                os.remove(marker)
+
+    parts = [part for part, _ in results]
+    if instrumentation is not None:
+        for _, records in results:
+            instrumentation.merge(records)
+
+    zip_path = os.path.splitext(save_path)[0] + '.zip'
+    try:
+        # Workbooks are already deflated, so store them as-is
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for part in sorted(parts):
+                archive.write(part, os.path.basename(part))
+    except BaseException:
+        remove_files([zip_path])
+        raise
+    finally:
+        remove_files(parts)
+    return zip_path
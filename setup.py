@@ -52,10 +52,14 @@ setup(
             "isort>=5.12.0",
             "flake8>=6.0.0",
         ],
+        "cache": [
+            "pyarrow>=12.0.0",
+        ],
     },
     entry_points={
         "console_scripts": [
             "excel-formatter-pro=main:main",
+            "excel-formatter-batch=core.batch:main",
         ],
     },
     include_package_data=True,
@@ -0,0 +1,284 @@
+"""
+Check the web API's background jobs through Flask's test client: submit,
+status, progress events, result and cancel; uploads spooled and hashed on
+the way in; and results served from the result cache.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import index  # noqa: E402  (api/index.py, importable by name so worker processes can unpickle its jobs)
+from core.jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobManager  # noqa: E402
+from core.spool import SPOOL_PREFIX, SpoolFile  # noqa: E402
+from generate_data import generate_cost_file, generate_export  # noqa: E402
+
+JOB_TIMEOUT = 120
+
+
+class ApiHarness:
+    """index.app with its job, cache and upload folders in a temporary directory"""
+
+    def __init__(self, threads=False, max_workers=1):
+        self.tmp = tempfile.TemporaryDirectory()
+        index.app.config.update(
+            JOB_FOLDER=os.path.join(self.tmp.name, 'jobs'),
+            CACHE_FOLDER=os.path.join(self.tmp.name, 'cache'),
+            UPLOAD_FOLDER=self.tmp.name,
+        )
+        index.job_manager = JobManager(index.app.config['JOB_FOLDER'], max_workers=max_workers)
+        if threads:
+            # Jobs share this process, so a test can hold them at a known point
+            index.job_manager.executor = ThreadPoolExecutor(max_workers=max_workers)
+        index.result_cache = None
+        self.client = index.app.test_client()
+
+    def close(self):
+        index.job_manager.shutdown()
+        index.job_manager = index.result_cache = None
+        self.tmp.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, export, **form):
+        data = dict(form, main_file=(BytesIO(export), 'export.xlsx'))
+        return self.client.post('/api/process', data=data, content_type='multipart/form-data')
+
+    def status(self, job_id):
+        return self.client.get(f'/api/jobs/{job_id}').get_json()
+
+    def wait(self, job_id, statuses):
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while time.monotonic() < deadline:
+            status = self.status(job_id)
+            if status['status'] in statuses:
+                return status
+            time.sleep(0.05)
+        raise AssertionError(f"job {job_id} still {self.status(job_id)['status']}")
+
+
+def export_bytes(rows=200):
+    """A generated Scout export as xlsx bytes"""
+    buffer = BytesIO()
+    generate_export(rows).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def sse_events(body):
+    """(event, data) pairs of a text/event-stream body"""
+    events = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_submit_status_result():
+    """A submitted job runs in a worker process and its output can be downloaded."""
+    with ApiHarness() as api:
+        response = api.submit(export_bytes(), shipping_cost='1.5')
+        assert response.status_code == 202, response.get_json()
+        job = response.get_json()
+        assert job['success'] and job['status_url'] == f"/api/jobs/{job['job_id']}"
+
+        status = api.wait(job['job_id'], (DONE, FAILED, CANCELLED))
+        assert status['status'] == DONE, status
+        assert status['download_url'] == job['result_url'] and status['filename'].endswith('.xlsx')
+
+        result = api.client.get(job['result_url'])
+        assert result.status_code == 200
+        assert result.data[:2] == b'PK'  # xlsx is a zip
+        assert status['filename'] in result.headers['Content-Disposition']
+
+        # A finished job's stream replays its last progress and final status, then ends
+        events = sse_events(api.client.get(job['events_url']).get_data(as_text=True))
+        assert [name for name, _ in events] == ['progress', 'status'], events
+        assert events[0][1]['stage'] == 'write' and events[1][1]['status'] == DONE
+
+        assert api.client.post(job['cancel_url']).status_code == 409
+        assert api.client.get('/api/jobs/unknown').status_code == 404
+
+
+def test_bad_request():
+    """Missing uploads and unknown modes are rejected without keeping a job."""
+    with ApiHarness() as api:
+        response = api.client.post('/api/process', data={}, content_type='multipart/form-data')
+        assert response.status_code == 400 and response.get_json()['error'] == 'No main file uploaded'
+        response = api.submit(b'not used', fill_mode='sparkles')
+        assert response.status_code == 400 and 'sparkles' in response.get_json()['error']
+        assert index.job_manager.jobs == {} and os.listdir(index.app.config['JOB_FOLDER']) == []
+
+
+def hold_jobs():
+    """Make process_excel_file wait for release before it runs; returns (started, release, restore)"""
+    started, release = threading.Event(), threading.Event()
+    run = index.process_excel_file
+
+    def held(*args, **kwargs):
+        started.set()
+        assert release.wait(JOB_TIMEOUT)
+        return run(*args, **kwargs)
+
+    index.process_excel_file = held
+    return started, release, lambda: setattr(index, 'process_excel_file', run)
+
+
+def test_cancel_queued_job():
+    """A job waiting behind a busy worker is cancelled before it starts, and its folder removed."""
+    with ApiHarness(threads=True) as api:
+        started, release, restore = hold_jobs()
+        try:
+            first = api.submit(export_bytes()).get_json()
+            assert started.wait(JOB_TIMEOUT)
+            second = api.submit(export_bytes()).get_json()
+            assert api.status(first['job_id'])['status'] == RUNNING
+            assert api.status(second['job_id'])['status'] == QUEUED
+
+            response = api.client.post(second['cancel_url'])
+            assert response.status_code == 202
+            assert api.status(second['job_id'])['status'] == CANCELLED
+            assert not os.path.exists(index.job_manager.get(second['job_id']).directory)
+            assert api.client.get(second['result_url']).status_code == 409
+        finally:
+            release.set()
+            restore()
+        assert api.wait(first['job_id'], (DONE,))['status'] == DONE
+
+
+def test_cancel_running_job():
+    """A running job stops at its next cancellation check and reports 'cancelled'."""
+    with ApiHarness(threads=True) as api:
+        started, release, restore = hold_jobs()
+        try:
+            job = api.submit(export_bytes()).get_json()
+            assert started.wait(JOB_TIMEOUT)
+            assert api.status(job['job_id'])['status'] == RUNNING
+            response = api.client.post(job['cancel_url'])
+            assert response.status_code == 202
+            # The job function is still waiting; it sees the cancel once it runs the pipeline
+            assert api.status(job['job_id'])['status'] == RUNNING
+        finally:
+            release.set()
+            restore()
+        status = api.wait(job['job_id'], (DONE, FAILED, CANCELLED))
+        assert status['status'] == CANCELLED, status
+        assert not os.path.exists(index.job_manager.get(job['job_id']).directory)
+        events = sse_events(api.client.get(job['events_url']).get_data(as_text=True))
+        assert events[-1] == ('status', api.status(job['job_id'])), events
+
+
+def test_spool_file():
+    """A SpoolFile hashes what is written, reads back like a file, and keeps it with a rename."""
+    with tempfile.TemporaryDirectory() as tmp:
+        spool = SpoolFile(tmp)
+        assert os.path.basename(spool.path).startswith(SPOOL_PREFIX)
+        chunks = [b'PK\x03\x04', os.urandom(100000), b'', b'end']
+        for chunk in chunks:
+            spool.write(chunk)
+        data = b''.join(chunks)
+        assert spool.size == len(data) and spool.digest == hashlib.sha256(data).hexdigest()
+        spool.seek(0)
+        assert spool.read() == data
+
+        kept = os.path.join(tmp, 'export.xlsx')
+        spooled = spool.path
+        assert spool.keep(kept) == hashlib.sha256(data).hexdigest()
+        assert not os.path.exists(spooled) and os.listdir(tmp) == ['export.xlsx']
+        with open(kept, 'rb') as handle:
+            assert handle.read() == data
+
+
+def test_uploads_spooled_and_hashed():
+    """Uploads stream into the job folder, and the digests taken on the way reach the job."""
+    export = export_bytes()
+    buffer = BytesIO()
+    generate_cost_file(generate_export(200)).to_excel(buffer, index=False)
+    cost = buffer.getvalue()
+    calls = []
+    with ApiHarness(threads=True) as api:
+        run = index.process_excel_file
+
+        def recorded(*args, **kwargs):
+            calls.append(kwargs)
+            return run(*args, **kwargs)
+
+        index.process_excel_file = recorded
+        try:
+            data = {'main_file': (BytesIO(export), 'my export.xlsx'), 'cost_file': (BytesIO(cost), 'cost.xlsx')}
+            job = api.client.post('/api/process', data=data, content_type='multipart/form-data').get_json()
+            status = api.wait(job['job_id'], (DONE, FAILED, CANCELLED))
+        finally:
+            index.process_excel_file = run
+        assert status['status'] == DONE, status
+        directory = index.job_manager.get(job['job_id']).directory
+        names = os.listdir(directory)
+
+    assert calls[0]['main_digest'] == hashlib.sha256(export).hexdigest()
+    assert calls[0]['cost_digest'] == hashlib.sha256(cost).hexdigest()
+    # Spool files were renamed into place, not copied
+    assert 'my_export.xlsx' in names and 'cost_cost.xlsx' in names
+    assert not any(name.startswith(SPOOL_PREFIX) for name in names), names
+
+
+def test_cached_result_drops_uploads():
+    """A repeat of an earlier request completes from the result cache with only the output in its folder."""
+    export = export_bytes()
+    with ApiHarness() as api:
+        first = api.submit(export).get_json()
+        assert api.wait(first['job_id'], (DONE, FAILED, CANCELLED))['status'] == DONE
+        stats = api.client.get('/api/result-cache').get_json()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (0, 1, 1), stats
+
+        second = api.submit(export).get_json()
+        status = api.status(second['job_id'])
+        assert status['status'] == DONE, status
+        assert os.listdir(index.job_manager.get(second['job_id']).directory) == [status['filename']]
+        result = api.client.get(second['result_url'])
+        assert result.status_code == 200
+        assert result.data == api.client.get(first['result_url']).data
+
+        stats = api.client.get('/api/result-cache').get_json()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1), stats
+        assert stats['hit_rate'] == 0.5 and stats['bytes'] == len(result.data)
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Submit, status and result", test_submit_status_result),
+        ("Bad requests", test_bad_request),
+        ("Cancel a queued job", test_cancel_queued_job),
+        ("Cancel a running job", test_cancel_running_job),
+        ("Spool file", test_spool_file),
+        ("Uploads spooled and hashed", test_uploads_spooled_and_hashed),
+        ("Cached result drops uploads", test_cached_result_drops_uploads),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
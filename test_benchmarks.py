@@ -0,0 +1,73 @@
+"""
+Smoke test for the benchmark runner: one small run per pipeline, from
+generated workbooks and from in-memory frames.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import run_benchmarks  # noqa: E402
+
+
+def run_small(pipeline, rows, data_dir):
+    """run_child's result for one pipeline"""
+    with tempfile.TemporaryDirectory() as tmp:
+        result_file = os.path.join(tmp, 'result.json')
+        run_benchmarks.run_child(pipeline, rows, 7, data_dir, result_file)
+        with open(result_file) as handle:
+            return json.load(handle)
+
+
+def check_result(result, source):
+    stages = result['stages']
+    assert result['source'] == source, result
+    assert result['rows_in'] > 0 and result['matched_rows'] > 0, result
+    assert {'ingest', 'merge', 'metrics', 'write'} <= set(stages), sorted(stages)
+    assert all(stage['seconds'] >= 0 for stage in stages.values())
+    assert 'ERROR' not in run_benchmarks.format_result(result)
+
+
+def test_xlsx_runs():
+    """Both pipelines run on generated workbooks."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        for pipeline in run_benchmarks.PIPELINES:
+            check_result(run_small(pipeline, 300, data_dir), 'xlsx')
+
+
+def test_memory_runs():
+    """Both pipelines run on in-memory frames, as sizes past one sheet do."""
+    limit = run_benchmarks.XLSX_MAX_ROWS
+    run_benchmarks.XLSX_MAX_ROWS = 0
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            for pipeline in run_benchmarks.PIPELINES:
+                check_result(run_small(pipeline, 300, data_dir), 'memory')
+    finally:
+        run_benchmarks.XLSX_MAX_ROWS = limit
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Workbook runs", test_xlsx_runs),
+        ("In-memory runs", test_memory_runs),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
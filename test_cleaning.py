@@ -0,0 +1,153 @@
+"""
+Check that the vectorized row filter drops exactly the rows the old
+row-wise is_problematic_row did.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from core.cleaning import problematic_row_mask
+
+
+def is_problematic_row(row):
+    """The original row-wise rule from format_and_save_excel_optimized."""
+    if row.isna().all():
+        return True
+
+    empty_string_count = sum(1 for val in row if str(val).strip() == '')
+    if empty_string_count == len(row):
+        return True
+
+    if 'Imported by Code' in row.index:
+        imported_code_value = str(row['Imported by Code']).strip().lower()
+        if imported_code_value == 'nan' or imported_code_value == '':
+            non_empty_count = 0
+            for field in row.index:
+                if field != 'Imported by Code':
+                    val_str = str(row[field]).strip().lower()
+                    if val_str not in ['nan', '', 'none', '0', '0.0', '0.0%']:
+                        non_empty_count += 1
+            if non_empty_count <= 3:
+                return True
+
+    if 'Imported by Code' not in row.index and 'UPC' in row.index:
+        upc_value = str(row['UPC']).strip().lower()
+        if upc_value == 'nan':
+            non_empty_count = 0
+            for field in row.index:
+                if field != 'UPC':
+                    val_str = str(row[field]).strip().lower()
+                    if val_str not in ['nan', '', 'none', '0', '0.0', '0.0%']:
+                        non_empty_count += 1
+            if non_empty_count <= 3:
+                return True
+
+    key_fields = ['Brand', 'Parent', 'ASIN', 'Title']
+    for field in key_fields:
+        if field in row.index:
+            value = str(row[field]).strip().lower()
+            if value in ['nan', '', 'none']:
+                non_empty_count = sum(1 for val in row.values if str(val).strip().lower() not in ['nan', '', 'none'])
+                if non_empty_count <= 2:
+                    return True
+                break
+
+    return False
+
+
+def make_frame(rng, n_rows, columns):
+    """Random sparse export with the awkward values real files contain"""
+    text_pool = np.array(['', ' ', 'nan', 'None', 'NONE', '0', '0.0', '0.0%', ' 0 ', 'abc', 'SKU-1', '10000000001', '-0.0'], dtype=object)
+    data = {}
+    for col in columns:
+        kind = rng.integers(0, 4)
+        empty = rng.random(n_rows) < 0.6
+        if kind == 0:
+            values = rng.choice([0.0, -0.0, 1.5, 12.0], n_rows)
+            values[empty] = np.nan
+        elif kind == 1:
+            values = rng.choice([0, 0, 3, 7], n_rows)
+        elif kind == 2:
+            values = rng.choice(text_pool, n_rows)
+            values[empty] = rng.choice(np.array([None, np.nan, ''], dtype=object), empty.sum())
+        else:
+            values = np.where(empty, None, rng.choice(np.array([0, 2.5, 'x', '', 'nan'], dtype=object), n_rows))
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def check_frame(df):
+    """Return True when both filters agree on every row"""
+    expected = df.apply(is_problematic_row, axis=1).astype(bool)
+    actual = problematic_row_mask(df)
+    return expected.tolist() == actual.tolist()
+
+
+def test_matches_row_wise_filter():
+    """Random frames with and without the code/key columns."""
+    layouts = [
+        ['Imported by Code', 'UPC', 'Brand', 'Parent', 'ASIN', 'Title', 'Price', 'Rank'],
+        ['UPC', 'Brand', 'Title', 'Price', 'Rank', 'Notes'],
+        ['Parent', 'ASIN', 'Price'],
+        ['Price', 'Rank', 'Notes', 'Extra'],
+        ['Imported by Code', 'Price'],
+    ]
+    rng = np.random.default_rng(0)
+    for seed in range(40):
+        for columns in layouts:
+            df = make_frame(rng, 60, columns)
+            assert check_frame(df), f"mismatch for {columns} (round {seed})"
+
+
+def test_all_numeric_frame():
+    """Rows of an all-numeric frame reach the old rule as floats."""
+    df = pd.DataFrame({
+        'UPC': [np.nan, np.nan, 5.0, np.nan],
+        'Rank': [0, 1, 2, 3],
+        'Price': [0.0, 2.0, np.nan, -0.0],
+        'Parent': [np.nan, 1.0, 1.0, np.nan],
+    })
+    assert check_frame(df)
+
+
+def test_blank_rows():
+    """Fully empty and all-whitespace rows are dropped."""
+    df = pd.DataFrame({
+        'ASIN': [None, ' ', 'B0001', np.nan],
+        'Title': [np.nan, '', 'Thing', ''],
+    })
+    assert check_frame(df)
+    assert problematic_row_mask(df).tolist() == [True, True, False, True]
+
+
+def test_empty_frame():
+    """No rows means nothing to drop."""
+    df = pd.DataFrame(columns=['ASIN', 'Title'])
+    assert problematic_row_mask(df).tolist() == []
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Row-wise parity", test_matches_row_wise_filter),
+        ("All-numeric frame", test_all_numeric_frame),
+        ("Blank rows", test_blank_rows),
+        ("Empty frame", test_empty_frame),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
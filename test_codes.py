@@ -0,0 +1,192 @@
+"""
+Check product code match keys and that CostIndex.merge joins cost rows
+exactly like a pandas left merge on those keys.
+"""
+
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from core.codes import MISSING_KEY, code_keys
+from core.cost_index import CostIndex
+
+
+def normalize_imported_code(code):
+    """The original per-value normalization used for the cost merge."""
+    if pd.isna(code) or code == '':
+        return None
+    code_str = str(code).strip()
+    if code_str.endswith('.0'):
+        code_str = code_str[:-2]
+    if not code_str or code_str.lower() in ['nan', 'none', '']:
+        return None
+    if code_str.replace('-', '').replace(' ', '').replace('_', '').isdigit():
+        code_str = code_str.replace('-', '').replace(' ', '').replace('_', '')
+        if len(code_str) < 12 and len(code_str) >= 8:
+            code_str = code_str.zfill(12)
+    return code_str
+
+
+def keys_of(values):
+    """code_keys of a list, as one readable key per value (None when there is none)"""
+    int_keys, str_keys = code_keys(pd.Series(values, dtype=object))
+    return [int(i) if i != MISSING_KEY else s for i, s in zip(int_keys, str_keys)]
+
+
+def test_leading_zeros():
+    """UPC-A, EAN-13 and GTIN-14 spellings of one code share a key."""
+    keys = keys_of(['012345678905', '0012345678905', '00012345678905', 12345678905, 12345678905.0,
+                    '12345678905.0', ' 012345678905 '])
+    assert len(set(keys)) == 1 and keys[0] == 12345678905
+
+
+def test_check_digits():
+    """Check digits are part of the key: they are not validated or dropped."""
+    keys = keys_of(['012345678905', '012345678906', '4006381333931', '4006381333932'])
+    assert keys == [12345678905, 12345678906, 4006381333931, 4006381333932]
+
+
+def test_separators_and_lengths():
+    """Separators are dropped from numbers; only 8-14 digits become GTIN keys."""
+    keys = keys_of(['0-12345-67890-5', '0 12345 67890 5', '0_12345_67890_5', '1234567', '12345678',
+                    '12345678901234', '123456789012345'])
+    assert keys == [12345678905, 12345678905, 12345678905, '1234567', 12345678, 12345678901234,
+                    '123456789012345']
+
+
+def test_text_codes():
+    """SKUs and other text keep a text key as written; blanks get no key."""
+    keys = keys_of(['SKU-1', 'sku-1', ' AB 12 ', '12A45678', None, np.nan, '', ' ', 'nan', 'None', 'NaN'])
+    assert keys == ['SKU-1', 'sku-1', 'AB 12', '12A45678', None, None, None, None, None, None, None]
+
+
+def test_old_normalization_subset():
+    """Where the old normalization already matched, the keys still do."""
+    rng = np.random.default_rng(2)
+    pool = ['012345678905', '12345678905', '0-12345-67890-5', '98765432', '098765432', 'SKU-1', 'SKU-2', '1234',
+            '', None, '5550001112223', 5550001112223.0]
+    values = rng.choice(np.array(pool, dtype=object), 400)
+    old = [normalize_imported_code(value) for value in values]
+    new = keys_of(values)
+    for a in range(len(values)):
+        for b in range(a + 1, min(a + 40, len(values))):
+            if old[a] is not None and old[a] == old[b]:
+                assert new[a] == new[b], f"{values[a]!r} and {values[b]!r} no longer match"
+
+
+def reference_merge(df, code_column, cost, cost_code, cost_column, msrp_column):
+    """pd.merge(how='left') on the same code keys, shaped like CostIndex.merge output"""
+    def key_column(series):
+        int_keys, str_keys = code_keys(series)
+        return [f'i{i}' if i != MISSING_KEY else (f's{s}' if s is not None else None)
+                for i, s in zip(int_keys, str_keys)]
+
+    left = df.copy()
+    # Rows without a key must not match each other the way NaN keys do in pandas
+    keys = key_column(df[code_column])
+    left['_key'] = [key if key is not None else f'missing{row}' for row, key in enumerate(keys)]
+    right = pd.DataFrame({
+        '_key': key_column(cost[cost_code]),
+        '_code': cost[cost_code].astype(str).replace(['nan', 'NaN', 'None'], '').str.replace(r'\.0$', '', regex=True),
+        'COST': pd.to_numeric(cost[cost_column], errors='coerce'),
+        'MSRP': pd.to_numeric(cost[msrp_column], errors='coerce'),
+    })
+    right = right[right['_key'].notna()]
+    merged = pd.merge(left, right, on='_key', how='left', sort=False)
+    if 'Imported by Code' not in df.columns:
+        merged['Imported by Code'] = merged['_code']
+    added = [col for col in ['Imported by Code', 'COST', 'MSRP'] if col not in df.columns]
+    return merged[list(df.columns) + added]
+
+
+def same_frames(expected, actual):
+    """Equal columns and values, NaN matching NaN"""
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    for col in expected.columns:
+        for want, got in zip(expected[col].tolist(), actual[col].tolist()):
+            if pd.isna(want) and pd.isna(got):
+                continue
+            if want != got:
+                return False
+    return True
+
+
+def make_cost_file(rng, n_rows, codes):
+    """Cost rows drawn from codes, so codes repeat and some appear in other spellings"""
+    return pd.DataFrame({
+        'UPC': rng.choice(codes, n_rows),
+        'Cost': rng.choice(np.array([1.5, 2.25, '3.10', None, 'n/a', -1.0], dtype=object), n_rows),
+        'MSRP': rng.choice(np.array([9.99, None, '12', 0.0], dtype=object), n_rows),
+    })
+
+
+CODE_POOL = np.array(['012345678905', '12345678905', '0012345678905', '5550001112223', 5550001112223.0, '98765432',
+                      '0-12345-67890-5', 'SKU-1', 'SKU-2', 'sku-1', '1234', '', None, np.nan, 'nan'], dtype=object)
+
+
+def test_merge_matches_pandas():
+    """Random main and cost files, duplicate cost codes included, in memory and memory-mapped."""
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in range(30):
+            cost = make_cost_file(rng, 25, CODE_POOL)
+            main = pd.DataFrame({'ASIN': [f'B{row:04d}' for row in range(40)],
+                                 'UPC': rng.choice(CODE_POOL, 40)})
+            if seed % 2:
+                main['Imported by Code'] = main['UPC']
+            code_column = 'Imported by Code' if seed % 2 else 'UPC'
+            index = CostIndex.from_frame(cost, 'UPC', 'Cost', 'MSRP')
+            expected = reference_merge(main, code_column, cost, 'UPC', 'Cost', 'MSRP')
+            merged, left = index.merge(main, code_column)
+            assert same_frames(expected, merged), f"in-memory mismatch (round {seed})"
+            assert merged['ASIN'].tolist() == main['ASIN'].to_numpy()[left].tolist()
+
+            directory = f"{tmp}/index{seed}"
+            index.save(directory)
+            loaded = CostIndex.load(directory)
+            assert same_frames(expected, loaded.merge(main, code_column)[0]), f"memory-mapped mismatch (round {seed})"
+
+
+def test_duplicate_codes_repeat_rows():
+    """A code listed twice in the cost file repeats its main row, in cost file order."""
+    cost = pd.DataFrame({'UPC': ['012345678905', 'SKU-1', '12345678905', '98765432'],
+                         'Cost': [1.0, 2.0, 3.0, 4.0]})
+    main = pd.DataFrame({'ASIN': ['A', 'B', 'C', 'D'], 'UPC': ['0012345678905', 'SKU-9', 'SKU-1', '98765432']})
+    merged, left = CostIndex.from_frame(cost, 'UPC', 'Cost').merge(main, 'UPC')
+    assert merged['ASIN'].tolist() == ['A', 'A', 'B', 'C', 'D']
+    assert left.tolist() == [0, 0, 1, 2, 3]
+    assert merged['COST'].tolist()[:2] == [1.0, 3.0]
+    assert np.isnan(merged['COST'].iloc[2])
+    assert merged['COST'].tolist()[3:] == [2.0, 4.0]
+    assert merged['Imported by Code'].tolist()[:2] == ['012345678905', '12345678905']
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Leading zeros", test_leading_zeros),
+        ("Check digits", test_check_digits),
+        ("Separators and lengths", test_separators_and_lengths),
+        ("Text codes", test_text_codes),
+        ("Old normalization subset", test_old_normalization_subset),
+        ("Merge parity", test_merge_matches_pandas),
+        ("Duplicate cost codes", test_duplicate_codes_repeat_rows),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,292 @@
+"""
+Check that compute_metrics gives exactly what the old row-wise calc_*
+functions gave.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from core.metrics import buybox_source_counts, compute_metrics
+
+
+def clean_price(val):
+    """The original clean_price from the desktop app."""
+    if val is None or val == '' or val == 0:
+        return None
+
+    if isinstance(val, str):
+        val = val.replace('$', '').replace(',', '').strip()
+        if val == '' or val == '0':
+            return None
+
+    try:
+        cleaned_val = float(val)
+        return cleaned_val if cleaned_val > 0 else None
+    except (ValueError, TypeError):
+        return None
+
+
+def row_cost(row):
+    try:
+        return float(row.get('COST', 0))
+    except (ValueError, TypeError):
+        return 0
+
+
+def row_pack_fee(row):
+    pack_fee = 7.0
+    try:
+        pack_fee_val = row.get('Pick & Pack')
+        if pd.notna(pack_fee_val) and pack_fee_val != '':
+            if isinstance(pack_fee_val, str) and '*ASSUMPTION*' in pack_fee_val:
+                pack_fee = 7.0
+            else:
+                pack_fee = float(pack_fee_val)
+    except (ValueError, TypeError):
+        pass
+    return pack_fee
+
+
+def row_referral_fee(row):
+    referral_fee_pct = 0.15
+    try:
+        ref_fee = row.get('Referral Fee &')
+        if pd.notna(ref_fee) and str(ref_fee).strip() != '':
+            if isinstance(ref_fee, str) and '*ASSUMPTION*' in ref_fee:
+                referral_fee_pct = 0.15
+            else:
+                ref_fee = str(ref_fee).replace('%', '').strip()
+                if float(ref_fee) > 1:
+                    referral_fee_pct = float(ref_fee) / 100
+                else:
+                    referral_fee_pct = float(ref_fee)
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return referral_fee_pct
+
+
+def row_buybox(row):
+    for col in ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180']:
+        val = clean_price(row.get(col, None))
+        if val is not None and val > 0:
+            return val
+    return None
+
+
+def calc_profit(row):
+    """The original calc_profit."""
+    cost = row_cost(row) + row_pack_fee(row)
+    referral_fee_pct = row_referral_fee(row)
+    for col in ['Buy Box', 'Buy Box 30', 'Buy Box 90', 'Buy Box 180', 'MSRP']:
+        val = clean_price(row.get(col, None))
+        if val is not None and val > 0:
+            revenue = val * (1 - referral_fee_pct)
+            return round(revenue - cost, 2)
+    return -cost if cost else ''
+
+
+def calc_roi(row):
+    """The original calc_roi, reading the Profit column calc_profit filled."""
+    profit = row.get('Profit', 0)
+    if isinstance(profit, str):
+        return ''
+    cost = row_cost(row)
+    if cost > 0 and isinstance(profit, (int, float)):
+        roi = (profit / cost) * 100
+        return roi if roi != float('inf') else ''
+    return ''
+
+
+def calc_profit_margin_buybox(row):
+    """The original calc_profit_margin_buybox."""
+    buybox_val = row_buybox(row)
+    if buybox_val is None:
+        return 'No Buybox'
+    revenue = buybox_val * (1 - row_referral_fee(row))
+    total_cost = row_cost(row) + row_pack_fee(row)
+    if buybox_val > 0:
+        margin = ((revenue - total_cost) / buybox_val) * 100
+        return round(margin, 2) if margin != float('inf') else ''
+    return ''
+
+
+def calc_profit_margin_msrp(row):
+    """The original calc_profit_margin_msrp."""
+    msrp = clean_price(row.get('MSRP', None))
+    if msrp is None or msrp <= 0:
+        return ''
+    revenue = msrp * (1 - row_referral_fee(row))
+    total_cost = row_cost(row) + row_pack_fee(row)
+    if msrp > 0:
+        margin = ((revenue - total_cost) / msrp) * 100
+        return round(margin, 2) if margin != float('inf') else ''
+    return ''
+
+
+def msrp_diff(row):
+    """The original msrp_diff."""
+    msrp = clean_price(row.get('MSRP', None))
+    buybox_val = row_buybox(row)
+    if msrp is not None and msrp > 0 and buybox_val is not None and buybox_val > 0:
+        return buybox_val - msrp
+    elif msrp is not None and msrp > 0 and buybox_val is None:
+        return 'No Buybox'
+    else:
+        return ''
+
+
+def row_wise_metrics(df):
+    """The metric columns as the old apply calls built them, one after another."""
+    df = df.copy()
+    df['Profit'] = df.apply(calc_profit, axis=1)
+    df['ROI'] = df.apply(calc_roi, axis=1)
+    df['Profit Margin (Buybox)'] = df.apply(calc_profit_margin_buybox, axis=1)
+    df['Profit Margin (MSRP)'] = df.apply(calc_profit_margin_msrp, axis=1)
+    df['MSRP Difference'] = df.apply(msrp_diff, axis=1)
+    return df
+
+
+def same_value(expected, actual):
+    """Equal sentinels, or floats equal to the last bit (NaN matching NaN)"""
+    if isinstance(expected, str) or isinstance(actual, str):
+        return expected == actual
+    expected, actual = float(expected), float(actual)
+    return expected == actual or (np.isnan(expected) and np.isnan(actual))
+
+
+def check_frame(df):
+    """Return a description of the first difference, None when every metric matches"""
+    if len(df) == 0:
+        return None
+    expected = row_wise_metrics(df)
+    actual = compute_metrics(df)
+    for col in ['Profit', 'ROI', 'Profit Margin (Buybox)', 'Profit Margin (MSRP)', 'MSRP Difference']:
+        for row, (want, got) in enumerate(zip(expected[col].tolist(), actual[col].tolist())):
+            if not same_value(want, got):
+                return f"{col} row {row}: expected {want!r}, got {got!r} ({df.iloc[row].to_dict()})"
+    return None
+
+
+PRICE_POOL = np.array([None, np.nan, '', ' ', 0, 0.0, '0', '$0', -5.0, 'abc', 12.5, 19.99, '$24.95', '1,234.50',
+                       ' $7 ', 3, 0.01, 99.995], dtype=object)
+COST_POOL = np.array([None, np.nan, pd.NA, pd.NaT, '', 'n/a', 0, 4.25, '6.10', 11, -2.0, 1.005], dtype=object)
+PACK_FEE_POOL = np.array([None, np.nan, '', 0, 3.22, '4.5', 'x', 7.0, '7.00*ASSUMPTION*'], dtype=object)
+REFERRAL_POOL = np.array([None, np.nan, '', '  ', 0.15, 0.08, 15, 17.0, '17.00%', '8%', 'abc', 1, '0.15*ASSUMPTION*'],
+                         dtype=object)
+
+
+def numeric_or_object(rng, values):
+    """Half the time coerce a column to float64, as a clean export would load"""
+    if rng.random() < 0.5:
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+    return values
+
+
+def make_frame(rng, n_rows):
+    """Random rows with some of the Buy Box, COST, fee and MSRP columns"""
+    data = {}
+    columns = {
+        'Buy Box': PRICE_POOL, 'Buy Box 30': PRICE_POOL, 'Buy Box 90': PRICE_POOL, 'Buy Box 180': PRICE_POOL,
+        'MSRP': PRICE_POOL, 'COST': COST_POOL, 'Pick & Pack': PACK_FEE_POOL, 'Referral Fee &': REFERRAL_POOL,
+    }
+    for col, pool in columns.items():
+        if rng.random() < 0.15:
+            continue
+        data[col] = numeric_or_object(rng, rng.choice(pool, n_rows))
+    return pd.DataFrame(data, index=pd.RangeIndex(n_rows))
+
+
+def test_matches_row_wise_metrics():
+    """Random frames with mixed, missing and unparseable values."""
+    rng = np.random.default_rng(1)
+    for seed in range(60):
+        df = make_frame(rng, 80)
+        problem = check_frame(df)
+        assert problem is None, f"round {seed}: {problem}"
+
+
+def test_buybox_fallback_chain():
+    """The first usable Buy Box column wins, then MSRP for Profit only."""
+    df = pd.DataFrame({
+        'Buy Box': [None, '', 0, 'abc', 20.0, None],
+        'Buy Box 30': [18.0, None, -1, None, 30.0, None],
+        'Buy Box 90': [None, '$16.00', None, None, None, None],
+        'Buy Box 180': [None, None, 14.0, 12.0, None, None],
+        'MSRP': [25.0, 25.0, None, 25.0, None, 25.0],
+        'COST': [5.0, 5.0, 5.0, 5.0, 5.0, 5.0],
+    })
+    assert check_frame(df) is None
+    sources = compute_metrics(df)['Buy Box Source'].tolist()
+    assert sources[:5] == ['Buy Box 30', 'Buy Box 90', 'Buy Box 180', 'Buy Box 180', 'Buy Box']
+    assert pd.isna(sources[5])
+    assert compute_metrics(df)['Profit Margin (Buybox)'].iloc[5] == 'No Buybox'
+    counts = buybox_source_counts(compute_metrics(df)['Buy Box Source'])
+    assert counts == {'Buy Box': 1, 'Buy Box 30': 1, 'Buy Box 90': 1, 'Buy Box 180': 2, 'No Buybox': 1}
+
+
+def test_default_pack_fee():
+    """Blank Pick & Pack fees count as $7, blank referral fees as 15%."""
+    df = pd.DataFrame({
+        'Buy Box': [20.0, 20.0, 20.0, 20.0],
+        'COST': [5.0, 5.0, 5.0, 5.0],
+        'Pick & Pack': [None, '', 3.0, '7.00*ASSUMPTION*'],
+        'Referral Fee &': [None, '', '10%', 0.15],
+    })
+    assert check_frame(df) is None
+    assert compute_metrics(df)['Profit'].tolist() == [5.0, 5.0, 10.0, 5.0]
+
+
+def test_halfway_rounding():
+    """Values at .xx5 round like Python's round(), not like np.round."""
+    bodies = np.arange(1000, 1400) / 1000  # 1.000 .. 1.399, every .xx5 included
+    df = pd.DataFrame({
+        'Buy Box': 10.0 + bodies,
+        'MSRP': 20.0 + bodies,
+        'COST': np.full(len(bodies), 0.0),
+        'Pick & Pack': np.full(len(bodies), 0.005),
+        'Referral Fee &': np.full(len(bodies), 0.0),
+    })
+    assert check_frame(df) is None
+
+
+def test_missing_cost():
+    """A missing COST is 0 unless it is a float NaN, which stays NaN."""
+    df = pd.DataFrame({
+        'Buy Box': [20.0] * 6,
+        'COST': pd.Series([None, pd.NA, pd.NaT, np.nan, '', 4.0], dtype=object),
+    })
+    assert check_frame(df) is None
+    profit = compute_metrics(df)['Profit'].tolist()
+    assert profit[:3] == [10.0, 10.0, 10.0]
+    assert np.isnan(profit[3])
+
+    no_cost_column = pd.DataFrame({'Buy Box': [20.0, None], 'MSRP': [None, None]})
+    assert check_frame(no_cost_column) is None
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Row-wise parity", test_matches_row_wise_metrics),
+        ("Buy Box fallback", test_buybox_fallback_chain),
+        ("Default pack fee", test_default_pack_fee),
+        ("Halfway rounding", test_halfway_rounding),
+        ("Missing COST", test_missing_cost),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
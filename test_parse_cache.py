@@ -0,0 +1,106 @@
+"""
+Check that the parse cache gives back the frame the reader produced, with
+the same Python value types in object columns.
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from core.parse_cache import available, frame_to_table, read_cached, table_to_frame
+from core.reader import read_excel_streaming
+
+
+def same_values(expected, actual):
+    """Same columns, dtypes and values, with every object value of the same Python type"""
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    for col in expected.columns:
+        if expected[col].dtype != actual[col].dtype:
+            return False
+        for want, got in zip(expected[col].tolist(), actual[col].tolist()):
+            if type(want) is not type(got):
+                return False
+            if want == want and want != got:  # NaN only matches itself by type
+                return False
+    return True
+
+
+def test_mixed_object_column():
+    """Text, ints, floats, bools, datetimes and blanks in one column round-trip with their types."""
+    if not available():
+        return
+    values = ['abc', 1, 2.5, True, datetime.datetime(2024, 1, 2, 3, 4, 5), np.nan, 2 ** 40, False, '', -7, 0.0]
+    df = pd.DataFrame({
+        'Mixed': pd.Series(values, dtype=object),
+        'Ints': pd.Series([1, 2, 3, -4, 5, 6, 7, 8, 9, 10, 11], dtype=object),
+        'Bools': pd.Series([True, False] * 5 + [True], dtype=object),
+        'Price': np.linspace(0, 1, 11),
+        'Rank': np.arange(11, dtype='int64'),
+    })
+    back = table_to_frame(frame_to_table(df))
+    assert same_values(df, back)
+    assert [type(value) for value in back['Mixed']] == [type(value) for value in values]
+
+
+def test_none_becomes_nan():
+    """None and NaT are stored as missing and come back as NaN, like the reader's blanks."""
+    if not available():
+        return
+    df = pd.DataFrame({'Code': pd.Series(['012345678905', None, pd.NaT, 7], dtype=object)})
+    back = table_to_frame(frame_to_table(df))
+    assert back['Code'].iloc[0] == '012345678905' and back['Code'].iloc[3] == 7
+    assert all(isinstance(value, float) and np.isnan(value) for value in back['Code'].iloc[1:3])
+
+
+def test_cached_read_matches_parse():
+    """A cache hit returns what parsing the workbook returns."""
+    if not available():
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.xlsx')
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['ASIN', 'UPC', 'Buy Box', 'Flag', 'Date'])
+        ws.append(['B001', 12345678905, 19.99, True, datetime.datetime(2024, 5, 1)])
+        ws.append(['B002', '012345678905', '$5.00', False, None])
+        ws.append(['B003', None, 7, None, 'soon'])
+        wb.save(path)
+
+        parsed = read_excel_streaming(path)
+        miss, hit_before = read_cached(path, tmp)
+        cached, hit = read_cached(path, tmp)
+        assert not hit_before and hit
+        assert same_values(parsed, miss)
+        assert same_values(parsed, cached)
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Mixed object column", test_mixed_object_column),
+        ("None becomes NaN", test_none_becomes_nan),
+        ("Cached read matches parse", test_cached_read_matches_parse),
+    ]
+
+    if not available():
+        print("pyarrow is not installed - parse cache tests skipped")
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
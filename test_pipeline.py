@@ -0,0 +1,181 @@
+"""
+Check pipeline behaviour that depends on the order and interplay of its
+stages.
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from core.cost_index import CostIndex
+from core.pipeline import CostSource, Pipeline, PipelineOptions
+from core.writer import BEST_COLOR_COMMENT
+
+
+def cost_source(cost):
+    """CostSource for an in-memory cost frame with UPC and Cost columns"""
+    index = CostIndex.from_frame(cost, 'UPC', 'Cost')
+    return CostSource('cost.xlsx', list(cost.columns), index=index)
+
+
+def run_frames(main, cost=None, **options):
+    """Run the pipeline up to the write stage; returns (final frame, state)"""
+    captured = {}
+
+    def capture(state, options):
+        captured['df'] = state.df.copy()
+        captured['assumptions'] = dict(state.assumptions)
+        captured['best_colors'] = state.best_colors
+
+    pipeline = Pipeline(PipelineOptions(**options), stages={'write': capture})
+    state = pipeline.run(main, 'unused.xlsx', cost_source(cost) if cost is not None else None)
+    return captured, state
+
+
+def clean_order_frames():
+    """A main file where the merge decides which rows are empty enough to drop"""
+    main = pd.DataFrame({
+        'ASIN': ['B001', 'B002', 'B003'],
+        'UPC': ['012345678905', '999999999993', '555000111222'],
+        'Title': ['', 'Unmatched thing', 'Matched thing'],
+    })
+    cost = pd.DataFrame({'UPC': ['012345678905', '555000111222'], 'Cost': [5.0, 6.0]})
+    return main, cost
+
+
+def test_desktop_cleans_after_merge():
+    """Desktop: merged COST and 'Imported by Code' count when a row is judged."""
+    main, cost = clean_order_frames()
+    captured, state = run_frames(main, cost, profile='desktop')
+    # B001 is kept by its merged code and COST, B002 dropped for having no cost file code
+    assert captured['df']['ASIN'].tolist() == ['B001', 'B003']
+    assert state.rows_dropped == 1
+
+
+def test_web_cleans_before_merge():
+    """Web: rows are judged on the export's own columns only."""
+    main, cost = clean_order_frames()
+    captured, state = run_frames(main, cost, profile='web')
+    assert captured['df']['ASIN'].tolist() == ['B002', 'B003']
+    assert state.rows_dropped == 1
+
+
+def test_duplicate_cost_codes():
+    """Codes listed twice in the cost file repeat their row, fee flags included."""
+    main = pd.DataFrame({
+        'ASIN': ['B001', 'B002', 'B003', 'B004'],
+        'Parent': ['P2', 'P1', 'P1', 'P3'],
+        'UPC': ['012345678905', '555000111222', '98765432', '444000111222'],
+        'Title': ['One', 'Two', 'Three', 'Four'],
+        'Pick & Pack': [None, 3.5, None, 4.0],
+        'Referral Fee &': [0.15, None, 0.08, 0.15],
+    })
+    cost = pd.DataFrame({
+        'UPC': ['012345678905', '98765432', '0012345678905', '98765432', '555000111222'],
+        'Cost': [5.0, 6.0, 5.5, 6.5, 7.0],
+    })
+    for profile in ('desktop', 'web'):
+        captured, state = run_frames(main, cost, profile=profile)
+        df = captured['df']
+        # Sorted by Parent: P1 (B002, B003 twice), P2 (B001 twice), P3 (B004, unmatched)
+        assert df['ASIN'].tolist() == ['B002', 'B003', 'B003', 'B001', 'B001', 'B004'], profile
+        assert df['COST'].tolist() == [7.0, 6.0, 6.5, 5.0, 5.5, 0.0], profile
+        assumptions = captured['assumptions']
+        assert assumptions['Pick & Pack'].tolist() == [False, True, True, True, True, False], profile
+        assert assumptions['Referral Fee &'].tolist() == [True, False, False, False, False, False], profile
+        assert state.matched_rows == 5, profile
+
+
+def test_generated_data_with_cost_file():
+    """The benchmark generator's export and cost file run end to end on both profiles."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+    from generate_data import generate_cost_file, generate_export
+
+    export = generate_export(600)
+    cost = generate_cost_file(export)
+    for profile in ('desktop', 'web'):
+        index = CostIndex.from_frame(cost, 'UPC', 'COST', 'MSRP')
+        source = CostSource('cost.xlsx', list(cost.columns), index=index)
+        with tempfile.TemporaryDirectory() as tmp:
+            state = Pipeline(PipelineOptions(profile=profile)).run(export, os.path.join(tmp, 'out.xlsx'), source)
+            assert os.path.exists(state.output_path), profile
+        assert state.rows_out >= state.rows_in - state.rows_dropped, profile
+
+
+def variation_frame(rng, parents, rows_per_parent):
+    """Parents of rows_per_parent rows each, several Colors per Parent, ratings with ties"""
+    n = parents * rows_per_parent
+    return pd.DataFrame({
+        'ASIN': [f'B{row:05d}' for row in range(n)],
+        'Parent': np.repeat([f'P{parent:03d}' for parent in range(parents)], rows_per_parent),
+        'Color': rng.choice(['Black', 'Navy', 'Red', 'White'], n),
+        'Size': rng.choice(['S', 'M', 'L'], n),
+        'Rating Count': rng.integers(0, 50, n),
+        'Rating - Child': rng.choice([0, 3, 5, 8, 13, 13], n),
+    })
+
+
+def best_color_cells(path):
+    """Per data row: (Parent, Color, Rating - Child, Color cell is marked best)"""
+    ws = load_workbook(path).active
+    header = [cell.value for cell in ws[1]]
+    parent, color, rating = header.index('Parent'), header.index('Color'), header.index('Rating - Child')
+    rows = []
+    for row in ws.iter_rows(min_row=2):
+        cell = row[color]
+        comment = cell.comment.text if cell.comment is not None else None
+        marked = cell.fill.fill_type is not None and comment == BEST_COLOR_COMMENT
+        rows.append((row[parent].value, cell.value, row[rating].value, marked))
+    return rows
+
+
+def test_best_colors_across_chunks():
+    """Parents spanning a chunk boundary get the same best Colors as in one chunk."""
+    rng = np.random.default_rng(4)
+    # 37-row Parents straddle the 500 and 1000 row chunk boundaries
+    main = variation_frame(rng, 40, 37)
+    with tempfile.TemporaryDirectory() as tmp:
+        chunked = Pipeline(PipelineOptions(chunk_size=500)).run(main, os.path.join(tmp, 'chunked.xlsx'))
+        whole = Pipeline(PipelineOptions(chunk_size=5000)).run(main, os.path.join(tmp, 'whole.xlsx'))
+        chunked_rows = best_color_cells(chunked.output_path)
+        whole_rows = best_color_cells(whole.output_path)
+
+    assert chunked_rows == whole_rows
+    parents = [parent for parent, _, _, _ in chunked_rows]
+    assert parents[499] == parents[500] and parents[999] == parents[1000], "no Parent crosses a chunk boundary"
+
+    # Best means: some row of that Parent and Color has the Parent's top rating
+    frame = pd.DataFrame(chunked_rows, columns=['Parent', 'Color', 'Rating', 'Marked'])
+    top = frame.groupby('Parent')['Rating'].transform('max')
+    expected = (frame['Rating'] == top).groupby([frame['Parent'], frame['Color']]).transform('any')
+    assert frame['Marked'].tolist() == expected.tolist()
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Desktop cleans after merge", test_desktop_cleans_after_merge),
+        ("Web cleans before merge", test_web_cleans_before_merge),
+        ("Best colors across chunks", test_best_colors_across_chunks),
+        ("Duplicate cost codes", test_duplicate_cost_codes),
+        ("Generated data with a cost file", test_generated_data_with_cost_file),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,117 @@
+"""
+Check that the streaming reader returns what pd.read_excel returns for the
+same workbook, whatever the batch size.
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from core.codes import code_keys
+from core.reader import iter_excel_batches, read_excel_streaming
+
+CODE_COLUMNS = ['UPC', 'EAN']
+
+HEADER = ['ASIN', 'UPC', 'EAN', 'Buy Box', 'Title', None, 'Title', 'Flag', 'Rank', 'Date', 'Notes']
+ROWS = [
+    ['B001', 12345678905, '0012345678905', 19.99, 'One', None, 'x', True, 3, datetime.datetime(2024, 1, 2), 'n/a'],
+    ['B002', '012345678905', 4006381333931, '$5.00', 'Two', None, 'y', False, None, None, None],
+    [],  # blank row between data rows is kept
+    ['B003', '98765432', None, 7, 'NA', None, None, None, 12, datetime.datetime(2024, 3, 4), 'text'],
+    ['B004', 555000111222, '', 12, 'Four', None, 'z', True, 4, None, '', 'past the header'],
+    ['B005', '4006381333931', 98765432, None, 'Five', None, 'w', None, 5, None, 'NULL'],
+    [], [],  # trailing blank rows are dropped
+]
+
+
+def write_export(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for row in ROWS:
+        ws.append(row)
+    wb.save(path)
+
+
+def same_cell(expected, actual):
+    """Equal values, NaN matching NaN/NaT; 7 and 7.0 or True and 1.0 count as equal"""
+    if pd.isna(expected) and pd.isna(actual):
+        return True
+    return expected == actual
+
+
+def test_matches_read_excel():
+    """Columns, rows and values match pd.read_excel; code columns match by code key."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.xlsx')
+        write_export(path)
+        expected = pd.read_excel(path, engine='openpyxl')
+        for batch_size in (1, 2, 3, 1000):
+            actual = read_excel_streaming(path, batch_size=batch_size)
+            assert list(actual.columns) == list(expected.columns), batch_size
+            assert len(actual) == len(expected) == 6, batch_size
+            for col in expected.columns:
+                if col in CODE_COLUMNS:
+                    continue
+                for row, (want, got) in enumerate(zip(expected[col], actual[col])):
+                    assert same_cell(want, got), f"batch {batch_size} {col} row {row}: {want!r} != {got!r}"
+            for col in CODE_COLUMNS:
+                for want, got in zip(code_keys(expected[col]), code_keys(actual[col])):
+                    assert np.array_equal(want, got), f"batch {batch_size} {col}: {want} != {got}"
+
+
+def test_code_text_kept():
+    """Numeric text in mixed code columns stays text, so leading zeros survive."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.xlsx')
+        write_export(path)
+        df = read_excel_streaming(path, batch_size=2)
+    assert df['UPC'].tolist()[:2] == [12345678905, '012345678905']
+    assert df['EAN'].iloc[0] == '0012345678905' and df['EAN'].iloc[1] == 4006381333931
+
+
+def test_batch_size_does_not_change_types():
+    """Columns typed differently by different batches are typed as one read."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.xlsx')
+        write_export(path)
+        whole = read_excel_streaming(path, batch_size=1000)
+        batches = list(iter_excel_batches(path, batch_size=1))
+        for batch_size in (1, 2, 3):
+            df = read_excel_streaming(path, batch_size=batch_size)
+            assert df.dtypes.to_dict() == whole.dtypes.to_dict(), batch_size
+            assert df.equals(whole), batch_size
+
+    # A bool column next to blank-only batches stays bool values, not 1.0/0.0
+    assert {str(batch['Flag'].dtype) for batch in batches} == {'bool', 'float64'}
+    assert [type(value) for value in whole['Flag'].dropna()] == [bool] * 3
+    assert whole['Rank'].dtype == 'float64'
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Matches pd.read_excel", test_matches_read_excel),
+        ("Code text kept", test_code_text_kept),
+        ("Batch size does not change types", test_batch_size_does_not_change_types),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
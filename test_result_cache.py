@@ -0,0 +1,147 @@
+"""
+Check the result cache: what its keys depend on, least recently used
+eviction within its size budget, and the stats the web API reports.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+import index  # noqa: E402  (api/index.py)
+from core.pipeline import PipelineOptions  # noqa: E402
+from core.result_cache import ResultCache, result_key  # noqa: E402
+
+MAIN = 'a' * 64
+COST = 'b' * 64
+
+
+def output_file(directory, name, size):
+    """A fake output of size bytes"""
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as handle:
+        handle.write(b'x' * size)
+    return path
+
+
+def age(cache, key, seconds_ago):
+    """Set a cached entry's last use to seconds_ago (entries are ordered by mtime)"""
+    path = cache.entry_path(key, '.xlsx')
+    when = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (when, when))
+
+
+def test_key_follows_digests():
+    """Keys differ by main and cost file digest, and are stable for the same inputs."""
+    options = PipelineOptions(profile='web')
+    key = result_key(MAIN, COST, options)
+    assert key == result_key(MAIN, COST, PipelineOptions(profile='web'))
+    assert len({key, result_key('c' * 64, COST, options), result_key(MAIN, 'c' * 64, options),
+                result_key(MAIN, None, options)}) == 4
+
+
+def test_key_follows_options():
+    """Options that change the output change the key; cache and timing switches do not."""
+    base = dict(profile='web', shipping_cost=1.0, chunk_size=1000)
+    key = result_key(MAIN, COST, PipelineOptions(**base))
+    for changed in ({'shipping_cost': 1.5}, {'misc_cost': 0.25}, {'fill_mode': 'rules'}, {'layout': 'sheet'},
+                    {'profile': 'desktop'}, {'compact': True}):
+        assert result_key(MAIN, COST, PipelineOptions(**dict(base, **changed))) != key, changed
+    for neutral in ({'cache_dir': '/elsewhere'}, {'parse_cache': True}, {'instrument': True},
+                    {'trace_memory': False}):
+        assert result_key(MAIN, COST, PipelineOptions(**dict(base, **neutral))) == key, neutral
+
+
+def test_miss_when_options_differ():
+    """A stored result is found for its own settings only."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(tmp, max_bytes=10 ** 6)
+        stored = cache.store(result_key(MAIN, COST, PipelineOptions(profile='web')),
+                             output_file(tmp, 'out.xlsx', 100))
+        assert cache.lookup(result_key(MAIN, COST, PipelineOptions(profile='web'))) == stored
+        assert cache.lookup(result_key(MAIN, COST, PipelineOptions(profile='web', shipping_cost=2.0))) is None
+        assert cache.lookup(result_key(MAIN, None, PipelineOptions(profile='web'))) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_eviction_order():
+    """Past the budget the least recently used entry goes first; a lookup counts as a use."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(tmp, max_bytes=250)
+        for number, key in enumerate(['one', 'two'], 1):
+            cache.store(key, output_file(tmp, f'{key}.xlsx', 100))
+            age(cache, key, 100 - number)
+        # 'one' is older, but used again just now
+        assert cache.lookup('one') is not None
+        cache.store('three', output_file(tmp, 'three.xlsx', 100))
+        assert sorted(os.listdir(cache.directory)) == ['one.xlsx', 'three.xlsx']
+
+        cache.store('four', output_file(tmp, 'four.xlsx', 100))
+        assert sorted(os.listdir(cache.directory)) == ['four.xlsx', 'three.xlsx']
+
+
+def test_size_budget():
+    """Entries are evicted until the rest fit max_bytes; the new entry is always kept."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(tmp, max_bytes=1000)
+        for number in range(8):
+            cache.store(f'key{number}', output_file(tmp, f'out{number}.xlsx', 300))
+            age(cache, f'key{number}', 100 - number)
+            assert cache.stats()['bytes'] <= 1000
+        assert sorted(os.listdir(cache.directory)) == ['key5.xlsx', 'key6.xlsx', 'key7.xlsx']
+
+        # Larger than the whole budget: kept, everything else evicted
+        big = cache.store('big', output_file(tmp, 'big.zip', 1500))
+        assert os.listdir(cache.directory) == ['big.zip'] and cache.lookup('big') == big
+        # Not an output the pipeline writes
+        assert cache.store('log', output_file(tmp, 'run.log', 10)) is None
+
+
+def test_stats_endpoint():
+    """/api/result-cache reports the app's cache counters and size."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = index.result_cache = ResultCache(tmp, max_bytes=5000)
+        try:
+            client = index.app.test_client()
+            empty = client.get('/api/result-cache').get_json()
+            assert empty == {'hits': 0, 'misses': 0, 'hit_rate': None, 'entries': 0, 'bytes': 0, 'max_bytes': 5000}
+
+            cache.store('one', output_file(tmp, 'one.xlsx', 120))
+            cache.store('two', output_file(tmp, 'two.zip', 80))
+            cache.lookup('one')
+            cache.lookup('one')
+            cache.lookup('three')
+            stats = client.get('/api/result-cache').get_json()
+            assert stats == cache.stats()
+            assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (2, 1, 2, 200), stats
+            assert abs(stats['hit_rate'] - 2 / 3) < 1e-9
+        finally:
+            index.result_cache = None
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Key follows digests", test_key_follows_digests),
+        ("Key follows options", test_key_follows_options),
+        ("Miss when options differ", test_miss_when_options_differ),
+        ("LRU eviction order", test_lru_eviction_order),
+        ("Size budget", test_size_budget),
+        ("Stats endpoint", test_stats_endpoint),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
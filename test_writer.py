@@ -0,0 +1,266 @@
+"""
+Check how the writer splits large frames into shards and what each shard
+holds, and that conditional formatting colors cells like per-cell fills.
+"""
+
+import math
+import os
+import re
+import sys
+import tempfile
+import zipfile
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from core.writer import FORMAT_PROFILES, plan_shards, write_formatted_excel
+
+
+def parent_frame(sizes):
+    """One row per ASIN, with Parent groups of the given sizes in order"""
+    parents = [f'P{number:02d}' for number, size in enumerate(sizes) for _ in range(size)]
+    return pd.DataFrame({
+        'ASIN': [f'B{row:04d}' for row in range(len(parents))],
+        'Parent': parents,
+    })
+
+
+def sheet_rows(ws):
+    """(ASIN, Parent) for every data row of a sheet"""
+    return [(asin, parent) for asin, parent in ws.iter_rows(min_row=2, values_only=True)]
+
+
+def test_plan_shards_boundaries():
+    """Shards are cut only where the Parent changes and never exceed max_rows."""
+    # Fits exactly: a single shard
+    assert plan_shards(parent_frame([4, 6]), max_rows=10) == [(0, 10)]
+    # A Parent starting exactly at max_rows is the first row of the next shard
+    assert plan_shards(parent_frame([4, 6, 3]), max_rows=10) == [(0, 10), (10, 13)]
+    # The cut moves back to the start of the Parent that would cross max_rows
+    assert plan_shards(parent_frame([4, 4, 4, 4, 1]), max_rows=10) == [(0, 8), (8, 17)]
+    assert plan_shards(parent_frame([3] * 7), max_rows=5) == [(0, 3), (3, 6), (6, 9), (9, 12), (12, 15), (15, 18),
+                                                              (18, 21)]
+    # Parent codes passed in are used instead of the column
+    df = parent_frame([5, 5])
+    assert plan_shards(df, max_rows=5, parents=[0, 0, 0, 1, 1, 1, 1, 2, 2, 2]) == [(0, 3), (3, 7), (7, 10)]
+
+
+def test_plan_shards_oversized_parent():
+    """A Parent with more rows than max_rows cannot be placed and names its first row."""
+    # Spreadsheet rows: the header is row 1, so the 4th data row is row 5
+    for sizes, first_row in (([12], 2), ([3, 12, 2], 5)):
+        try:
+            plan_shards(parent_frame(sizes), max_rows=10)
+        except ValueError as e:
+            assert f"starting at row {first_row} " in str(e), str(e)
+        else:
+            assert False, f"no error for Parent sizes {sizes}"
+
+
+def test_workbook_shards():
+    """shard_mode='workbooks' zips one workbook per shard and removes the parts."""
+    df = parent_frame([4, 4, 4, 4, 1])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_formatted_excel(df, os.path.join(tmp, 'out.xlsx'), max_rows=10, shard_mode='workbooks',
+                                     max_workers=2)
+        assert path == os.path.join(tmp, 'out.zip')
+        assert os.listdir(tmp) == ['out.zip']
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            assert names == ['out_part01.xlsx', 'out_part02.xlsx']
+            archive.extractall(tmp)
+        parts = [sheet_rows(load_workbook(os.path.join(tmp, name)).active) for name in names]
+
+    assert [len(rows) for rows in parts] == [8, 9]
+    assert parts[0] + parts[1] == list(zip(df['ASIN'], df['Parent']))
+
+
+def test_sheet_shards():
+    """shard_mode='sheets' writes the shards as Sheet1, Sheet2, ... of one workbook."""
+    df = parent_frame([3] * 7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_formatted_excel(df, os.path.join(tmp, 'out.xlsx'), max_rows=5, shard_mode='sheets')
+        assert path == os.path.join(tmp, 'out.xlsx')
+        wb = load_workbook(path)
+        assert wb.sheetnames == [f'Sheet{number}' for number in range(1, 8)]
+        sheets = [sheet_rows(wb[name]) for name in wb.sheetnames]
+
+    assert [len(rows) for rows in sheets] == [3] * 7
+    assert sum(sheets, []) == list(zip(df['ASIN'], df['Parent']))
+    assert all(len({parent for _, parent in rows}) == 1 for rows in sheets)
+
+
+class Error:
+    """An Excel error value (#VALUE! and friends): comparisons and functions pass it on"""
+
+    def __lt__(self, other):
+        return self
+    __le__ = __gt__ = __ge__ = __eq__ = __ne__ = __lt__
+    __hash__ = object.__hash__
+
+
+ERROR = Error()
+
+
+class Cell:
+    """A cell value compared the way Excel compares: numbers < text < booleans, blank as 0 or ''"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def key(self, other):
+        other = other.value if isinstance(other, Cell) else other
+        value = self.value
+        if value is None:
+            value = '' if isinstance(other, str) else 0
+        if isinstance(value, bool):
+            return (2, value)
+        if isinstance(value, (int, float)):
+            return (0, value)
+        return (1, str(value).lower())
+
+    def compare(self, other, op):
+        if isinstance(other, Error):
+            return ERROR
+        other_key = other.key(self) if isinstance(other, Cell) else Cell(other).key(self)
+        return op(self.key(other), other_key)
+
+    def __lt__(self, other):
+        return self.compare(other, lambda a, b: a < b)
+
+    def __le__(self, other):
+        return self.compare(other, lambda a, b: a <= b)
+
+    def __gt__(self, other):
+        return self.compare(other, lambda a, b: a > b)
+
+    def __ge__(self, other):
+        return self.compare(other, lambda a, b: a >= b)
+
+    def __eq__(self, other):
+        return self.compare(other, lambda a, b: a == b)
+
+    def __ne__(self, other):
+        return self.compare(other, lambda a, b: a != b)
+
+    __hash__ = object.__hash__
+
+
+def text_of(cell):
+    value = cell.value if isinstance(cell, Cell) else cell
+    return '' if value is None else str(value)
+
+
+def excel_logical(args, combine):
+    """AND/OR: Excel evaluates every argument, and any error makes the result an error"""
+    return ERROR if any(isinstance(arg, Error) for arg in args) else combine(bool(arg) for arg in args)
+
+
+EXCEL_FUNCTIONS = {
+    'AND': lambda *args: excel_logical(args, all),
+    'OR': lambda *args: excel_logical(args, any),
+    'NOT': lambda arg: ERROR if isinstance(arg, Error) else not arg,
+    'ISNUMBER': lambda cell: isinstance(cell.value, (int, float)) and not isinstance(cell.value, bool),
+    'ISBLANK': lambda cell: cell.value is None,
+    'ISERROR': lambda value: isinstance(value, Error),
+    'TRUNC': lambda cell: Cell(math.trunc(cell.value)) if EXCEL_FUNCTIONS['ISNUMBER'](cell) else ERROR,
+    'TRIM': lambda cell: Cell(' '.join(text_of(cell).split())),
+    'LEN': lambda cell: Cell(len(text_of(cell))),
+    'EXACT': lambda cell, text: text_of(cell) == text,
+    'SEARCH': lambda text, cell: text_of(cell).lower().find(text.lower()) + 1 or ERROR,
+}
+
+
+def formula_matches(formula, anchor, value):
+    """Evaluate a conditional formatting formula for a cell holding value"""
+    expression = re.sub(rf'\b{anchor}\b', 'cell', formula)
+    expression = re.sub(r'(?<![<>])=', '==', expression).replace('<>', '!=')
+    return eval(expression, {'__builtins__': {}}, dict(EXCEL_FUNCTIONS, cell=Cell(value))) is True
+
+
+def rule_colors(ws):
+    """Column letter -> (rows covered, [(formula, anchor, color)] in priority order)"""
+    rules = {}
+    for cf_range in ws.conditional_formatting:
+        (letter, first, _, last), = [re.fullmatch(r'([A-Z]+)(\d+):([A-Z]+)(\d+)', str(cell_range)).groups()
+                                     for cell_range in cf_range.sqref.ranges]
+        for rule in sorted(cf_range.rules, key=lambda rule: rule.priority):
+            assert rule.stopIfTrue
+            color = rule.dxf.fill.fgColor.rgb[-6:]
+            _, ordered = rules.setdefault(letter, ((int(first), int(last)), []))
+            ordered.append((rule.formula[0], f'{letter}{first}', color))
+    return rules
+
+
+def fill_color(cell):
+    return cell.fill.fgColor.rgb[-6:] if cell.fill.fill_type is not None else None
+
+
+RULES_FRAME = pd.DataFrame({
+    'ASIN': [f'B{row:03d}' for row in range(10)],
+    'Sales Rank': [1, 150000, 150000.7, 150001, 500000, 500001, 0, None, -3, 'n/a'],
+    'Amazon Availability': ['No Amazon offer exists', 'Amazon offer is in stock and shippable', 'Back-ordered', ' ',
+                            None, 0, 'no amazon offer exists (2)', 'x', '', 5],
+    'Sales Badge': ['Best Seller', None, 0, 1, '', 'x', None, 0.0, 'y', None],
+    'MSRP Difference': [-0.06, -0.05, 0, 3.5, 'No Buybox', None, '', -10, 0.01, 'No Buybox'],
+    'Pack Fee': [7, 7.0, 6.99, None, 3, 7, 0, 7.01, 8, 7],
+    'COST': [5.0, 0, None, 4.5, 0.0, 1, 2, None, 3, 4],
+    'MSRP': [10.0, None, 12, None, 1, 2, 3, 4, 5, None],
+    'Profit Margin (Buybox)': [11.99, 12, 20, 20.01, 'No Buybox', None, -5, 0, 35, ''],
+    'Profit Margin (MSRP)': [None, 5, 12.5, 25, '', 19.99, 20.0, 100, -1, 11],
+})
+
+
+def test_rules_match_cell_fills():
+    """fill_mode='rules' with layout='sheet' colors each cell the color fill_mode='cells' gives it."""
+    for profile in ('desktop', 'web'):
+        df = RULES_FRAME.rename(columns={'Pack Fee': FORMAT_PROFILES[profile]['pack_fee_column']})
+        with tempfile.TemporaryDirectory() as tmp:
+            cells_path = write_formatted_excel(df, os.path.join(tmp, 'cells.xlsx'), profile=profile)
+            rules_path = write_formatted_excel(df, os.path.join(tmp, 'rules.xlsx'), profile=profile,
+                                               fill_mode='rules', layout='sheet')
+            cells_ws = load_workbook(cells_path).active
+            rules_ws = load_workbook(rules_path).active
+
+        rules = rule_colors(rules_ws)
+        last_row = len(df) + 1
+        for column, name in enumerate(df.columns, 1):
+            covered, ordered = rules.get(get_column_letter(column), ((2, last_row), []))
+            assert covered == (2, last_row), f"{profile} {name} rules cover rows {covered}"
+            for row in range(2, last_row + 1):
+                value = rules_ws.cell(row=row, column=column).value
+                assert value == cells_ws.cell(row=row, column=column).value
+                assert fill_color(rules_ws.cell(row=row, column=column)) is None, f"{name} row {row} has a fill"
+                color = next((color for formula, anchor, color in ordered
+                              if formula_matches(formula, anchor, value)), None)
+                expected = fill_color(cells_ws.cell(row=row, column=column))
+                assert color == expected, \
+                    f"{profile} {name} row {row} ({value!r}): rules give {color}, cells give {expected}"
+        assert len(rules) == (9 if profile == 'desktop' else 7), f"{profile}: rules on {sorted(rules)}"
+
+
+def main():
+    """Run all tests."""
+    tests = [
+        ("Shard boundaries", test_plan_shards_boundaries),
+        ("Parent larger than a shard", test_plan_shards_oversized_parent),
+        ("Workbook shards", test_workbook_shards),
+        ("Sheet shards", test_sheet_shards),
+        ("Rules match cell fills", test_rules_match_cell_fills),
+    ]
+
+    all_passed = True
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_name}")
+        except AssertionError as e:
+            print(f"✗ {test_name}: {e}")
+            all_passed = False
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)